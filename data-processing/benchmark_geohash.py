@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Geohash benchmark
+
+Compares the former three scalar encodes per event, one scalar encode with
+prefix levels and the NumPy batch encoder on random locations around DC.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import random
+import time
+import geohash
+from enrichment import GEOHASH_LEVELS, geohashes, geohashes_batch
+
+
+def per_level(lats, lons):
+    return [{f"geo{n}": geohash.encode(float(lat), float(lon), n) for n in GEOHASH_LEVELS}
+            for lat, lon in zip(lats, lons)]
+
+
+def prefix(lats, lons):
+    return [geohashes(lat, lon) for lat, lon in zip(lats, lons)]
+
+
+def batch(lats, lons, batch_size):
+    results = {}
+    for i in range(0, len(lats), batch_size):
+        for level, codes in geohashes_batch(lats[i:i + batch_size], lons[i:i + batch_size]).items():
+            results.setdefault(level, []).extend(codes)
+    return results
+
+
+def timed(label, n, fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<22} {elapsed:8.3f} s {n / elapsed:>14,.0f} events/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geohash benchmark")
+    parser.add_argument('-n', dest="events", type=int, default=500000,
+                        help="Number of locations")
+    parser.add_argument('-c', dest="batch_size", type=int, default=500,
+                        help="Batch size of the vectorized encoder")
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    lats = [38.9 + rnd.uniform(-0.1, 0.1) for _ in range(args.events)]
+    lons = [-77.03 + rnd.uniform(-0.1, 0.1) for _ in range(args.events)]
+    print(f"levels {GEOHASH_LEVELS}")
+    timed("scalar, one per level", args.events, per_level, lats, lons)
+    timed("scalar, prefixes", args.events, prefix, lats, lons)
+    timed(f"batch of {args.batch_size}", args.events, batch, lats, lons, args.batch_size)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""HyperLogLog benchmark
+
+Checks the relative error of the sketches against exact distinct counts for
+growing cardinalities, the error of sketches merged from geohash children,
+and reports add/merge speed and serialized size. Exits with status 1 when an
+error exceeds the bound of 3 standard errors.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import math
+import random
+import sys
+import time
+from hyperloglog import DEFAULT_PRECISION, HyperLogLog, merge, merge_by_prefix
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def check(label, estimate, exact, bound):
+    error = abs(estimate - exact) / exact
+    status = "ok" if error <= bound else "FAIL"
+    print(f"{label:<28} exact {exact:>9,} estimate {estimate:>11,.0f} error {error:6.2%} {status}")
+    return error <= bound
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HyperLogLog benchmark")
+    parser.add_argument('-p', dest="precision", type=int, default=DEFAULT_PRECISION,
+                        help="Sketch precision")
+    parser.add_argument('-n', dest="max_cardinality", type=int, default=1000000,
+                        help="Largest number of distinct vehicle ids")
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    bound = 3 * 1.04 / math.sqrt(1 << args.precision)
+    print(f"precision {args.precision}, {1 << args.precision} registers, error bound {bound:.2%}")
+    passed = True
+
+    n = 10
+    while n <= args.max_cardinality:
+        sketch = HyperLogLog(args.precision)
+        t0 = time.perf_counter()
+        for i in range(n):
+            sketch.add(f"vehicle-{i}")
+        elapsed = time.perf_counter() - t0
+        passed &= check(f"{n:,} ids ({n / elapsed:,.0f} adds/s)", sketch.count(), n, bound)
+        n *= 10
+
+    # vehicles moving between level 7 cells within one level 6 parent, seen in several windows
+    parent = "dqcjr1"
+    vehicles = [f"vehicle-{i}" for i in range(20000)]
+    children = {}
+    seen = set()
+    for window in range(24):
+        for vehicle in rnd.sample(vehicles, 5000):
+            children.setdefault((window, parent + rnd.choice(BASE32)), HyperLogLog(args.precision)).add(vehicle)
+            seen.add(vehicle)
+    t0 = time.perf_counter()
+    day = merge_by_prefix({cell: merge(s for (w, c), s in children.items() if c == cell)
+                           for cell in {c for _, c in children}}, 6)
+    elapsed = time.perf_counter() - t0
+    passed &= check(f"day of level 7 -> 6 ({len(children)} sketches merged in {elapsed:.2f} s)",
+                    day[parent].count(), len(seen), bound)
+
+    size = sum(len(s.to_bytes()) for s in children.values()) / len(children)
+    print(f"serialized size {size:,.0f} bytes per sketch (raw registers {1 << args.precision:,} bytes)")
+    sys.exit(0 if passed else 1)
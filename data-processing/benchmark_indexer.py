@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Bulk indexer benchmark
+
+Runs the bulk indexer of es_bulk_indexer.py against a local stand-in of the
+Elasticsearch _bulk API. A request takes a fixed overhead plus a cost per
+document, and both grow with the number of requests in flight. Requests
+beyond `capacity` in flight get a 429. Items beyond a write queue of `queue`
+documents in flight get a per-item 429, like the write thread pool of a
+node. The stand-in keeps the documents by id. The benchmark checks that
+every event is indexed exactly once, duplicates included, and exits
+non-zero otherwise. For each sizing mode (adaptive, fixed small, fixed
+large) it prints docs/s and the request and rejection counts.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import aiohttp
+from aiohttp import web
+from benchmark_serde import synthetic_events
+from es_bulk_indexer import BatchSizer, BulkIndexer, doc_id
+
+
+class BulkStub(object):
+    """
+    In-memory stand-in of the _bulk endpoint
+    Args:
+        capacity (int): requests in flight above which a whole request is rejected
+        queue (int): documents in flight above which items are rejected
+        overhead (float): seconds per request
+        per_doc (float): seconds per document
+    """
+
+    def __init__(self, capacity=8, queue=20000, overhead=0.005, per_doc=0.00005):
+        self.capacity = capacity
+        self.queue = queue
+        self.overhead = overhead
+        self.per_doc = per_doc
+        self.in_flight = 0
+        self.queued = 0
+        self.docs = {}
+
+    async def bulk(self, request):
+        if self.in_flight >= self.capacity:
+            return web.json_response({"error": {"type": "es_rejected_execution_exception"}}, status=429)
+        lines = (await request.read()).splitlines()
+        accepted = max(0, min(len(lines) // 2, self.queue - self.queued))
+        self.in_flight += 1
+        self.queued += accepted
+        try:
+            # the cost of a request grows with its size and with the load of the stub
+            await asyncio.sleep((self.overhead + self.per_doc * accepted) * self.in_flight)
+        finally:
+            self.in_flight -= 1
+            self.queued -= accepted
+        items = []
+        for i, (action, source) in enumerate(zip(lines[::2], lines[1::2])):
+            if i >= accepted:
+                items.append({"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+                continue
+            meta = json.loads(action)["index"]
+            status = 200 if meta["_id"] in self.docs else 201
+            self.docs[meta["_id"]] = json.loads(source)
+            items.append({"index": {"status": status}})
+        return web.json_response({"errors": accepted < len(items), "items": items})
+
+
+async def run(events, stub, sizer, concurrency, batch):
+    app = web.Application(client_max_size=1 << 28)
+    app.router.add_post('/_bulk', stub.bulk)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+            indexer = BulkIndexer(session, f"http://localhost:{port}", "benchmark", concurrency, sizer,
+                                  backoff=0.01, max_backoff=0.5)
+            t0 = time.perf_counter()
+            indexed = 0
+            for i in range(0, len(events), batch):
+                done, failed = await indexer.index(list(enumerate(events[i:i + batch])))
+                indexed += len(done)
+            return indexed, time.perf_counter() - t0, indexer.stats
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk indexer benchmark")
+    parser.add_argument('-n', dest="events", type=int, default=100000,
+                        help="Number of events")
+    parser.add_argument('-c', dest="concurrency", type=int, default=4,
+                        help="Number of bulk requests in flight")
+    parser.add_argument('--capacity', dest="capacity", type=int, default=8,
+                        help="Requests in flight the stand-in accepts before answering 429")
+    parser.add_argument('--queue', dest="queue", type=int, default=20000,
+                        help="Documents in flight the stand-in accepts before rejecting items with 429")
+    parser.add_argument('--batch', dest="batch", type=int, default=5000,
+                        help="Events per consumed batch")
+    args = parser.parse_args()
+
+    events = synthetic_events(args.events)
+    # replayed messages carry the same id and must not add documents
+    events += events[:args.events // 10]
+    expected = set(doc_id(e) for e in events)
+
+    modes = {
+        "adaptive": lambda: BatchSizer(100, 100, 10000),
+        "fixed-100": lambda: BatchSizer(100, 100, 100),
+        "fixed-10000": lambda: BatchSizer(10000, 10000, 10000),
+    }
+    ok = True
+    print(f"{'mode':<12} {'docs/s':>10} {'requests':>9} {'rejected':>9} {'retried':>8} {'size':>6} {'docs':>8}")
+    for name, make_sizer in modes.items():
+        stub = BulkStub(args.capacity, args.queue)
+        sizer = make_sizer()
+        indexed, elapsed, stats = asyncio.run(run(events, stub, sizer, args.concurrency, args.batch))
+        exact = indexed == len(events) and set(stub.docs) == expected
+        ok = ok and exact
+        print(f"{name:<12} {indexed / elapsed:>10,.0f} {stats['requests']:>9,} {stats['rejected']:>9,} "
+              f"{stats['retried']:>8,} {sizer.size:>6} {len(stub.docs):>8,}{'' if exact else '  MISMATCH'}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Line parser benchmark
+
+Compares the lines/sec of line_parser.LineParser with the former
+per-line parsing of main_producer.kafka_producer on synthetic collector lines.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import codecs
+import io
+import random
+import time
+from dataclasses import asdict, dataclass
+from line_parser import LineParser
+
+
+@dataclass
+class Event(object):
+    id: str = ''
+    is_disabled: int = 0
+    is_reserved: int = 0
+    last_updated: int = 0
+    lat: float = 0.00
+    lon: float = 0.00
+    operator: str = ''
+    type: str = ''
+    geo7: str = ''
+    geo8: str = ''
+    geo9: str = ''
+    timestamp: str = ''
+
+
+def strtobool(val):
+    """
+    Same behaviour as the removed distutils.util.strtobool
+    """
+    val = val.lower()
+    if val in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    if val in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError(f"invalid truth value {val}")
+
+
+def legacy_parse(data):
+    """
+    The former main_producer parsing loop, without the produce call
+    """
+    keys = ['bike_id', 'is_disabled', 'is_reserved', 'last_updated', 'lat', 'lon', 'operator', 'vehicle_type']
+    records = []
+    for ln in codecs.getreader('utf-8')(io.BytesIO(data)):
+        d = dict((x.strip(), y.strip())
+                 for x, y in (element.split(':')
+                              for element in ln.split(', ')))
+        if set(keys).issubset((d.keys())):
+            records.append(asdict(Event(d['bike_id'], strtobool(d['is_disabled']), strtobool(d['is_reserved']),
+                                        int(d['last_updated']), float(d['lat']), float(d['lon']),
+                                        d['operator'], d['vehicle_type'])))
+    return records
+
+
+def batch_parse(data, chunk_size):
+    parser = LineParser()
+    records = []
+    for offset in range(0, len(data), chunk_size):
+        records.extend(parser.feed(data[offset:offset + chunk_size]))
+    records.extend(parser.finish())
+    return records
+
+
+def synthetic_lines(n, seed=7):
+    """
+    Generates n collector lines shaped like the Bird feed
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(n):
+        d = {"battery_level": rnd.randint(0, 100), "bike_id": f"{rnd.getrandbits(64):016x}",
+             "is_disabled": rnd.random() < 0.05, "is_reserved": rnd.random() < 0.1,
+             "last_updated": 1595300000 + i // 500, "lat": round(38.9 + rnd.uniform(-0.1, 0.1), 6),
+             "lon": round(-77.03 + rnd.uniform(-0.1, 0.1), 6), "operator": "bird", "vehicle_type": "scooter"}
+        lines.append(', '.join("{}:{}".format(key, val) for (key, val) in sorted(d.items())))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def timed(label, n, fn, *args):
+    t0 = time.perf_counter()
+    records = fn(*args)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<8} {len(records):>9} records {elapsed:8.3f} s {n / elapsed:>12,.0f} lines/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Line parser benchmark")
+    parser.add_argument('-n', dest="lines", type=int, default=500000,
+                        help="Number of synthetic lines")
+    parser.add_argument('-c', dest="chunk_size", type=int, default=1 << 20,
+                        help="Chunk size of the batch parser (bytes)")
+    args = parser.parse_args()
+
+    data = synthetic_lines(args.lines)
+    legacy = timed("legacy", args.lines, legacy_parse, data)
+    batch = timed("batch", args.lines, batch_parse, data, args.chunk_size)
+    print(f"speed-up x{legacy / batch:.1f}")
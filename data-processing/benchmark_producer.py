@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Producer profile benchmark
+
+Produces synthetic location events with every producer profile against a
+broker and reports throughput, p99 produce-to-ack latency and bytes on the wire.
+Events go through main_producer.produce, so they are keyed by vehicle,
+partitioned and Avro encoded in the Confluent wire format as in production;
+the schema ids come from the registry or the schema cache (schema_manager.py).
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import json
+import random
+import time
+from confluent_kafka import Producer
+from confluent_kafka.admin import AdminClient
+from main_producer import create_topic, produce, topic_exists
+from partitioning import Partitioner
+from producer_profiles import PROFILES, producer_config
+from schema_manager import DEFAULT_CACHE, SchemaManager
+
+
+def synthetic_events(n, seed=7):
+    """
+    Generates n location events as parsed by main_producer
+    """
+    rnd = random.Random(seed)
+    operators = ["bird", "helbiz", "lime", "lyft", "skip", "spin"]
+    events = []
+    for i in range(n):
+        events.append({
+            "id": f"{rnd.getrandbits(64):016x}", "is_disabled": int(rnd.random() < 0.05),
+            "is_reserved": int(rnd.random() < 0.1), "last_updated": 1595300000 + i // 500,
+            "lat": round(38.9 + rnd.uniform(-0.1, 0.1), 6), "lon": round(-77.03 + rnd.uniform(-0.1, 0.1), 6),
+            "operator": rnd.choice(operators), "type": "scooter",
+            "timestamp": None, "geo6": None, "geo7": None, "geo8": None, "geo9": None, "zone": None,
+        })
+    return events
+
+
+def payload_bytes(events, topic_name, schemas):
+    """
+    Returns the size of the encoded keys and values of the events
+    """
+    key_id, value_id = schemas.topic_ids(topic_name)
+    return sum(len(schemas.encode(key_id, {"operator": e['operator'], "id": e['id']}))
+               + len(schemas.encode(value_id, e)) for e in events)
+
+
+def run_profile(broker_url, topic_name, profile, events, schemas):
+    """
+    Produces the events with one profile, returns throughput, p99 latency and wire bytes
+    """
+    latencies = []
+    statistics = {}
+
+    def acked(err, msg):
+        if err is None:
+            latencies.append(msg.latency())
+
+    def stats_cb(stats_json):
+        statistics.update(json.loads(stats_json))
+
+    config = producer_config({"bootstrap.servers": broker_url, "client.id": f"benchmark.{profile}",
+                              "statistics.interval.ms": 500, "stats_cb": stats_cb}, profile)
+    producer = Producer(config)
+    partitioner = Partitioner(producer)
+    t0 = time.perf_counter()
+    for value in events:
+        # encoding is part of the produce path, so it is timed as well
+        produce(producer, topic_name, value, partitioner, schemas, acked)
+    producer.flush()
+    elapsed = time.perf_counter() - t0
+    # wait for a statistics report that includes the last requests
+    deadline = time.time() + 1.5
+    while time.time() < deadline:
+        producer.poll(0.1)
+
+    latencies.sort()
+    p99 = latencies[int(0.99 * (len(latencies) - 1))] * 1000.0 if latencies else float('nan')
+    return {
+        "profile": profile,
+        "records_per_sec": len(events) / elapsed,
+        "p99_ms": p99,
+        "wire_bytes": statistics.get("tx_bytes", 0),
+        "delivered": len(latencies),
+    }
+
+
+def main(args):
+    client = AdminClient({"bootstrap.servers": args.bootstrap_servers})
+    if not topic_exists(client, args.topic):
+        create_topic(client, args.topic)
+
+    schemas = SchemaManager(args.schema_registry, args.schema_cache)
+    events = synthetic_events(args.records)
+    payload = payload_bytes(events, args.topic, schemas)
+    print(f"{args.records} events, {payload / 2 ** 20:.1f} MB of Avro keys and values")
+    print(f"{'profile':<10} {'records/s':>12} {'p99 ms':>9} {'wire MB':>9} {'delivered':>10}")
+    for profile in args.profiles:
+        r = run_profile(args.bootstrap_servers, args.topic, profile, events, schemas)
+        print(f"{r['profile']:<10} {r['records_per_sec']:>12,.0f} {r['p99_ms']:>9.1f} "
+              f"{r['wire_bytes'] / 2 ** 20:>9.1f} {r['delivered']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Producer profile benchmark")
+    parser.add_argument('-b', dest="bootstrap_servers", required=True,
+                        help="Bootstrap broker(s) (host[:port])")
+    parser.add_argument('-s', dest="schema_registry",
+                        help="Schema Registry (http(s)://host[:port]), the schema cache only if omitted")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file")
+    parser.add_argument('-t', dest="topic", default="com.insight.project.benchmark",
+                        help="Benchmark topic")
+    parser.add_argument('-n', dest="records", type=int, default=200000,
+                        help="Number of events per profile")
+    parser.add_argument('-p', dest="profiles", nargs='*', default=list(PROFILES),
+                        choices=list(PROFILES), help="Profiles to run")
+
+    main(parser.parse_args())
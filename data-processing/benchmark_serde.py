@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Serde benchmark
+
+Encodes and decodes enriched location events with every codec of serde.py
+and reports events/s, bytes per event and the decoding speed into typed
+records.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import json
+import random
+import time
+from dataclasses import make_dataclass
+from enrichment import enrich_batch
+from serde import CODECS, DEFAULT_SCHEMA, get_codec
+
+
+def synthetic_events(n, seed=7):
+    """
+    Returns enriched events shaped like the converter and streaming topic values
+    """
+    rnd = random.Random(seed)
+    operators = ["bird", "lime", "lyft", "skip", "spin", "helbiz"]
+    events = [{"id": f"{rnd.getrandbits(64):016x}-{rnd.getrandbits(32):08x}", "is_disabled": rnd.randint(0, 1),
+               "is_reserved": rnd.randint(0, 1), "last_updated": 1600000000 + rnd.randint(0, 86400),
+               "lat": 38.9 + rnd.uniform(-0.1, 0.1), "lon": -77.03 + rnd.uniform(-0.1, 0.1),
+               "operator": rnd.choice(operators), "type": "scooter", "zone": None} for _ in range(n)]
+    return enrich_batch(events)
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serde benchmark")
+    parser.add_argument('-n', dest="events", type=int, default=200000,
+                        help="Number of events")
+    args = parser.parse_args()
+
+    events = synthetic_events(args.events)
+    with open(DEFAULT_SCHEMA) as file:
+        Event = make_dataclass("Event", [f['name'] for f in json.load(file)['fields']])
+
+    print(f"{'codec':<8} {'bytes/event':>12} {'encode/s':>12} {'decode/s':>12} {'typed/s':>12}")
+    for name in CODECS:
+        codec = get_codec(name)
+        payloads, encode = timed(lambda: [codec.encode(e) for e in events])
+        _, decode = timed(lambda: [codec.decode(p) for p in payloads])
+        _, typed = timed(lambda: [codec.decode(p, Event) for p in payloads])
+        size = sum(len(p) for p in payloads) / len(payloads)
+        n = len(events)
+        print(f"{name:<8} {size:>12.1f} {n / encode:>12,.0f} {n / decode:>12,.0f} {n / typed:>12,.0f}")
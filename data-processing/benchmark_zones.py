@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Zone lookup benchmark
+
+Tags random locations with their zone by exact point-in-polygon tests over
+every zone and with the compiled geohash prefix index, checks that both agree
+and prints their throughput. Without a GeoJSON file, wedge shaped zones with
+wavy borders around DC stand in for wards.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import math
+import random
+import time
+from enrichment import geohashes_batch
+from zone_index import Zone, ZoneIndex, load_zones
+
+CENTER = (38.897841, -77.036594)
+
+
+def synthetic_zones(count=8, vertices=200, radius=0.08):
+    """
+    Returns wedges around DC whose outer and side borders have many vertices
+    """
+    zones = []
+    for k in range(count):
+        a0, a1 = 2 * math.pi * k / count, 2 * math.pi * (k + 1) / count
+        ring = [(CENTER[1], CENTER[0])]
+        for i in range(vertices + 1):
+            a = a0 + (a1 - a0) * i / vertices
+            r = radius * (1 + 0.1 * math.sin(7 * a))
+            ring.append((CENTER[1] + r * math.cos(a), CENTER[0] + r * math.sin(a)))
+        zones.append(Zone(f"zone-{k + 1}", [[ring]]))
+    return zones
+
+
+def timed(label, n, fn):
+    """
+    Runs fn and prints its time, and its throughput when it processes n events
+    """
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    rate = f"{n / elapsed:>14,.0f} events/s" if n else ""
+    print(f"{label:<22} {elapsed:8.3f} s {rate}".rstrip())
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone lookup benchmark")
+    parser.add_argument('-g', dest="geojson", help="GeoJSON zones, synthetic zones if omitted")
+    parser.add_argument('-f', dest="name_field", default="NAME",
+                        help="Feature property holding the zone name")
+    parser.add_argument('-n', dest="events", type=int, default=200000,
+                        help="Number of locations")
+    parser.add_argument('--max-level', dest="max_level", type=int, default=8,
+                        help="Finest geohash level of the index")
+    args = parser.parse_args()
+
+    zones = load_zones(args.geojson, args.name_field) if args.geojson else synthetic_zones()
+    index = timed("compile", None, lambda: ZoneIndex.compile(zones, max_level=args.max_level))
+    boundary = sum(1 for entry in index.cells.values() if not isinstance(entry, str))
+    print(f"{len(zones)} zones, {len(index.cells):,} cells ({boundary:,} boundary)")
+
+    rnd = random.Random(7)
+    lats = [CENTER[0] + rnd.uniform(-0.1, 0.1) for _ in range(args.events)]
+    lons = [CENTER[1] + rnd.uniform(-0.1, 0.1) for _ in range(args.events)]
+    # the streamer has the geohash of every event already
+    codes = geohashes_batch(lats, lons, (9,))["geo9"]
+
+    def exact():
+        return [next((z.name for z in zones if z.contains(lat, lon)), None) for lat, lon in zip(lats, lons)]
+
+    def indexed():
+        return [index.lookup(code, lat, lon) for code, lat, lon in zip(codes, lats, lons)]
+
+    expected = timed("point-in-polygon", args.events, exact)
+    actual = timed("prefix index", args.events, indexed)
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"lookups {index.stats}, {mismatches} mismatches")
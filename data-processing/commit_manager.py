@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Commit manager
+
+At-least-once offset commits for the consume-produce stages. Auto-commit is
+off; every consumed message is tracked until the message produced from it is
+acknowledged by the broker (or it is dropped as unreadable), and only the
+contiguous prefix of finished offsets of each partition is committed. Commits
+are asynchronous and batched by count and interval, so a crash replays at
+most the unacknowledged tail and the messages since the last commit, never
+loses one. Partitions are committed synchronously when they are revoked and
+on shutdown, after the producer has been flushed. A delivery that fails for
+good stops the partition at the failed offset: its later offsets are no
+longer tracked and the next maybe_commit raises DeliveryFailed, so the stage
+exits after committing what was delivered and a restart replays the rest.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import logging
+import time
+from collections import deque
+from functools import partial
+from confluent_kafka import TopicPartition
+
+logger = logging.getLogger(__name__)
+
+
+def log_commit(err, partitions):
+    """
+    on_commit callback of the consumers, logs failed asynchronous commits
+    Args:
+        err (KafkaError): The error that occurred on None on success.
+        partitions (list): the committed TopicPartitions
+    """
+    if err is not None:
+        logger.error(f"offset commit failed: {err}")
+    else:
+        failed = [tp for tp in partitions if tp.error is not None]
+        if failed:
+            logger.error(f"offset commit failed for {failed}")
+
+
+class DeliveryFailed(Exception):
+    """
+    Raised by CommitManager.maybe_commit once a produced message could not be delivered
+    """
+
+
+class PartitionOffsets(object):
+    """
+    Offsets of a partition consumed but not yet committed
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.finished = set()
+        self.blocked = False
+        self.committable = None
+        self.committed = None
+
+    def finish(self, offset):
+        self.finished.add(offset)
+        pending = self.pending
+        # offsets are consumed in order, so the committable position only moves past a finished head
+        while pending and pending[0] in self.finished:
+            self.committable = pending.popleft()
+            self.finished.discard(self.committable)
+
+
+class CommitManager(object):
+    """
+    Commits consumed offsets once the messages produced from them are delivered
+    Args:
+        consumer (Consumer): a consumer created with enable.auto.commit false
+        producer (Producer): the producer of the stage, flushed before revoked partitions are committed,
+            None for sinks that finish their messages before consuming more
+        batch_size (int): number of finished messages after which offsets are committed
+        interval (float): seconds after which finished offsets are committed whatever their number
+    """
+
+    def __init__(self, consumer, producer, batch_size=5000, interval=5.0):
+        self.consumer = consumer
+        self.producer = producer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.partitions = {}
+        self.uncommitted = 0
+        self.next_commit = time.monotonic() + interval
+        self.stats = {"commits": 0, "offsets": 0, "dropped": 0, "failed": 0}
+
+    def track(self, message):
+        """
+        Registers a consumed message, call it before producing from the message
+        Args:
+            message (Message): the consumed message
+        """
+        tp = (message.topic(), message.partition())
+        offsets = self.partitions.get(tp)
+        if offsets is None:
+            offsets = self.partitions[tp] = PartitionOffsets()
+        if not offsets.blocked:
+            offsets.pending.append(message.offset())
+
+    def done(self, message):
+        """
+        Finishes a tracked message that produced nothing (unreadable or filtered)
+        Args:
+            message (Message): the consumed message
+        """
+        offsets = self.partitions.get((message.topic(), message.partition()))
+        if offsets is not None:
+            self.stats["dropped"] += 1
+            self._finish(offsets, message.offset())
+
+    def delivered(self, message):
+        """
+        Finishes a tracked message written by a sink other than the producer, e.g. an Elasticsearch bulk request
+        Args:
+            message (Message): the consumed message
+        """
+        offsets = self.partitions.get((message.topic(), message.partition()))
+        if offsets is not None:
+            self._finish(offsets, message.offset())
+
+    def on_delivery(self, message, callback=None):
+        """
+        Returns the delivery callback of the message produced from a tracked message
+        Args:
+            message (Message): the consumed message
+            callback (function): the delivery callback to chain, e.g. DeliveryStats.acked
+        """
+        offsets = self.partitions[(message.topic(), message.partition())]
+        return partial(self._delivered, offsets, message.offset(), callback)
+
+    def _delivered(self, offsets, offset, callback, err, msg):
+        if callback is not None:
+            callback(err, msg)
+        if err is not None:
+            # librdkafka gave up retrying: keep the partition before this offset so a restart replays it
+            self.stats["failed"] += 1
+            if not offsets.blocked:
+                logger.error(f"delivery failed, offsets held at {offset}: {err}")
+                offsets.blocked = True
+                # nothing past the failed offset can be committed any more
+                offsets.pending.clear()
+                offsets.finished.clear()
+            return
+        self._finish(offsets, offset)
+
+    def _finish(self, offsets, offset):
+        if offsets.blocked:
+            return
+        offsets.finish(offset)
+        self.uncommitted += 1
+
+    def maybe_commit(self):
+        """
+        Commits asynchronously if enough messages finished or the interval expired; cheap enough for a consume loop.
+        Raises DeliveryFailed once a partition is blocked by a failed delivery, the caller's close() then commits
+        what was delivered before it
+        """
+        blocked = [tp for tp, offsets in self.partitions.items() if offsets.blocked]
+        if blocked:
+            raise DeliveryFailed(f"delivery failed on {blocked}, restart to replay from the committed offsets")
+        if self.uncommitted >= self.batch_size or time.monotonic() >= self.next_commit:
+            self.commit()
+
+    def commit(self, asynchronous=True, partitions=None):
+        """
+        Commits the finished offsets that are not committed yet
+        Args:
+            asynchronous (bool): False to wait for the broker, used on revocation and shutdown
+            partitions (list): (topic, partition) tuples to commit, all tracked partitions by default
+        """
+        self.next_commit = time.monotonic() + self.interval
+        commits = {}
+        for tp in (self.partitions if partitions is None else partitions):
+            offsets = self.partitions.get(tp)
+            if offsets is not None and offsets.committable is not None and offsets.committable != offsets.committed:
+                commits[tp] = offsets
+        if partitions is None:
+            self.uncommitted = 0
+        if not commits:
+            return
+        try:
+            # the committed offset is the next one to consume
+            self.consumer.commit(offsets=[TopicPartition(t, p, o.committable + 1) for (t, p), o in commits.items()],
+                                 asynchronous=asynchronous)
+        except Exception as e:
+            # the offsets stay pending and go with the next commit, a lost commit only replays messages
+            logger.error(f"offset commit failed: {e}")
+            return
+        for offsets in commits.values():
+            offsets.committed = offsets.committable
+        self.stats["commits"] += 1
+        self.stats["offsets"] += len(commits)
+
+    def revoked(self, consumer, partitions):
+        """
+        on_revoke callback, commits what is delivered of the revoked partitions before another consumer gets them
+        Args:
+            consumer (Consumer): the consumer
+            partitions (list): the revoked TopicPartitions
+        """
+        if self.producer is not None:
+            self.producer.flush()
+        revoked = [(tp.topic, tp.partition) for tp in partitions]
+        self.commit(asynchronous=False, partitions=revoked)
+        for tp in revoked:
+            self.partitions.pop(tp, None)
+
+    def close(self, timeout=30.0):
+        """
+        Drains the producer and commits every delivered offset, call it before closing the consumer
+        Args:
+            timeout (float): seconds to wait for outstanding deliveries
+        """
+        remaining = self.producer.flush(timeout) if self.producer is not None else 0
+        if remaining:
+            logger.error(f"{remaining} messages not delivered at shutdown, their offsets stay uncommitted")
+        self.commit(asynchronous=False)
+        logger.info(f"offset commits: {self.stats}")
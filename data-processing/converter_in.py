@@ -10,12 +10,15 @@ __email__ = 'ali.rahim.taleani@gmail.com'
 __status__ = 'Development'
 
 import asyncio
-import json
-from uuid import uuid4
 from confluent_kafka.admin import AdminClient, NewTopic
-from confluent_kafka.avro import AvroConsumer, CachedSchemaRegistryClient
-from confluent_kafka import Producer
+from confluent_kafka import Consumer, Producer
 import logging.config
+from commit_manager import CommitManager, log_commit
+from delivery_stats import DeliveryStats
+from partitioning import Partitioner, vehicle_key
+from producer_profiles import DEFAULT_PROFILE, PROFILES, producer_config
+from schema_manager import DEFAULT_CACHE, SchemaManager
+from serde import CODECS, DEFAULT_CODEC, get_codec
 import argparse
 
 logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
@@ -62,42 +65,105 @@ def create_topic(client, topic_name):
             logger.error(f"failed to create topic {topic_name}: {e}")
 
 
-async def converter(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL):
-    """Consumes data from the Kafka Topic
+async def produce_batch(p, PRODUCE_TOPIC, records, stats, max_queued, partitioner, codec, commits):
     """
-    schema_registry = CachedSchemaRegistryClient({"url": SCHEMA_REGISTRY_URL})
+    Produces a batch of converted events keyed by vehicle, applying backpressure when the producer queue fills up
+    Args:
+        p (Producer): the Kafka producer
+        PRODUCE_TOPIC (str): the topic to produce to
+        records (list): (consumed message, decoded event) pairs
+        stats (DeliveryStats): the delivery report aggregator
+        max_queued (int): number of queued messages above which consumption pauses
+        partitioner (Partitioner): the vehicle partitions of the produced topic
+        codec (serde codec): the encoder of the produced values
+        commits (CommitManager): the offsets of the consumed messages, finished on delivery
+    """
+    loop = asyncio.get_running_loop()
+    for message, value in records:
+        key = vehicle_key(value['operator'], value['id'])
+        partition = partitioner.partition(PRODUCE_TOPIC, value['operator'], value['id'])
+        value = codec.encode(value)
+        on_delivery = commits.on_delivery(message, stats.acked)
+        while True:
+            try:
+                p.produce(topic=PRODUCE_TOPIC, key=key, value=value, partition=partition, on_delivery=on_delivery)
+                break
+            except BufferError:
+                await loop.run_in_executor(None, p.poll, 0.1)
+    p.poll(0)
+    # wait for deliveries before consuming more than the producer can absorb
+    while len(p) > max_queued:
+        await loop.run_in_executor(None, p.poll, 0.1)
+
+
+async def converter(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, PRODUCER_PROFILE=DEFAULT_PROFILE,
+                    BATCH_SIZE=500, BATCH_TIMEOUT=1.0, MAX_QUEUED=100000, CODEC=DEFAULT_CODEC,
+                    SCHEMA_CACHE=DEFAULT_CACHE, COMMIT_BATCH=5000, COMMIT_INTERVAL=5.0):
+    """Consumes data from the Kafka Topic in batches, off the event loop,
+    committing offsets only once the converted events are delivered
+    Args:
+        CODEC (str): codec of the produced values (serde.py)
+        SCHEMA_CACHE (str): the schema id cache file (schema_manager.py)
+        BATCH_SIZE (int): maximum number of messages of a batch
+        BATCH_TIMEOUT (float): seconds to wait for a batch to fill up
+        MAX_QUEUED (int): number of queued producer messages above which consumption pauses
+        COMMIT_BATCH (int): number of delivered messages after which offsets are committed
+        COMMIT_INTERVAL (float): seconds after which delivered offsets are committed
+    """
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+    codec = get_codec(CODEC)
 
-    c = AvroConsumer(
+    c = Consumer(
         {
             "bootstrap.servers": BROKER_URL,
             "client.id": "project-insight",
             "group.id": "convertor-in-consumer",
             "auto.offset.reset": "earliest",
-        },
-        schema_registry=schema_registry,
+            "enable.auto.commit": False,
+            "on_commit": log_commit,
+        }
     )
-    c.subscribe([CONSUME_TOPIC])
-
-    p = Producer({"bootstrap.servers": BROKER_URL})
+    p = Producer(producer_config({"bootstrap.servers": BROKER_URL}, PRODUCER_PROFILE))
+    partitioner = Partitioner(p)
+    commits = CommitManager(c, p, COMMIT_BATCH, COMMIT_INTERVAL)
+    c.subscribe([CONSUME_TOPIC], on_revoke=commits.revoked)
 
-    while True:
-        message = c.poll(1.0)
-        if message is None:
-            logger.info("no message received by consumer")
-        elif message.error() is not None:
-            logger.error(f"error from consumer {message.error()}")
-        else:
-            try:
-                print(message.value())
-                p.produce(topic=PRODUCE_TOPIC, key=str(uuid4()), value=json.dumps(message.value()))
-
-            except KeyError as e:
-                logger.error(f"Failed to unpack message {e}")
-        await asyncio.sleep(0.01)
-
-
-async def consume_produce(con_topic, pro_topic, broker_url, schema_url):
-    t = asyncio.create_task(converter(con_topic, pro_topic, broker_url, schema_url))
+    loop = asyncio.get_running_loop()
+    stats = DeliveryStats(PRODUCE_TOPIC)
+    try:
+        while True:
+            messages = await loop.run_in_executor(None, c.consume, BATCH_SIZE, BATCH_TIMEOUT)
+            if not messages:
+                logger.info("no message received by consumer")
+                stats.maybe_report()
+                commits.maybe_commit()
+                continue
+            records = []
+            for message in messages:
+                if message.error() is not None:
+                    logger.error(f"error from consumer {message.error()}")
+                    continue
+                commits.track(message)
+                try:
+                    records.append((message, schemas.decode(message.value())))
+                except (KeyError, ValueError, EOFError) as e:
+                    logger.error(f"Failed to unpack message {e}")
+                    commits.done(message)
+            await produce_batch(p, PRODUCE_TOPIC, records, stats, MAX_QUEUED, partitioner, codec, commits)
+            commits.maybe_commit()
+    finally:
+        commits.close()
+        c.close()
+        stats.close()
+        logger.info(f"schema cache: {schemas.stats}")
+
+
+async def consume_produce(con_topic, pro_topic, broker_url, schema_url, profile=DEFAULT_PROFILE,
+                          batch_size=500, batch_timeout=1.0, codec=DEFAULT_CODEC, schema_cache=DEFAULT_CACHE,
+                          commit_batch=5000, commit_interval=5.0):
+    t = asyncio.create_task(converter(con_topic, pro_topic, broker_url, schema_url, profile, batch_size, batch_timeout,
+                                      CODEC=codec, SCHEMA_CACHE=schema_cache, COMMIT_BATCH=commit_batch,
+                                      COMMIT_INTERVAL=commit_interval))
     await t
 
 
@@ -121,7 +187,9 @@ def main(args):
         create_topic(client, PRODUCE_TOPIC)
 
     try:
-        asyncio.run(consume_produce(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL))
+        asyncio.run(consume_produce(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, args.profile,
+                                    args.batch_size, args.batch_timeout, args.codec, args.schema_cache,
+                                    args.commit_batch, args.commit_interval))
     except KeyboardInterrupt as e:
         logger.error(f"Failed to unpack message {e}")
         logger.info("shutting down")
@@ -135,5 +203,19 @@ if __name__ == '__main__':
                         help="Operator name")
     parser.add_argument('-s', dest="schema_registry", required=True,
                         help="Schema Registry (http(s)://host[:port]")
+    parser.add_argument('-p', dest="profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="Producer profile (see producer_profiles.py), default keeps the librdkafka defaults")
+    parser.add_argument('-n', dest="batch_size", type=int, default=500,
+                        help="Maximum number of messages consumed at once")
+    parser.add_argument('-t', dest="batch_timeout", type=float, default=1.0,
+                        help="Seconds to wait for a batch to fill up")
+    parser.add_argument('--codec', dest="codec", choices=CODECS, default=DEFAULT_CODEC,
+                        help="Codec of the converter topic values, shared with the streamer")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file, lets the converter start without a reachable registry")
+    parser.add_argument('--commit-batch', dest="commit_batch", type=int, default=5000,
+                        help="Number of delivered messages after which consumed offsets are committed")
+    parser.add_argument('--commit-interval', dest="commit_interval", type=float, default=5.0,
+                        help="Seconds after which delivered offsets are committed")
 
     main(parser.parse_args())
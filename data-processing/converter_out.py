@@ -11,20 +11,25 @@ __status__ = 'Development'
 
 import argparse
 import asyncio
-import json
-import time
 from confluent_kafka.admin import AdminClient, NewTopic
-from confluent_kafka.avro import AvroProducer
 from dataclasses import dataclass
-from confluent_kafka import Consumer
+from confluent_kafka import Consumer, Producer
 import logging.config
+from commit_manager import CommitManager, log_commit
+from delivery_stats import DeliveryStats
+from partitioning import Partitioner
+from producer_profiles import DEFAULT_PROFILE, PROFILES, producer_config
+from schema_manager import DEFAULT_CACHE, SchemaManager
+from serde import CODECS, DEFAULT_CODEC, JSON, get_codec
 from pathlib import Path
-from confluent_kafka import avro
 
 
 logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+ROLLUP_STREAMING_TOPIC = "com.insight.project.rollups.streaming"
+ROLLUP_TABLE_TOPIC = "insight-project-rollup"
+
 
 @dataclass
 class LocationEvent:
@@ -39,6 +44,8 @@ class LocationEvent:
     geo7: str
     geo8: str
     geo9: str
+    geo6: str = None
+    zone: str = None
 
 
 def topic_exists(client, topic_name):
@@ -81,16 +88,12 @@ def create_topic(client, topic_name):
             logger.error(f"failed to create topic {topic_name}: {e}")
 
 
-def time_millis():
-    """
-    Creates keys for Kafka events
-    """
-    return int(round(time.time() * 1000))
-
-
-async def converter(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL):
-    key_schema = avro.load(f"{Path(__file__).parents[0]}/schemas/key_schema.json")
-    value_schema = avro.load(f"{Path(__file__).parents[0]}/schemas/value_schema.json")
+async def converter(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, PRODUCER_PROFILE=DEFAULT_PROFILE,
+                    VALUE_SCHEMA="value_schema.json", CODEC=DEFAULT_CODEC, SCHEMA_CACHE=DEFAULT_CACHE,
+                    COMMIT_BATCH=5000, COMMIT_INTERVAL=5.0):
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+    key_id, value_id = schemas.topic_ids(PRODUCE_TOPIC, "key_schema.json", VALUE_SCHEMA)
+    codec = get_codec(CODEC, f"{Path(__file__).parents[0]}/schemas/{VALUE_SCHEMA}")
 
     c = Consumer(
         {
@@ -98,38 +101,59 @@ async def converter(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_UR
             "client.id": "project.insight",
             "group.id": "convertor.out.consumer",
             "auto.offset.reset": "earliest",
+            "enable.auto.commit": False,
+            "on_commit": log_commit,
         })
 
-    c.subscribe([CONSUME_TOPIC])
-
-    p = AvroProducer(
+    p = Producer(producer_config(
         {
             "bootstrap.servers": BROKER_URL,
-            "schema.registry.url": SCHEMA_REGISTRY_URL,
             "client.id": "project.insight",
-        })
+        }, PRODUCER_PROFILE))
 
-    while True:
-        message = c.poll(1.0)
-        if message is None:
-            logger.info("no message received by consumer")
-        elif message.error() is not None:
-            logger.error(f"error from consumer {message.error()}")
-        else:
-            try:
-                p.produce(topic=PRODUCE_TOPIC,
-                          key={"timestamp": time_millis()},
-                          key_schema=key_schema,
-                          value=json.loads(message.value()),
-                          value_schema=value_schema)
-
-            except KeyError as e:
-                logger.error(f"Failed to unpack message {e}")
-        await asyncio.sleep(0.01)
-
-
-async def consume_produce(con_topic, pro_topic, broker_url, schema_url):
-    t = asyncio.create_task(converter(con_topic, pro_topic, broker_url, schema_url))
+    # offsets are committed once the converted record is delivered
+    commits = CommitManager(c, p, COMMIT_BATCH, COMMIT_INTERVAL)
+    c.subscribe([CONSUME_TOPIC], on_revoke=commits.revoked)
+    partitioner = Partitioner(p)
+    stats = DeliveryStats(PRODUCE_TOPIC)
+    try:
+        while True:
+            message = c.poll(1.0)
+            if message is None:
+                logger.info("no message received by consumer")
+                stats.maybe_report()
+            elif message.error() is not None:
+                logger.error(f"error from consumer {message.error()}")
+            else:
+                commits.track(message)
+                try:
+                    value = codec.decode(message.value())
+                    # rollups are keyed by their cell, events by their vehicle
+                    key = {"operator": value['operator'], "id": value['id'] if 'id' in value else value['geo']}
+                    p.produce(topic=PRODUCE_TOPIC,
+                              key=schemas.encode(key_id, key),
+                              value=schemas.encode(value_id, value),
+                              partition=partitioner.partition(PRODUCE_TOPIC, key['operator'], key['id']),
+                              on_delivery=commits.on_delivery(message, stats.acked))
+                    p.poll(0)
+
+                except (KeyError, ValueError, EOFError) as e:
+                    logger.error(f"Failed to unpack message {e}")
+                    commits.done(message)
+            commits.maybe_commit()
+            await asyncio.sleep(0.01)
+    finally:
+        commits.close()
+        c.close()
+        stats.close()
+        logger.info(f"schema cache: {schemas.stats}")
+
+
+async def consume_produce(con_topic, pro_topic, broker_url, schema_url, profile=DEFAULT_PROFILE,
+                          value_schema="value_schema.json", codec=DEFAULT_CODEC, schema_cache=DEFAULT_CACHE,
+                          commit_batch=5000, commit_interval=5.0):
+    t = asyncio.create_task(converter(con_topic, pro_topic, broker_url, schema_url, profile, value_schema, codec,
+                                      schema_cache, commit_batch, commit_interval))
     await t
 
 
@@ -141,8 +165,17 @@ def main(args):
     # OPERATOR = "lyft"
     OPERATOR = args.operator
 
-    CONSUME_TOPIC = f"com.insight.project.{OPERATOR}.streaming"
-    PRODUCE_TOPIC = f"insight-project-table"
+    if args.rollups:
+        CONSUME_TOPIC = ROLLUP_STREAMING_TOPIC
+        PRODUCE_TOPIC = ROLLUP_TABLE_TOPIC
+        VALUE_SCHEMA = "rollup_schema.json"
+        # the streamer writes rollups as JSON whatever the codec of the events
+        CODEC = JSON
+    else:
+        CONSUME_TOPIC = f"com.insight.project.{OPERATOR}.streaming"
+        PRODUCE_TOPIC = f"insight-project-table"
+        VALUE_SCHEMA = "value_schema.json"
+        CODEC = args.codec
 
     client = AdminClient({"bootstrap.servers": BROKER_URL})
 
@@ -152,7 +185,8 @@ def main(args):
     if exists is False:
         create_topic(client, PRODUCE_TOPIC)
     try:
-        asyncio.run(consume_produce(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL))
+        asyncio.run(consume_produce(CONSUME_TOPIC, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, args.profile,
+                                    VALUE_SCHEMA, CODEC, args.schema_cache, args.commit_batch, args.commit_interval))
     except KeyboardInterrupt as e:
         logger.error(f"{e}")
         logger.info("shutting down")
@@ -162,9 +196,24 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Converter Out")
     parser.add_argument('-b', dest="bootstrap_servers", required=True,
                         help="Bootstrap broker(s) (host[:port])")
-    parser.add_argument('-o', dest="operator", required=True,
+    parser.add_argument('-o', dest="operator",
                         help="Operator name")
     parser.add_argument('-s', dest="schema_registry", required=True,
                         help="Schema Registry (http(s)://host[:port]")
-
-    main(parser.parse_args())
+    parser.add_argument('-p', dest="profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="Producer profile (see producer_profiles.py), default keeps the librdkafka defaults")
+    parser.add_argument('--codec', dest="codec", choices=CODECS, default=DEFAULT_CODEC,
+                        help="Codec of the streaming topic values, shared with the streamer")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file, lets the converter start without a reachable registry")
+    parser.add_argument('--commit-batch', dest="commit_batch", type=int, default=5000,
+                        help="Number of delivered messages after which consumed offsets are committed")
+    parser.add_argument('--commit-interval', dest="commit_interval", type=float, default=5.0,
+                        help="Seconds after which delivered offsets are committed")
+    parser.add_argument('-r', dest="rollups", action='store_true',
+                        help="Convert the windowed rollups of the streamer instead of an operator's events")
+
+    args = parser.parse_args()
+    if not args.rollups and not args.operator:
+        parser.error("-o is required unless -r is given")
+    main(args)
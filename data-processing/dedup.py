@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Stationary vehicle filter
+
+Bounded per-vehicle state used to forward an event only when the vehicle
+changed geohash cell, is_disabled or is_reserved, or when its heartbeat
+interval expired. Entries are evicted after a TTL and beyond a size limit.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+from collections import OrderedDict
+
+# rough size of one entry (key tuple, state tuple and dict slot) used for the memory estimate
+ENTRY_BYTES = 400
+
+
+class StationaryFilter(object):
+    """
+    LRU table of the last forwarded state of every vehicle
+    Args:
+        max_entries (int): maximum number of vehicles kept, least recently seen are evicted first
+        ttl (float): seconds of event time after which an unseen vehicle is forgotten
+        heartbeat (float): seconds of event time after which an unchanged vehicle is forwarded again
+    """
+
+    def __init__(self, max_entries=1000000, ttl=3600, heartbeat=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.state = OrderedDict()
+        self.watermark = 0
+        self.stats = {"hits": 0, "misses": 0, "forwarded": 0, "suppressed": 0, "evicted": 0}
+
+    def should_forward(self, key, cell, is_disabled, is_reserved, ts):
+        """
+        Returns True if the event carries news about the vehicle and records it
+        Args:
+            key (tuple): vehicle key, e.g. (operator, id)
+            cell (str): geohash cell of the event
+            is_disabled (int): the event is_disabled flag
+            is_reserved (int): the event is_reserved flag
+            ts (int): event time (last_updated)
+        """
+        if ts > self.watermark:
+            self.watermark = ts
+        entry = self.state.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            forward = True
+        else:
+            self.stats["hits"] += 1
+            last_cell, last_disabled, last_reserved, last_forwarded, _ = entry
+            forward = (cell != last_cell or is_disabled != last_disabled or is_reserved != last_reserved
+                       or ts - last_forwarded >= self.heartbeat)
+            self.state.move_to_end(key)
+        if forward:
+            self.stats["forwarded"] += 1
+            self.state[key] = (cell, is_disabled, is_reserved, ts, ts)
+        else:
+            self.stats["suppressed"] += 1
+            self.state[key] = entry[:4] + (ts,)
+        self._evict()
+        return forward
+
+    def _evict(self):
+        state = self.state
+        while len(state) > self.max_entries:
+            state.popitem(last=False)
+            self.stats["evicted"] += 1
+        horizon = self.watermark - self.ttl
+        while state:
+            key, entry = next(iter(state.items()))
+            if entry[4] >= horizon:
+                break
+            del state[key]
+            self.stats["evicted"] += 1
+
+    def summary(self):
+        """
+        Returns the counters, the table size and its approximate memory use
+        """
+        return dict(self.stats, entries=len(self.state), approx_mb=round(len(self.state) * ENTRY_BYTES / 2 ** 20, 1))
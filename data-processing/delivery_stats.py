@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Delivery statistics
+
+Aggregates producer delivery reports in memory (successes, failures,
+per-partition counts and a produce-to-ack latency histogram) and logs a
+summary on an interval and at shutdown.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in milliseconds, the last bucket is open
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class DeliveryStats(object):
+    """
+    Delivery report aggregator, pass its `acked` method as on_delivery callback
+    Args:
+        name (str): label of the summaries
+        report_interval (float): seconds between two summaries, 0 to only report on close
+    """
+
+    def __init__(self, name, report_interval=30.0):
+        self.name = name
+        self.report_interval = report_interval
+        self.delivered = 0
+        self.failed = 0
+        self.partitions = {}
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.errors = {}
+        self.next_report = time.monotonic() + report_interval if report_interval else None
+
+    def acked(self, err, msg):
+        """
+        Delivery report callback
+        Args:
+            err (KafkaError): The error that occurred on None on success.
+            msg (Message): The message that was produced or failed.
+        """
+        if err is not None:
+            self.failed += 1
+            reason = str(err)
+            self.errors[reason] = self.errors.get(reason, 0) + 1
+        else:
+            self.delivered += 1
+            tp = (msg.topic(), msg.partition())
+            self.partitions[tp] = self.partitions.get(tp, 0) + 1
+            latency = msg.latency()
+            if latency is not None:
+                self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency * 1000.0)] += 1
+        if self.next_report is not None and (self.delivered + self.failed) & 0x3ff == 0:
+            self.maybe_report()
+
+    def maybe_report(self):
+        """
+        Logs a summary if the report interval expired; cheap enough for a produce loop
+        """
+        if self.next_report is not None and time.monotonic() >= self.next_report:
+            self.report()
+            self.next_report = time.monotonic() + self.report_interval
+
+    def percentile(self, q):
+        """
+        Returns the upper bound (ms) of the latency bucket holding the q-th percentile,
+        inf for the open bucket and None if no latency was recorded
+        Args:
+            q (float): percentile between 0 and 100
+        """
+        total = sum(self.histogram)
+        if not total:
+            return None
+        rank = q / 100.0 * total
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float('inf')
+        return None
+
+    def summary(self):
+        """
+        Returns the aggregated counters as a dict
+        """
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "partitions": {f"{t}[{p}]": c for (t, p), c in sorted(self.partitions.items())},
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "errors": dict(self.errors),
+        }
+
+    def report(self):
+        """
+        Logs the current summary
+        """
+        summary = self.summary()
+        logger.info(f"{self.name}: delivered {summary['delivered']}, failed {summary['failed']}, "
+                    f"ack latency p50 <= {summary['p50_ms']} ms, p99 <= {summary['p99_ms']} ms, "
+                    f"partitions {summary['partitions']}")
+        if self.errors:
+            logger.error(f"{self.name}: delivery errors {summary['errors']}")
+
+    def close(self):
+        """
+        Logs the final summary
+        """
+        self.report()
+        self.next_report = None
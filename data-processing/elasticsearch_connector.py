@@ -29,7 +29,8 @@ def configure_connector(args):
     CONNECTION_URL = args.elastic_url
 
     CONNECTOR_NAME = f"elastic-{OPERATOR}-conn"
-    TOPICS = f"insight-project-table"
+    # raw events and the windowed rollups of the streamer, each topic is indexed under its own name
+    TOPICS = f"insight-project-table,insight-project-rollup"
 
     """Calls Kafka Connect to create the Connector"""
     logger.info("creating or updating kafka connect connector...")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Event enrichment
+
+Geohash, timestamp and, given a compiled zone index (zone_index.py), zone
+attributes added to location events, shared by the Faust streamer and the
+fused pipeline.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import datetime
+import math
+import geohash
+import numpy as np
+
+# geohash precisions added to every event as geo{n}; geo6 is queried by the dashboard
+GEOHASH_LEVELS = (6, 7, 8, 9)
+BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+# fields every event needs to be enriched, keyed and partitioned
+REQUIRED_FIELDS = ("id", "operator", "last_updated", "lat", "lon")
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def event_error(event):
+    """
+    Returns why an event cannot be enriched, None for a valid event; checked per event
+    so that one malformed event does not fail the vectorized pass of its batch
+    Args:
+        event (dict): a decoded location event
+    """
+    missing = [field for field in REQUIRED_FIELDS if event.get(field) is None]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if not (_number(event['lat']) and -90 <= event['lat'] <= 90):
+        return f"invalid lat {event['lat']!r}"
+    if not (_number(event['lon']) and -180 <= event['lon'] <= 180):
+        return f"invalid lon {event['lon']!r}"
+    if not _number(event['last_updated']):
+        return f"invalid last_updated {event['last_updated']!r}"
+    return None
+
+
+def geohashes(lat, lon, levels=GEOHASH_LEVELS):
+    """
+    Returns the geohash levels of a location; the finest level is encoded once
+    and coarser levels are its prefixes
+    Args:
+        lat (float): latitude
+        lon (float): longitude
+        levels (tuple): geohash precisions
+    """
+    code = geohash.encode(float(lat), float(lon), max(levels))
+    return {f"geo{n}": code[:n] for n in levels}
+
+
+def _spread_bits(x):
+    # inserts a zero bit above every bit of a 32 bit integer
+    x = x & 0xFFFFFFFF
+    x = (x | (x << 16)) & 0x0000FFFF0000FFFF
+    x = (x | (x << 8)) & 0x00FF00FF00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x << 2)) & 0x3333333333333333
+    x = (x | (x << 1)) & 0x5555555555555555
+    return x
+
+
+def geohash_batch(lats, lons, precision=max(GEOHASH_LEVELS)):
+    """
+    Encodes arrays of locations, returns an (n, precision) array of geohash characters
+    Args:
+        lats (array-like): latitudes
+        lons (array-like): longitudes
+        precision (int): geohash precision, at most 12
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lat_q = np.clip(np.floor((lats + 90.0) / 180.0 * (1 << lat_bits)), 0, (1 << lat_bits) - 1).astype(np.uint64)
+    lon_q = np.clip(np.floor((lons + 180.0) / 360.0 * (1 << lon_bits)), 0, (1 << lon_bits) - 1).astype(np.uint64)
+    # geohash bits alternate starting with longitude at the most significant bit
+    if bits % 2:
+        code = _spread_bits(lon_q) | (_spread_bits(lat_q) << np.uint64(1))
+    else:
+        code = (_spread_bits(lon_q) << np.uint64(1)) | _spread_bits(lat_q)
+    shifts = np.arange(precision - 1, -1, -1, dtype=np.uint64) * np.uint64(5)
+    return BASE32[(code[:, None] >> shifts) & np.uint64(31)]
+
+
+def geohashes_batch(lats, lons, levels=GEOHASH_LEVELS):
+    """
+    Returns every geohash level of arrays of locations as lists of strings
+    Args:
+        lats (array-like): latitudes
+        lons (array-like): longitudes
+        levels (tuple): geohash precisions
+    """
+    chars = geohash_batch(lats, lons, max(levels))
+    return {f"geo{n}": np.ascontiguousarray(chars[:, :n]).view(f"S{n}").ravel().astype(f"U{n}").tolist()
+            for n in levels}
+
+
+def event_timestamp(last_updated):
+    """
+    Formats the epoch time of an event
+    Args:
+        last_updated (int): epoch time
+    """
+    return datetime.datetime.fromtimestamp(int(last_updated)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def timestamps_batch(last_updated):
+    """
+    Formats a batch of epoch times, formatting each distinct second once
+    Args:
+        last_updated (list): epoch times; events of one feed snapshot share theirs
+    """
+    formatted = {t: event_timestamp(t) for t in set(last_updated)}
+    return [formatted[t] for t in last_updated]
+
+
+def enrich(event):
+    """
+    Extracts and add geohash and timestamp to an event
+    Args:
+        event (dict): a decoded location event
+    """
+    event.update(geohashes(event['lat'], event['lon']))
+    event['timestamp'] = event_timestamp(event['last_updated'])
+    return event
+
+
+def enrich_batch(events, zones=None):
+    """
+    Adds geohashes and timestamp to a batch of events with one vectorized geohash pass
+    Args:
+        events (list): decoded location events (dicts)
+        zones (ZoneIndex): if given, the zone of every event is added as well
+    """
+    if not events:
+        return events
+    levels = geohashes_batch([e['lat'] for e in events], [e['lon'] for e in events])
+    timestamps = timestamps_batch([e['last_updated'] for e in events])
+    for i, e in enumerate(events):
+        for level, codes in levels.items():
+            e[level] = codes[i]
+        e['timestamp'] = timestamps[i]
+        if zones is not None:
+            e['zone'] = zones.lookup(e[f"geo{max(GEOHASH_LEVELS)}"], e['lat'], e['lon'])
+    return events
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Elasticsearch bulk indexer
+
+Python alternative to the Kafka Connect sink of elasticsearch_connector.py:
+consumes the table topic in batches and indexes the events with concurrent
+`_bulk` requests. The number of documents per request adapts to the cluster
+(AIMD): it grows by a fixed step while requests answer under the target
+latency and shrinks multiplicatively on slow responses and 429 rejections.
+Documents get the id {operator}-{id}-{last_updated}, so a retried request or
+a replayed message overwrites instead of duplicating. Offsets are committed
+once every document of a consumed batch is indexed (commit_manager.py); start
+several processes to scale out, they share one consumer group.
+
+    python es_bulk_indexer.py -b localhost:9092 -s http://localhost:8081 -e http://localhost:9200
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import asyncio
+import json
+import logging.config
+import time
+import aiohttp
+from confluent_kafka import Consumer
+from commit_manager import CommitManager, log_commit
+from schema_manager import DEFAULT_CACHE, SchemaManager
+
+logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+TABLE_TOPIC = "insight-project-table"
+# statuses worth retrying, of a whole bulk request or of one of its items
+RETRYABLE = {429, 502, 503, 504}
+# only the fields needed to tell indexed, retryable and failed items apart
+BULK_FILTER = "errors,items.*.status,items.*.error.type,items.*.error.reason"
+
+
+def doc_id(value):
+    """
+    Returns the deterministic document id of a location event
+    Args:
+        value (dict): the decoded event
+    """
+    return f"{value['operator']}-{value['id']}-{value['last_updated']}"
+
+
+class BatchSizer(object):
+    """
+    Additive increase, multiplicative decrease of the number of documents per bulk request
+    Args:
+        size (int): initial documents per request
+        min_size (int): lower bound
+        max_size (int): upper bound
+        target_latency (float): seconds above which a request counts as slow
+        step (int): documents added after a fast request
+    """
+
+    def __init__(self, size=500, min_size=50, max_size=10000, target_latency=1.0, step=100):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.step = step
+
+    def succeeded(self, latency):
+        """
+        Adapts the size to the latency of a request that was not rejected
+        Args:
+            latency (float): seconds the request took
+        """
+        if latency > self.target_latency:
+            self.size = max(self.min_size, int(self.size * 0.75))
+        else:
+            self.size = min(self.max_size, self.size + self.step)
+
+    def rejected(self):
+        """
+        Halves the size after a 429 or an unavailable cluster
+        """
+        self.size = max(self.min_size, self.size // 2)
+
+
+class BulkIndexer(object):
+    """
+    Indexes documents with concurrent _bulk requests, retrying rejected ones
+    Args:
+        session (aiohttp.ClientSession): the shared HTTP session
+        url (str): Elasticsearch (http(s)://host[:port])
+        index (str): the index name
+        concurrency (int): number of requests in flight
+        sizer (BatchSizer): the adaptive number of documents per request
+        backoff (float): seconds to wait before the first retry, doubled up to max_backoff
+        max_backoff (float): upper bound of the wait between retries
+    """
+
+    def __init__(self, session, url, index, concurrency=4, sizer=None, backoff=0.5, max_backoff=30.0):
+        self.session = session
+        self.url = f"{url.rstrip('/')}/_bulk?filter_path={BULK_FILTER}"
+        self.index_name = index
+        self.concurrency = concurrency
+        self.sizer = sizer if sizer is not None else BatchSizer()
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {"indexed": 0, "failed": 0, "retried": 0, "rejected": 0, "requests": 0}
+
+    def action(self, value):
+        """
+        Returns the two NDJSON lines indexing an event
+        Args:
+            value (dict): the decoded event
+        """
+        return (json.dumps({"index": {"_index": self.index_name, "_id": doc_id(value)}}) + "\n"
+                + json.dumps(value, separators=(',', ':')) + "\n").encode()
+
+    async def index(self, docs):
+        """
+        Indexes documents until every one is indexed or failed for good, returns both lists of tokens
+        Args:
+            docs (list): (token, event) pairs, the token identifies the document to the caller
+        """
+        pending = [(token, self.action(value)) for token, value in docs]
+        indexed, failed = [], []
+        attempt = 0
+        while pending:
+            retry = []
+            cursor = [0]
+
+            async def worker():
+                # each request takes the size current when it starts, so the size adapts within a batch
+                while cursor[0] < len(pending):
+                    chunk = pending[cursor[0]:cursor[0] + self.sizer.size]
+                    cursor[0] += len(chunk)
+                    await self._send(chunk, indexed, failed, retry)
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            pending = retry
+            if pending:
+                self.stats["retried"] += len(pending)
+                await asyncio.sleep(min(self.max_backoff, self.backoff * 2 ** attempt))
+                attempt += 1
+        return indexed, failed
+
+    async def _send(self, chunk, indexed, failed, retry):
+        self.stats["requests"] += 1
+        t0 = time.monotonic()
+        try:
+            async with self.session.post(self.url, data=b"".join(action for _, action in chunk),
+                                         headers={"Content-Type": "application/x-ndjson"}) as resp:
+                if resp.status in RETRYABLE:
+                    self.stats["rejected"] += 1
+                    self.sizer.rejected()
+                    retry.extend(chunk)
+                    return
+                # other errors (authentication, malformed request) stop the indexer before offsets are committed
+                resp.raise_for_status()
+                result = await resp.json()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            logger.error(f"bulk request failed: {e!r}")
+            self.sizer.rejected()
+            retry.extend(chunk)
+            return
+        latency = time.monotonic() - t0
+        if not result.get("errors"):
+            indexed.extend(token for token, _ in chunk)
+            self.stats["indexed"] += len(chunk)
+            self.sizer.succeeded(latency)
+            return
+        rejected = False
+        for (token, action), item in zip(chunk, result["items"]):
+            outcome = next(iter(item.values()))
+            status = outcome["status"]
+            if status < 300:
+                indexed.append(token)
+                self.stats["indexed"] += 1
+            elif status in RETRYABLE:
+                rejected = True
+                retry.append((token, action))
+            else:
+                # a mapping or parsing error fails again on every retry
+                failed.append(token)
+                self.stats["failed"] += 1
+                logger.error(f"document rejected ({status}): {outcome.get('error')}")
+        if rejected:
+            self.stats["rejected"] += 1
+            self.sizer.rejected()
+        else:
+            self.sizer.succeeded(latency)
+
+
+async def index_messages(messages, schemas, bulk, commits):
+    """
+    Decodes and indexes a consumed batch, returns the number of documents sent. A message is finished in the
+    commit manager only once its document is indexed or failed for good, so its offset is never committed before
+    Args:
+        messages (list): the consumed messages
+        schemas (SchemaManager): decodes the Avro values
+        bulk (BulkIndexer): indexes the decoded events
+        commits (CommitManager): tracks the offsets of the consumed messages
+    """
+    docs = []
+    for message in messages:
+        if message.error() is not None:
+            logger.error(f"error from consumer {message.error()}")
+            continue
+        commits.track(message)
+        try:
+            docs.append((message, schemas.decode(message.value())))
+        except (KeyError, ValueError, EOFError) as e:
+            logger.error(f"Failed to unpack message {e}")
+            commits.done(message)
+    if docs:
+        indexed, failed = await bulk.index(docs)
+        for message in indexed:
+            commits.delivered(message)
+        for message in failed:
+            commits.done(message)
+    return len(docs)
+
+
+async def indexer(CONSUME_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, ELASTIC_URL, INDEX, CONCURRENCY=4,
+                  BATCH_SIZE=5000, BATCH_TIMEOUT=1.0, SIZER=None, AUTH=None, SCHEMA_CACHE=DEFAULT_CACHE,
+                  COMMIT_BATCH=5000, COMMIT_INTERVAL=5.0):
+    """
+    Consumes the table topic in batches and indexes each batch before committing its offsets
+    Args:
+        CONSUME_TOPIC (str): the table topic
+        ELASTIC_URL (str): Elasticsearch (http(s)://host[:port])
+        INDEX (str): the index name
+        CONCURRENCY (int): number of bulk requests in flight
+        BATCH_SIZE (int): maximum number of messages consumed at once
+        BATCH_TIMEOUT (float): seconds to wait for a batch to fill up
+        SIZER (BatchSizer): the adaptive number of documents per request
+        AUTH (str): user:password of Elasticsearch, None without authentication
+        SCHEMA_CACHE (str): the schema id cache file (schema_manager.py)
+        COMMIT_BATCH (int): number of indexed messages after which offsets are committed
+        COMMIT_INTERVAL (float): seconds after which indexed offsets are committed
+    """
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+
+    c = Consumer(
+        {
+            "bootstrap.servers": BROKER_URL,
+            "client.id": "project.insight",
+            "group.id": "elastic.indexer.consumer",
+            "auto.offset.reset": "earliest",
+            "enable.auto.commit": False,
+            "on_commit": log_commit,
+        })
+    # every consumed batch is indexed before the next one is consumed, there is no producer to drain
+    commits = CommitManager(c, None, COMMIT_BATCH, COMMIT_INTERVAL)
+    c.subscribe([CONSUME_TOPIC], on_revoke=commits.revoked)
+
+    auth = aiohttp.BasicAuth(*AUTH.split(':', 1)) if AUTH else None
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, keepalive_timeout=60)
+    loop = asyncio.get_running_loop()
+    try:
+        async with aiohttp.ClientSession(connector=connector, auth=auth,
+                                         timeout=aiohttp.ClientTimeout(total=60)) as session:
+            bulk = BulkIndexer(session, ELASTIC_URL, INDEX, CONCURRENCY, SIZER)
+            next_report = time.monotonic() + 30
+            while True:
+                messages = await loop.run_in_executor(None, c.consume, BATCH_SIZE, BATCH_TIMEOUT)
+                if not await index_messages(messages, schemas, bulk, commits):
+                    logger.info("no message received by consumer")
+                commits.maybe_commit()
+                if time.monotonic() >= next_report:
+                    logger.info(f"{INDEX}: {bulk.stats}, {bulk.sizer.size} documents per request")
+                    next_report = time.monotonic() + 30
+    finally:
+        commits.close()
+        c.close()
+        logger.info(f"schema cache: {schemas.stats}")
+
+
+def main(args):
+    # SCHEMA_REGISTRY_URL = "http://localhost:8081"
+    SCHEMA_REGISTRY_URL = args.schema_registry
+    # BROKER_URL = "PLAINTEXT://localhost:9092"
+    BROKER_URL = args.bootstrap_servers
+    # ELASTIC_URL = "http://localhost:9200"
+    ELASTIC_URL = args.elastic_url
+
+    sizer = BatchSizer(args.min_request, args.min_request, args.max_request, args.target_latency)
+    try:
+        asyncio.run(indexer(args.topic, BROKER_URL, SCHEMA_REGISTRY_URL, ELASTIC_URL, args.index or args.topic,
+                            args.concurrency, args.batch_size, args.batch_timeout, sizer, args.auth,
+                            args.schema_cache, args.commit_batch, args.commit_interval))
+    except KeyboardInterrupt:
+        logger.info("shutting down")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elasticsearch Bulk Indexer")
+    parser.add_argument('-b', dest="bootstrap_servers", required=True,
+                        help="Bootstrap broker(s) (host[:port])")
+    parser.add_argument('-s', dest="schema_registry", required=True,
+                        help="Schema Registry (http(s)://host[:port]")
+    parser.add_argument('-e', dest="elastic_url", required=True,
+                        help="Elasticsearch URL (http(s)://host[:port])")
+    parser.add_argument('--topic', dest="topic", default=TABLE_TOPIC,
+                        help="Topic to index")
+    parser.add_argument('-i', dest="index",
+                        help="Index name, the topic name by default as with the Kafka Connect sink")
+    parser.add_argument('-a', dest="auth",
+                        help="Elasticsearch user:password")
+    parser.add_argument('-c', dest="concurrency", type=int, default=4,
+                        help="Number of bulk requests in flight")
+    parser.add_argument('-n', dest="batch_size", type=int, default=5000,
+                        help="Maximum number of messages consumed at once")
+    parser.add_argument('-t', dest="batch_timeout", type=float, default=1.0,
+                        help="Seconds to wait for a batch to fill up")
+    parser.add_argument('--min-request', dest="min_request", type=int, default=100,
+                        help="Lower bound and initial number of documents per bulk request")
+    parser.add_argument('--max-request', dest="max_request", type=int, default=10000,
+                        help="Upper bound of the number of documents per bulk request")
+    parser.add_argument('--target-latency', dest="target_latency", type=float, default=1.0,
+                        help="Seconds per bulk request above which requests shrink")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file, lets the indexer start without a reachable registry")
+    parser.add_argument('--commit-batch', dest="commit_batch", type=int, default=5000,
+                        help="Number of indexed messages after which consumed offsets are committed")
+    parser.add_argument('--commit-interval', dest="commit_interval", type=float, default=5.0,
+                        help="Seconds after which indexed offsets are committed")
+
+    main(parser.parse_args())
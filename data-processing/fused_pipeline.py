@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Fused pipeline
+
+Consumes the producer topics, adds geohashes and timestamp and produces the
+final Avro records to the table topic in one process: one decode and one
+encode per event instead of converter_in -> streamer -> converter_out.
+The staged topology stays available for debugging.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import asyncio
+import logging.config
+from confluent_kafka import Consumer, Producer
+from confluent_kafka.admin import AdminClient
+from commit_manager import CommitManager, log_commit
+from converter_out import create_topic, topic_exists
+from delivery_stats import DeliveryStats
+from enrichment import enrich_batch, event_error
+from partitioning import Partitioner
+from zone_index import ZoneIndex
+from producer_profiles import DEFAULT_PROFILE, PROFILES, producer_config
+from schema_manager import DEFAULT_CACHE, SchemaManager
+
+logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+def enrich_messages(messages, schemas, zones, commits):
+    """
+    Decodes, validates and enriches a consumed batch, returns the (message, enriched event) pairs to produce.
+    Unreadable and malformed events are logged and finished in the commit manager; only they are dropped,
+    the rest of the batch is enriched together
+    Args:
+        messages (list): the consumed messages
+        schemas (SchemaManager): decodes the Avro values
+        zones (ZoneIndex): if given, the zone of every event is added as well
+        commits (CommitManager): tracks the offsets of the consumed messages
+    """
+    records = []
+    for message in messages:
+        if message.error() is not None:
+            logger.error(f"error from consumer {message.error()}")
+            continue
+        commits.track(message)
+        try:
+            value = schemas.decode(message.value())
+        except (KeyError, ValueError, EOFError) as e:
+            logger.error(f"Failed to unpack message {e}")
+            commits.done(message)
+            continue
+        error = event_error(value)
+        if error is not None:
+            logger.error(f"Dropping event at {message.topic()}[{message.partition()}]@{message.offset()}: {error}")
+            commits.done(message)
+            continue
+        records.append((message, value))
+    enrich_batch([value for _, value in records], zones)
+    return records
+
+
+async def produce_batch(p, PRODUCE_TOPIC, records, stats, max_queued, partitioner, schemas, commits):
+    """
+    Produces a batch of enriched events keyed by vehicle, applying backpressure when the producer queue fills up
+    Args:
+        p (Producer): the Kafka producer
+        PRODUCE_TOPIC (str): the topic to produce to
+        records (list): (consumed message, enriched event) pairs
+        stats (DeliveryStats): the delivery report aggregator
+        max_queued (int): number of queued messages above which consumption pauses
+        partitioner (Partitioner): the vehicle partitions of the produced topic
+        schemas (SchemaManager): the schema ids of the produced topic
+        commits (CommitManager): the offsets of the consumed messages, finished on delivery
+    """
+    loop = asyncio.get_running_loop()
+    key_id, value_id = schemas.topic_ids(PRODUCE_TOPIC)
+    for message, value in records:
+        partition = partitioner.partition(PRODUCE_TOPIC, value['operator'], value['id'])
+        key = schemas.encode(key_id, {"operator": value['operator'], "id": value['id']})
+        encoded = schemas.encode(value_id, value)
+        on_delivery = commits.on_delivery(message, stats.acked)
+        while True:
+            try:
+                p.produce(topic=PRODUCE_TOPIC, key=key, value=encoded, partition=partition, on_delivery=on_delivery)
+                break
+            except BufferError:
+                await loop.run_in_executor(None, p.poll, 0.1)
+    p.poll(0)
+    while len(p) > max_queued:
+        await loop.run_in_executor(None, p.poll, 0.1)
+
+
+async def pipeline(CONSUME_TOPICS, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, PRODUCER_PROFILE=DEFAULT_PROFILE,
+                   BATCH_SIZE=500, BATCH_TIMEOUT=1.0, MAX_QUEUED=100000, ZONES=None, SCHEMA_CACHE=DEFAULT_CACHE,
+                   COMMIT_BATCH=5000, COMMIT_INTERVAL=5.0):
+    """
+    Consumes, enriches and produces batches of location events
+    Args:
+        CONSUME_TOPICS (list): the producer topics
+        PRODUCE_TOPIC (str): the table topic
+        BATCH_SIZE (int): maximum number of messages of a batch
+        BATCH_TIMEOUT (float): seconds to wait for a batch to fill up
+        MAX_QUEUED (int): number of queued producer messages above which consumption pauses
+        ZONES (str): compiled zone index used to add a zone to every event, None for no zones
+        SCHEMA_CACHE (str): the schema id cache file (schema_manager.py)
+        COMMIT_BATCH (int): number of delivered messages after which offsets are committed
+        COMMIT_INTERVAL (float): seconds after which delivered offsets are committed
+    """
+    zones = ZoneIndex.load(ZONES) if ZONES else None
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+    schemas.topic_ids(PRODUCE_TOPIC)
+
+    c = Consumer(
+        {
+            "bootstrap.servers": BROKER_URL,
+            "client.id": "project.insight",
+            "group.id": "fused.pipeline.consumer",
+            "auto.offset.reset": "earliest",
+            "enable.auto.commit": False,
+            "on_commit": log_commit,
+        })
+
+    p = Producer(producer_config(
+        {
+            "bootstrap.servers": BROKER_URL,
+            "client.id": "project.insight",
+        }, PRODUCER_PROFILE))
+    partitioner = Partitioner(p)
+    commits = CommitManager(c, p, COMMIT_BATCH, COMMIT_INTERVAL)
+    c.subscribe(CONSUME_TOPICS, on_revoke=commits.revoked)
+
+    loop = asyncio.get_running_loop()
+    stats = DeliveryStats(PRODUCE_TOPIC)
+    try:
+        while True:
+            messages = await loop.run_in_executor(None, c.consume, BATCH_SIZE, BATCH_TIMEOUT)
+            if not messages:
+                logger.info("no message received by consumer")
+                stats.maybe_report()
+                commits.maybe_commit()
+                continue
+            records = enrich_messages(messages, schemas, zones, commits)
+            await produce_batch(p, PRODUCE_TOPIC, records, stats, MAX_QUEUED, partitioner, schemas, commits)
+            commits.maybe_commit()
+    finally:
+        commits.close()
+        c.close()
+        stats.close()
+        logger.info(f"schema cache: {schemas.stats}")
+
+
+def main(args):
+    # SCHEMA_REGISTRY_URL = "http://localhost:8081"
+    SCHEMA_REGISTRY_URL = args.schema_registry
+    # BROKER_URL = "PLAINTEXT://localhost:9092"
+    BROKER_URL = args.bootstrap_servers
+    # OPERATORS = ["bird", "lime"]
+    OPERATORS = args.operators
+
+    CONSUME_TOPICS = [f"com.insight.project.{OPERATOR}.producer" for OPERATOR in OPERATORS]
+    PRODUCE_TOPIC = "insight-project-table"
+
+    client = AdminClient({"bootstrap.servers": BROKER_URL})
+
+    exists = topic_exists(client, PRODUCE_TOPIC)
+    logger.info(f"Topic {PRODUCE_TOPIC} exists: {exists}")
+
+    if exists is False:
+        create_topic(client, PRODUCE_TOPIC)
+    try:
+        asyncio.run(pipeline(CONSUME_TOPICS, PRODUCE_TOPIC, BROKER_URL, SCHEMA_REGISTRY_URL, args.profile,
+                             args.batch_size, args.batch_timeout, ZONES=args.zones,
+                             SCHEMA_CACHE=args.schema_cache, COMMIT_BATCH=args.commit_batch,
+                             COMMIT_INTERVAL=args.commit_interval))
+    except KeyboardInterrupt as e:
+        logger.error(f"{e}")
+        logger.info("shutting down")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fused pipeline")
+    parser.add_argument('-b', dest="bootstrap_servers", required=True,
+                        help="Bootstrap broker(s) (host[:port])")
+    parser.add_argument('-o', dest="operators", nargs='+', required=True,
+                        help="Operator name(s)")
+    parser.add_argument('-s', dest="schema_registry", required=True,
+                        help="Schema Registry (http(s)://host[:port]")
+    parser.add_argument('-p', dest="profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="Producer profile (see producer_profiles.py), default keeps the librdkafka defaults")
+    parser.add_argument('-n', dest="batch_size", type=int, default=500,
+                        help="Maximum number of messages consumed at once")
+    parser.add_argument('-t', dest="batch_timeout", type=float, default=1.0,
+                        help="Seconds to wait for a batch to fill up")
+    parser.add_argument('-z', dest="zones",
+                        help="Compiled zone index (zone_index.py) used to add a zone to every event")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file, lets the pipeline start without a reachable registry")
+    parser.add_argument('--commit-batch', dest="commit_batch", type=int, default=5000,
+                        help="Number of delivered messages after which consumed offsets are committed")
+    parser.add_argument('--commit-interval', dest="commit_interval", type=float, default=5.0,
+                        help="Seconds after which delivered offsets are committed")
+
+    main(parser.parse_args())
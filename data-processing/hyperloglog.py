@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""HyperLogLog sketches
+
+Mergeable distinct counters of vehicle ids. A sketch of 2 ** p one-byte
+registers estimates its cardinality with a standard error of about
+1.04 / sqrt(2 ** p) (1.6 % at the default p = 12). Sketches of the same
+precision merge by register-wise maximum, so children geohash cells and
+short windows roll up into parents and days without rescanning events.
+Most rollup cells see a handful of vehicles, so a sketch starts sparse: an
+exact list of the 64-bit hashes it has seen, 8 bytes per vehicle, and only
+becomes dense registers beyond 2 ** p / 128 hashes (32 at p = 12).
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import base64
+import hashlib
+import math
+import zlib
+from array import array
+import numpy as np
+
+DEFAULT_PRECISION = 12
+HASH_BITS = 64
+INVERSE_POWERS = np.array([2.0 ** -r for r in range(HASH_BITS + 1)])
+# set on the precision byte of a serialized sparse sketch
+SPARSE_FLAG = 0x80
+
+
+def hash64(value):
+    """
+    Returns a 64-bit hash of a value that is stable across processes
+    Args:
+        value (str): the value, e.g. a vehicle id
+    """
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog distinct counter, sparse (exact) until it holds more than 2 ** p / 128 hashes
+    Args:
+        p (int): precision, the sketch has 2 ** p registers
+        registers (bytearray): initial registers of a dense sketch, e.g. from a serialized sketch
+        hashes (iterable): initial hashes of a sparse sketch
+    """
+
+    def __init__(self, p=DEFAULT_PRECISION, registers=None, hashes=None):
+        if not 4 <= p <= 16:
+            raise ValueError(f"precision must be between 4 and 16, got {p}")
+        self.p = p
+        self.m = 1 << p
+        self.sparse_max = self.m >> 7
+        self.registers = registers
+        self.hashes = None
+        if registers is None:
+            self.hashes = array('Q')
+            for x in hashes or ():
+                self._add_hash(x)
+        elif len(registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(registers)}")
+
+    @property
+    def sparse(self):
+        return self.registers is None
+
+    def _set_register(self, x):
+        bits = HASH_BITS - self.p
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def _densify(self):
+        self.registers = bytearray(self.m)
+        for x in self.hashes:
+            self._set_register(x)
+        self.hashes = None
+
+    def _add_hash(self, x):
+        if self.registers is not None:
+            self._set_register(x)
+        elif x not in self.hashes:
+            self.hashes.append(x)
+            if len(self.hashes) > self.sparse_max:
+                self._densify()
+
+    def add(self, value):
+        """
+        Adds a value to the sketch
+        Args:
+            value (str): the value, e.g. a vehicle id
+        """
+        self._add_hash(hash64(value))
+
+    def update(self, other):
+        """
+        Merges another sketch into this one
+        Args:
+            other (HyperLogLog): a sketch of the same precision
+        """
+        if other.p != self.p:
+            raise ValueError(f"cannot merge sketches of precision {self.p} and {other.p}")
+        if other.sparse:
+            for x in other.hashes:
+                self._add_hash(x)
+            return self
+        if self.sparse:
+            self._densify()
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        np.maximum(registers, np.frombuffer(other.registers, dtype=np.uint8), out=registers)
+        return self
+
+    def copy(self):
+        """
+        Returns an independent copy of the sketch
+        """
+        if self.sparse:
+            return HyperLogLog(self.p, hashes=self.hashes)
+        return HyperLogLog(self.p, bytearray(self.registers))
+
+    def count(self):
+        """
+        Returns the estimated number of distinct values, exact while the sketch is sparse
+        """
+        if self.sparse:
+            return len(self.hashes)
+        m = self.m
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / INVERSE_POWERS[registers].sum()
+        if estimate <= 2.5 * m:
+            zeros = m - np.count_nonzero(registers)
+            if zeros:
+                # linear counting is more accurate for small cardinalities
+                return m * math.log(m / zeros)
+        return float(estimate)
+
+    def to_bytes(self):
+        """
+        Serializes the sketch: the hashes of a sparse sketch, the compressed registers of a dense one
+        """
+        if self.sparse:
+            return bytes([self.p | SPARSE_FLAG]) + b"".join(x.to_bytes(8, 'big') for x in self.hashes)
+        return bytes([self.p]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Deserializes a sketch written by to_bytes
+        Args:
+            data (bytes): the serialized sketch
+        """
+        if data[0] & SPARSE_FLAG:
+            return cls(data[0] & ~SPARSE_FLAG, hashes=[int.from_bytes(data[i:i + 8], 'big')
+                                                       for i in range(1, len(data), 8)])
+        return cls(data[0], bytearray(zlib.decompress(data[1:])))
+
+    def to_text(self):
+        """
+        Serializes the sketch to base64 text for JSON and Avro string fields
+        """
+        return base64.b64encode(self.to_bytes()).decode()
+
+    @classmethod
+    def from_text(cls, text):
+        """
+        Deserializes a sketch written by to_text
+        Args:
+            text (str): the base64 serialized sketch
+        """
+        return cls.from_bytes(base64.b64decode(text))
+
+
+def merge(sketches):
+    """
+    Returns a new sketch of the union of sketches
+    Args:
+        sketches (iterable): sketches of the same precision
+    """
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = sketch.copy()
+        else:
+            merged.update(sketch)
+    return merged
+
+
+def merge_by_prefix(sketches, level):
+    """
+    Merges the sketches of geohash cells into the sketches of their parent cells
+    Args:
+        sketches (dict): sketch per geohash cell of one level
+        level (int): the coarser geohash level of the parent cells
+    """
+    parents = {}
+    for cell, sketch in sketches.items():
+        parent = cell[:level]
+        if parent in parents:
+            parents[parent].update(sketch)
+        else:
+            parents[parent] = sketch.copy()
+    return parents
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Idle time engine
+
+Bounded per-vehicle state of the cell a vehicle rests in and since when.
+A vehicle is idle while it stays in the same geohash cell; when it moves or
+is forgotten its idle spell is added to the histogram of its operator and
+cell. The longest idle vehicles are ranked from a heap of idle spell starts
+kept next to the state, so a ranking only pops its top entries instead of
+scanning every vehicle.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import bisect
+import heapq
+from collections import OrderedDict
+
+# upper bounds of the idle histogram buckets in minutes, the last bucket is open
+IDLE_BUCKETS_MIN = (5, 15, 30, 60, 120, 240, 480, 1440)
+
+
+class IdleTracker(object):
+    """
+    LRU table of the cell and idle start of every vehicle
+    Args:
+        max_entries (int): maximum number of vehicles kept, least recently seen are evicted first
+        ttl (float): seconds of event time after which an unseen vehicle is forgotten
+        buckets (tuple): upper bounds of the histogram buckets in minutes
+    """
+
+    def __init__(self, max_entries=1000000, ttl=86400, buckets=IDLE_BUCKETS_MIN):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bounds = [b * 60 for b in buckets]
+        self.state = OrderedDict()
+        # min-heap of (since, operator, vehicle_id, cell) spell starts, closed spells are skipped lazily
+        self.spells = []
+        self.histograms = {}
+        self.watermark = 0
+        self.evicted = 0
+
+    def update(self, operator, vehicle_id, cell, ts):
+        """
+        Records an event of a vehicle and closes its idle spell if it moved
+        Args:
+            operator (str): the operator name
+            vehicle_id (str): the vehicle id
+            cell (str): geohash cell of the event
+            ts (int): event time (last_updated)
+        """
+        if ts > self.watermark:
+            self.watermark = ts
+        key = (operator, vehicle_id)
+        entry = self.state.get(key)
+        if entry is None:
+            self.state[key] = (cell, ts, ts)
+            self._start(operator, vehicle_id, cell, ts)
+        else:
+            last_cell, since, last_ts = entry
+            if cell != last_cell:
+                self._close(operator, last_cell, last_ts - since)
+                self.state[key] = (cell, ts, ts)
+                self._start(operator, vehicle_id, cell, ts)
+            else:
+                self.state[key] = (cell, since, max(ts, last_ts))
+            self.state.move_to_end(key)
+        self._evict()
+
+    def _start(self, operator, vehicle_id, cell, since):
+        heapq.heappush(self.spells, (since, operator, vehicle_id, cell))
+        if len(self.spells) > 2 * len(self.state) + 1024:
+            # closed spells outnumber the open ones, rebuild the heap from the state
+            self.spells = [(since, operator, vehicle_id, cell)
+                           for (operator, vehicle_id), (cell, since, _) in self.state.items()]
+            heapq.heapify(self.spells)
+
+    def _close(self, operator, cell, idle):
+        histogram = self.histograms.get((operator, cell))
+        if histogram is None:
+            histogram = self.histograms[(operator, cell)] = [0] * (len(self.bounds) + 1)
+        histogram[bisect.bisect_left(self.bounds, idle)] += 1
+
+    def _evict(self):
+        state = self.state
+        while len(state) > self.max_entries:
+            (operator, _), (cell, since, last_ts) = state.popitem(last=False)
+            self._close(operator, cell, last_ts - since)
+            self.evicted += 1
+        horizon = self.watermark - self.ttl
+        while state:
+            key, (cell, since, last_ts) = next(iter(state.items()))
+            if last_ts >= horizon:
+                break
+            del state[key]
+            self._close(key[0], cell, last_ts - since)
+            self.evicted += 1
+
+    def drain_histograms(self):
+        """
+        Returns and resets the idle spell histograms closed since the last call, per (operator, cell)
+        """
+        histograms, self.histograms = self.histograms, {}
+        return histograms
+
+    def longest_idle(self, n=10):
+        """
+        Returns the n vehicles idle the longest up to the watermark, as (idle seconds, operator, id, cell)
+        Args:
+            n (int): number of vehicles
+        """
+        now = self.watermark
+        spells, state = self.spells, self.state
+        top, seen = [], set()
+        while spells and len(top) < n:
+            spell = heapq.heappop(spells)
+            since, operator, vehicle_id, cell = spell
+            entry = state.get((operator, vehicle_id))
+            # spells closed by a move or an eviction leave the heap here
+            if entry is None or entry[0] != cell or entry[1] != since or (operator, vehicle_id) in seen:
+                continue
+            seen.add((operator, vehicle_id))
+            top.append(spell)
+        for spell in top:
+            heapq.heappush(spells, spell)
+        return [(now - since, operator, vehicle_id, cell) for since, operator, vehicle_id, cell in top]
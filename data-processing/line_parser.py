@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Collector line parser
+
+Turns blocks of raw `key:val, key:val` collector bytes into batches of
+validated event records; malformed lines are counted and quarantined.
+Rows of delta-mode files whose `event` is `disappeared` are counted and
+skipped: they repeat the last known position of a vehicle that left the
+feed, so producing them would show the vehicle as still parked there.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_KEYS = ('bike_id', 'is_disabled', 'is_reserved', 'last_updated', 'lat', 'lon', 'operator', 'vehicle_type')
+# delta-mode events that are not positions of a vehicle in the feed
+DEPARTURE_EVENTS = frozenset(('disappeared',))
+BOOLEANS = {'True': 1, 'False': 0, 'true': 1, 'false': 0, '1': 1, '0': 0, 'TRUE': 1, 'FALSE': 0}
+
+
+class LineParser(object):
+    """
+    Incremental parser of collector lines
+    Args:
+        quarantine (file): binary file receiving malformed lines, None to only count them
+    """
+
+    def __init__(self, quarantine=None):
+        self.quarantine = quarantine
+        self.parsed = 0
+        self.malformed = 0
+        self.departed = 0
+        self._tail = b''
+
+    def feed(self, chunk):
+        """
+        Parses the complete lines of a chunk, keeps a trailing partial line for the next one
+        Args:
+            chunk (bytes): raw bytes, not necessarily line aligned
+        """
+        data = self._tail + chunk
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._tail = data
+            return []
+        self._tail = data[end + 1:]
+        return self.parse_block(data[:end])
+
+    def finish(self):
+        """
+        Parses the last line of the stream if it has no line break
+        """
+        data, self._tail = self._tail, b''
+        return self.parse_block(data) if data.strip() else []
+
+    def parse_block(self, block):
+        """
+        Parses a block of complete lines into a list of records
+        Args:
+            block (bytes): line aligned raw bytes
+        """
+        records = []
+        append = records.append
+        booleans = BOOLEANS
+        departures = DEPARTURE_EVENTS
+        for line in block.decode('utf-8', 'replace').split('\n'):
+            if not line or line.isspace():
+                continue
+            d = {}
+            for element in line.rstrip('\r').split(', '):
+                key, _, val = element.partition(':')
+                d[key] = val
+            if d.get('event') in departures:
+                self.departed += 1
+                continue
+            try:
+                append({
+                    'id': d['bike_id'],
+                    'is_disabled': booleans[d['is_disabled']],
+                    'is_reserved': booleans[d['is_reserved']],
+                    'last_updated': int(d['last_updated']),
+                    'lat': float(d['lat']),
+                    'lon': float(d['lon']),
+                    'operator': d['operator'],
+                    'type': d['vehicle_type'],
+                    'geo6': '',
+                    'geo7': '',
+                    'geo8': '',
+                    'geo9': '',
+                    'timestamp': '',
+                })
+            except (KeyError, ValueError):
+                self._quarantine(line)
+        self.parsed += len(records)
+        return records
+
+    def _quarantine(self, line):
+        self.malformed += 1
+        if self.quarantine is not None:
+            self.quarantine.write(line.encode('utf-8') + b'\n')
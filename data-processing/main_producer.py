@@ -11,60 +11,25 @@ __email__ = 'ali.rahim.taleani@gmail.com'
 __status__ = 'Development'
 
 import argparse
-import distutils.util
-from dataclasses import asdict, dataclass
-from confluent_kafka import avro
 from pathlib import Path
 import logging.config
+from confluent_kafka import Producer
 from confluent_kafka.admin import AdminClient, NewTopic
-from confluent_kafka.avro import AvroProducer
 import logging.config
-import time
-import boto3
-import codecs
+import os
+from delivery_stats import DeliveryStats
+from line_parser import LineParser
+from partitioning import Partitioner
+from producer_profiles import DEFAULT_PROFILE, PROFILES, producer_config
+from range_reader import Checkpoint, open_source, read_range, run_parallel, split_ranges
+from replay import MODES, BULK, ReplayPacer, ThroughputMeter
+from schema_manager import DEFAULT_CACHE, SchemaManager
 
 
 logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
-delivered_records = 0
-
-
-@dataclass
-class Event(object):
-    id: str = ''
-    is_disabled: int = 0
-    is_reserved: int = 0
-    last_updated: int = 0
-    lat: float = 0.00
-    lon: float = 0.00
-    operator: str = ''
-    type: str = ''
-    geo7: str = ''
-    geo8: str = ''
-    geo9: str = ''
-    timestamp: str = ''
-
-
-def acked(err, msg):
-    """
-    Reports the failure or success of a message delivery.
-    Args:
-        err (KafkaError): The error that occurred on None on success.
-        msg (Message): The message that was produced or failed.
-    Note:
-        In the delivery report callback the Message.key() and Message.value()
-        will be the binary format as encoded by any configured Serializers and
-        not the same object that was passed to produce().
-        If you wish to pass the original object(s) for key and value to delivery
-        report callback we recommend a bound callback or lambda where you pass
-        the objects along.
-    """
-    global delivered_records
-    if err is not None:
-        logger.error(f"Failed to deliver message: {err}")
-    else:
-        delivered_records += 1
-        logger.info(f"Produced record to topic {msg.topic()} partition [{msg.partition()}] @ offset {msg.offset()}.")
+CHUNK_SIZE = 1 << 20
+delivery_stats = DeliveryStats("base.producer")
 
 
 def topic_exists(client, topic_name):
@@ -107,59 +72,140 @@ def create_topic(client, topic_name):
             logger.error(f"failed to create topic {topic_name}: {e}")
 
 
-def time_millis():
+def produce(producer, topic_name, value, partitioner, schemas, on_delivery=None):
     """
-    Creates keys for Kafka events
+    Produces an Avro event keyed by its vehicle, waiting for room in the producer queue when it is full
+    Args:
+        producer (Producer): the Kafka producer
+        topic_name (str): the topic to produce to
+        value (dict): the event
+        partitioner (Partitioner): the vehicle partitions of the producer's topics
+        schemas (SchemaManager): the schema ids of the producer's topics
+        on_delivery (function): the delivery callback, the producer's DeliveryStats by default
     """
-    return int(round(time.time() * 1000))
+    key_id, value_id = schemas.topic_ids(topic_name)
+    partition = partitioner.partition(topic_name, value['operator'], value['id'])
+    key = schemas.encode(key_id, {"operator": value['operator'], "id": value['id']})
+    value = schemas.encode(value_id, value)
+    while True:
+        try:
+            producer.produce(topic=topic_name, key=key, value=value,
+                             partition=partition, on_delivery=on_delivery or delivery_stats.acked)
+            break
+        except BufferError:
+            producer.poll(0.1)
+    producer.poll(0)
 
 
-def kafka_producer(topic_name, BROKER_URL, SCHEMA_REGISTRY_URL, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET_NAME):
+def create_producer(BROKER_URL, PRODUCER_PROFILE=DEFAULT_PROFILE):
     """
-    Kafka Avro Producer, produces events given schema
+    Creates the Kafka Producer of the location events, values are Avro encoded by the SchemaManager
+    Args:
+        PRODUCER_PROFILE (str): name of the producer_profiles settings
     """
-    # Avro schema
-    key_schema = avro.load(f"{Path(__file__).parents[0]}/schemas/key_schema.json")
-    value_schema = avro.load(f"{Path(__file__).parents[0]}/schemas/value_schema.json")
-    # Get a handle on s3
-    s3 = boto3.resource('s3', aws_access_key_id=AWS_ACCESS_KEY_ID, aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
-    # s3_object = s3.Object(bucket_name=S3_BUCKET_NAME, key=f'{OPERATOR}.txt')
-    s3_object = s3.Object(bucket_name=S3_BUCKET_NAME, key='Bird.txt')
-    streaming_body = s3_object.get()['Body']
-
-    broker_properties = {
+    broker_properties = producer_config({
         "bootstrap.servers": BROKER_URL,
-        "schema.registry.url": SCHEMA_REGISTRY_URL,
         "client.id": "base.producer",
-    }
+    }, PRODUCER_PROFILE)
 
-    producer = AvroProducer(broker_properties,
-                            default_key_schema=key_schema,
-                            default_value_schema=value_schema,
-                            )
+    return Producer(broker_properties)
 
-    keys = ['bike_id', 'is_disabled', 'is_reserved', 'last_updated', 'lat', 'lon', 'operator', 'vehicle_type']
-    while True:
-        try:
-            for ln in codecs.getreader('utf-8')(streaming_body):
-                # sl = ln.rstrip().split(",")
-                d = dict((x.strip(), y.strip())
-                         for x, y in (element.split(':')
-                                      for element in ln.split(', ')))
-                print(d)
-                if set(keys).issubset((d.keys())):
-                    producer.produce(topic=topic_name,
-                                     key={"timestamp": time_millis()},
-                                     value=asdict(Event(d['bike_id'], distutils.util.strtobool(d['is_disabled']), distutils.util.strtobool(d['is_reserved']),
-                                                        int(d['last_updated']), float(d['lat']), float(d['lon']),
-                                                        d['operator'], d['vehicle_type'])),
-                                     on_delivery=acked)
-                time.sleep(2)
-
-        except KeyboardInterrupt:
-            break
 
-    producer.flush(timeout=1)
+def operator_topic(key):
+    """
+    Returns the topic of a collector object, e.g. Bird.txt -> com.insight.project.bird.producer
+    Args:
+        key (str): the object key
+    """
+    return f"com.insight.project.{Path(key).stem.lower()}.producer"
+
+
+def kafka_producer(source, objects, BROKER_URL, SCHEMA_REGISTRY_URL, QUARANTINE_FILE=None, REPLAY_MODE=BULK, SPEEDUP=1.0,
+                   PRODUCER_PROFILE=DEFAULT_PROFILE, SCHEMA_CACHE=DEFAULT_CACHE):
+    """
+    Kafka Avro Producer, streams the objects one after the other and produces their events
+    Args:
+        source (LocalSource or S3Source): the object source
+        objects (list): (key, size) pairs of the objects to replay
+        REPLAY_MODE (str): bulk (unthrottled), realtime (paced by last_updated) or speedup
+        SPEEDUP (float): replay speed factor of the speedup mode
+        PRODUCER_PROFILE (str): name of the producer_profiles settings
+        SCHEMA_CACHE (str): the schema id cache file (schema_manager.py)
+    """
+    producer = create_producer(BROKER_URL, PRODUCER_PROFILE)
+    partitioner = Partitioner(producer)
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+
+    quarantine = open(QUARANTINE_FILE, 'ab') if QUARANTINE_FILE else None
+    parser = LineParser(quarantine)
+    pacer = ReplayPacer(REPLAY_MODE, SPEEDUP)
+    meter = ThroughputMeter(f"producer ({REPLAY_MODE})")
+    try:
+        for key, _ in objects:
+            topic_name = operator_topic(key)
+            for chunk in source.stream(key, CHUNK_SIZE):
+                for value in parser.feed(chunk):
+                    pacer.wait(value['last_updated'], producer.poll)
+                    produce(producer, topic_name, value, partitioner, schemas)
+                    meter.tick()
+            for value in parser.finish():
+                pacer.wait(value['last_updated'], producer.poll)
+                produce(producer, topic_name, value, partitioner, schemas)
+                meter.tick()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        logger.info(f"parsed {parser.parsed} records, {parser.malformed} malformed lines, "
+                    f"{parser.departed} departures skipped")
+        meter.summary()
+        if quarantine is not None:
+            quarantine.close()
+
+    producer.flush()
+    delivery_stats.close()
+    logger.info(f"schema cache: {schemas.stats}")
+
+
+# per worker process state of the parallel backfill
+worker = {}
+
+
+def init_worker(BROKER_URL, SCHEMA_REGISTRY_URL, source, QUARANTINE_FILE=None, PRODUCER_PROFILE=DEFAULT_PROFILE,
+                SCHEMA_CACHE=DEFAULT_CACHE):
+    """
+    Creates the producer owned by a backfill worker process, schema ids come from the cache warmed by main
+    """
+    worker['producer'] = create_producer(BROKER_URL, PRODUCER_PROFILE)
+    worker['partitioner'] = Partitioner(worker['producer'])
+    worker['schemas'] = SchemaManager(SCHEMA_REGISTRY_URL, SCHEMA_CACHE)
+    worker['source'] = source
+    worker['quarantine'] = open(f"{QUARANTINE_FILE}.{os.getpid()}", 'ab') if QUARANTINE_FILE else None
+
+
+def produce_range(byte_range):
+    """
+    Reads, parses and produces one byte range; returns once every event is
+    acknowledged so the range can be checkpointed
+    Args:
+        byte_range (ByteRange): the range to process
+    """
+    producer = worker['producer']
+    parser = LineParser(worker['quarantine'])
+    records = parser.feed(read_range(worker['source'], byte_range))
+    records.extend(parser.finish())
+    failed_before = delivery_stats.failed
+    topic_name = operator_topic(byte_range.key)
+    for value in records:
+        produce(producer, topic_name, value, worker['partitioner'], worker['schemas'])
+    producer.flush()
+    if worker['quarantine'] is not None:
+        worker['quarantine'].flush()
+    delivery_stats.maybe_report()
+    if delivery_stats.failed != failed_before:
+        raise RuntimeError(f"{delivery_stats.failed - failed_before} events were not delivered")
+    return {"parsed": parser.parsed, "malformed": parser.malformed, "departed": parser.departed}
 
 
 def main(args):
@@ -169,24 +215,47 @@ def main(args):
     BROKER_URL = args.bootstrap_servers
     # OPERATOR = "bird"
     OPERATOR = args.operator
-    # Topic name
-    TOPIC_NAME = f"com.insight.project.{OPERATOR}.producer"
 
     # SOURCE_FILE = f"/home/bison/Downloads/Data/Sample/{OPERATOR}.txt"
     # AWS S3
     S3_BUCKET_NAME = "insight.micromobility.sample.data"
     AWS_ACCESS_KEY_ID = "A***"
     AWS_SECRET_ACCESS_KEY = "V***"
+    SOURCE = args.source or f"s3://{S3_BUCKET_NAME}/"
+
+    source = open_source(SOURCE, args.s3_endpoint, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
+    objects = [(key, size) for key, size in source.list()
+               if OPERATOR is None or Path(key).stem.lower() == OPERATOR.lower()]
+    logger.info(f"{len(objects)} objects to replay from {SOURCE}")
 
     client = AdminClient({"bootstrap.servers": BROKER_URL})
 
-    exists = topic_exists(client, TOPIC_NAME)
-    logger.info(f"Topic {TOPIC_NAME} exists: {exists}")
+    for TOPIC_NAME in sorted(set(operator_topic(key) for key, _ in objects)):
+        exists = topic_exists(client, TOPIC_NAME)
+        logger.info(f"Topic {TOPIC_NAME} exists: {exists}")
+
+        if exists is False:
+            create_topic(client, TOPIC_NAME)
 
-    if exists is False:
-        create_topic(client, TOPIC_NAME)
+    # resolve the schema ids once, workers then start from the cache file
+    schemas = SchemaManager(SCHEMA_REGISTRY_URL, args.schema_cache)
+    for TOPIC_NAME in sorted(set(operator_topic(key) for key, _ in objects)):
+        schemas.topic_ids(TOPIC_NAME)
+    logger.info(f"schema cache: {schemas.stats}")
     try:
-        kafka_producer(TOPIC_NAME, BROKER_URL, SCHEMA_REGISTRY_URL, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET_NAME)
+        if args.workers > 1:
+            ranges = split_ranges(objects, args.range_mb * 2 ** 20)
+            meter = ThroughputMeter(f"backfill ({args.workers} workers)")
+            totals = run_parallel(ranges, produce_range, args.workers, Checkpoint(args.checkpoint),
+                                  init_worker, (BROKER_URL, SCHEMA_REGISTRY_URL, source, args.quarantine, args.profile,
+                                                args.schema_cache))
+            meter.tick(totals.get("parsed", 0))
+            logger.info(f"parsed {totals.get('parsed', 0)} records, {totals.get('malformed', 0)} malformed lines, "
+                        f"{totals.get('departed', 0)} departures skipped")
+            meter.summary()
+        else:
+            kafka_producer(source, objects, BROKER_URL, SCHEMA_REGISTRY_URL, args.quarantine, args.mode, args.speedup,
+                           args.profile, args.schema_cache)
     except KeyboardInterrupt as e:
         logger.error(e)
         logger.info("shutting down")
@@ -196,9 +265,32 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Kafka producer")
     parser.add_argument('-b', dest="bootstrap_servers", required=True,
                         help="Bootstrap broker(s) (host[:port])")
-    parser.add_argument('-o', dest="operator", required=True,
-                        help="Operator name")
+    parser.add_argument('-o', dest="operator", default=None,
+                        help="Operator name, every object of the source if omitted")
     parser.add_argument('-s', dest="schema_registry", required=True,
                         help="Schema Registry (http(s)://host[:port]")
+    parser.add_argument('-p', dest="profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="Producer profile (see producer_profiles.py), default keeps the librdkafka defaults")
+    parser.add_argument('--schema-cache', dest="schema_cache", default=DEFAULT_CACHE,
+                        help="Schema id cache file, lets the producer start without a reachable registry")
+    parser.add_argument('-q', dest="quarantine", default=None,
+                        help="File receiving malformed lines")
+    parser.add_argument('-m', dest="mode", choices=MODES, default=BULK,
+                        help="Replay mode: bulk (unthrottled), realtime (paced by last_updated) or speedup")
+    parser.add_argument('-x', dest="speedup", type=float, default=10.0,
+                        help="Replay speed factor of the speedup mode")
+    parser.add_argument('-i', dest="source", default=None,
+                        help="Input objects: s3://bucket/prefix or a local directory or file")
+    parser.add_argument('--s3-endpoint', dest="s3_endpoint", default=None,
+                        help="S3 endpoint URL, e.g. a local S3 stand-in")
+    parser.add_argument('-w', dest="workers", type=int, default=1,
+                        help="Backfill worker processes; above 1 objects are read as parallel byte ranges (bulk mode)")
+    parser.add_argument('--range-mb', dest="range_mb", type=int, default=64,
+                        help="Size of a byte range of the parallel backfill (MB)")
+    parser.add_argument('-k', dest="checkpoint", default=None,
+                        help="Checkpoint file of the parallel backfill, finished ranges are skipped on restart")
 
-    main(parser.parse_args())
+    args = parser.parse_args()
+    if args.workers > 1 and args.mode != BULK:
+        parser.error("the parallel backfill only runs in bulk mode")
+    main(args)
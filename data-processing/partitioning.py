@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Vehicle partitioning
+
+Every stage keys location events by operator and vehicle id and sends them
+to the partition murmur2(b"{operator}:{id}") % partitions, the partitioner
+of the Java client, librdkafka's murmur2_random and aiokafka (Faust). Avro
+keys embed a schema id in their bytes, so the Avro stages pass the partition
+explicitly instead of letting the client hash the serialized key. All events
+of a vehicle thus land in the same partition of every topic that has the
+same number of partitions, in order, and per-vehicle state needs no shuffle.
+A topic missing from the cluster metadata (not created yet, broker
+unreachable) gets UNASSIGNED, i.e. the client's own partitioner, with a
+warning, and its metadata is read again after a retry interval.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import logging
+import time
+from functools import lru_cache
+from confluent_kafka import KafkaException
+
+logger = logging.getLogger(__name__)
+
+# RD_KAFKA_PARTITION_UA, lets the client's partitioner pick the partition
+UNASSIGNED = -1
+
+
+def murmur2(data):
+    """
+    Returns the murmur2 hash of the Java Kafka client (Utils.murmur2)
+    Args:
+        data (bytes): the key bytes
+    """
+    length = len(data)
+    m = 0x5BD1E995
+    h = (0x9747B28C ^ length) & 0xFFFFFFFF
+    for i in range(0, length - length % 4, 4):
+        k = int.from_bytes(data[i:i + 4], 'little')
+        k = (k * m) & 0xFFFFFFFF
+        k ^= k >> 24
+        k = (k * m) & 0xFFFFFFFF
+        h = ((h * m) & 0xFFFFFFFF) ^ k
+    tail = length % 4
+    if tail:
+        h ^= int.from_bytes(data[length - tail:], 'little')
+        h = (h * m) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * m) & 0xFFFFFFFF
+    h ^= h >> 15
+    return h
+
+
+def vehicle_key(operator, vehicle_id):
+    """
+    Returns the string key of a vehicle
+    Args:
+        operator (str): the operator name
+        vehicle_id (str): the vehicle id
+    """
+    return f"{(operator or '').lower()}:{vehicle_id}"
+
+
+@lru_cache(maxsize=1 << 18)
+def partition_for(key, partitions):
+    """
+    Returns the partition of a key, fleets are small enough to cache every vehicle
+    Args:
+        key (str): the vehicle key
+        partitions (int): number of partitions of the topic
+    """
+    return (murmur2(key.encode()) & 0x7FFFFFFF) % partitions
+
+
+class Partitioner(object):
+    """
+    Vehicle partitions of the topics a producer writes to
+    Args:
+        client (Producer): a Kafka producer or admin client, used to read the partition counts
+        retry_interval (float): seconds before the metadata of a topic missing from the cluster is read again
+    """
+
+    def __init__(self, client, retry_interval=30.0):
+        self.client = client
+        self.retry_interval = retry_interval
+        self.partitions = {}
+        self.retries = {}
+
+    def partition(self, topic, operator, vehicle_id):
+        """
+        Returns the partition of a vehicle in a topic, UNASSIGNED while the topic has no partition metadata
+        Args:
+            topic (str): the topic name
+            operator (str): the operator name
+            vehicle_id (str): the vehicle id
+        """
+        count = self.partitions.get(topic)
+        if count is None:
+            count = self._refresh(topic)
+            if count is None:
+                return UNASSIGNED
+        return partition_for(vehicle_key(operator, vehicle_id), count)
+
+    def _refresh(self, topic):
+        now = time.monotonic()
+        if now < self.retries.get(topic, 0.0):
+            return None
+        try:
+            metadata = self.client.list_topics(topic, timeout=10).topics.get(topic)
+        except KafkaException as e:
+            logger.error(f"metadata request for topic {topic} failed: {e}")
+            metadata = None
+        count = len(metadata.partitions) if metadata is not None and metadata.error is None else 0
+        if not count:
+            logger.warning(f"topic {topic} has no partition metadata, events go to the client's partitioner "
+                           f"for {self.retry_interval:.0f}s")
+            self.retries[topic] = now + self.retry_interval
+            return None
+        self.retries.pop(topic, None)
+        self.partitions[topic] = count
+        return count
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Producer profiles
+
+Named librdkafka producer settings shared by every producer of the pipeline.
+benchmark_producer.py measures them against a broker.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+PROFILES = {
+    # librdkafka defaults
+    "default": {},
+    # small requests sent as soon as possible
+    "latency": {
+        "linger.ms": 0,
+        "acks": "1",
+        "compression.type": "none",
+        "batch.num.messages": 1000,
+    },
+    # a few milliseconds of batching and cheap compression
+    "balanced": {
+        "linger.ms": 20,
+        "acks": "all",
+        "enable.idempotence": True,
+        "compression.type": "lz4",
+        "batch.size": 256 * 1024,
+        "batch.num.messages": 20000,
+    },
+    # large compressed batches and a deep queue for backfills
+    "bulk": {
+        "linger.ms": 100,
+        "acks": "all",
+        "enable.idempotence": True,
+        "compression.type": "zstd",
+        "batch.size": 1024 * 1024,
+        "batch.num.messages": 100000,
+        "queue.buffering.max.messages": 1000000,
+        "queue.buffering.max.kbytes": 1024 * 1024,
+    },
+}
+# the settings the producers had before profiles existed; the tuned profiles are opt-in
+DEFAULT_PROFILE = "default"
+
+
+def producer_config(base, profile=DEFAULT_PROFILE):
+    """
+    Returns a producer configuration with the settings of a profile
+    Args:
+        base (dict): connection settings, e.g. bootstrap.servers and client.id
+        profile (str): a key of PROFILES
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"unknown producer profile {profile}, expected one of {', '.join(PROFILES)}")
+    config = dict(base)
+    config.update(PROFILES[profile])
+    return config
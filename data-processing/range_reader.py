@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Ranged object reader
+
+Lists the collector objects of an S3 bucket (or a local directory), splits
+them into line-aligned byte ranges and processes the ranges in a process
+pool, checkpointing finished ranges so an interrupted backfill resumes.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+OVERHANG = 64 * 1024
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    key: str
+    start: int
+    end: int
+    size: int
+
+    @property
+    def id(self):
+        return f"{self.key}:{self.start}:{self.end}"
+
+
+class LocalSource(object):
+    """
+    Objects of a local directory, or a single local file
+    Args:
+        root (str): directory or file path
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def list(self):
+        if self.root.is_file():
+            return [(self.root.name, self.root.stat().st_size)]
+        return [(str(p.relative_to(self.root)), p.stat().st_size)
+                for p in sorted(self.root.rglob('*')) if p.is_file()]
+
+    def _path(self, key):
+        return self.root if self.root.is_file() else self.root / key
+
+    def read(self, key, start, end):
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def stream(self, key, chunk_size):
+        with open(self._path(key), 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+
+class S3Source(object):
+    """
+    Objects of an S3 bucket under a prefix; endpoint_url points to a local S3 stand-in
+    Args:
+        bucket (str): the bucket name
+        prefix (str): key prefix of the objects
+        endpoint_url (str): S3 endpoint, None for AWS
+        aws_access_key_id (str): AWS credentials, None for the default credential chain
+        aws_secret_access_key (str): AWS credentials, None for the default credential chain
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, aws_access_key_id=None, aws_secret_access_key=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self._client = None
+
+    def __getstate__(self):
+        # boto3 clients are not picklable, each worker process opens its own
+        state = self.__dict__.copy()
+        state['_client'] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url,
+                                        aws_access_key_id=self.aws_access_key_id,
+                                        aws_secret_access_key=self.aws_secret_access_key)
+        return self._client
+
+    def list(self):
+        objects = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+            objects.extend((o['Key'], o['Size']) for o in page.get('Contents', []))
+        return objects
+
+    def read(self, key, start, end):
+        if end <= start:
+            return b''
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+
+    def stream(self, key, chunk_size):
+        body = self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        yield from body.iter_chunks(chunk_size)
+
+
+def open_source(url, endpoint_url=None, aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Returns the source of an s3://bucket/prefix URL or a local path
+    """
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        return S3Source(bucket, prefix, endpoint_url, aws_access_key_id, aws_secret_access_key)
+    return LocalSource(url)
+
+
+def split_ranges(objects, range_size):
+    """
+    Splits objects into byte ranges of at most range_size bytes
+    Args:
+        objects (list): (key, size) pairs
+        range_size (int): target size of a range in bytes
+    """
+    ranges = []
+    for key, size in objects:
+        for start in range(0, size, range_size):
+            ranges.append(ByteRange(key, start, min(start + range_size, size), size))
+    return ranges
+
+
+def read_range(source, byte_range, overhang=OVERHANG):
+    """
+    Returns the lines that start inside a byte range; a line crossing the end of
+    the range is completed from the next bytes, a line crossing its start belongs
+    to the previous range
+    Args:
+        source (LocalSource or S3Source): the object source
+        byte_range (ByteRange): the range to read
+        overhang (int): bytes read at a time past the end of the range
+    """
+    key, start, end, size = byte_range.key, byte_range.start, byte_range.end, byte_range.size
+    data = source.read(key, max(start - 1, 0), end)
+    if start > 0:
+        newline = data.find(b'\n')
+        if newline < 0:
+            return b''
+        data = data[newline + 1:]
+        if not data:
+            return b''
+    pos = end
+    while not data.endswith(b'\n') and pos < size:
+        more = source.read(key, pos, min(pos + overhang, size))
+        newline = more.find(b'\n')
+        if newline >= 0:
+            return data + more[:newline + 1]
+        data += more
+        pos += len(more)
+    return data
+
+
+class Checkpoint(object):
+    """
+    Append-only record of finished ranges
+    Args:
+        path (str): checkpoint file, None to disable checkpointing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self.done.add(json.loads(line)['range'])
+
+    def is_done(self, byte_range):
+        return byte_range.id in self.done
+
+    def mark(self, byte_range, **info):
+        """
+        Records a finished range durably
+        """
+        self.done.add(byte_range.id)
+        if not self.path:
+            return
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(dict(info, range=byte_range.id)) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_parallel(ranges, work, workers, checkpoint, initializer=None, initargs=()):
+    """
+    Runs work(byte_range) for every unfinished range in a process pool
+    Args:
+        ranges (list): ByteRange objects
+        work (callable): module level function processing one range, returns a dict of counters
+        workers (int): number of worker processes
+        checkpoint (Checkpoint): finished ranges, updated as ranges complete
+        initializer (callable): called once in every worker, e.g. to create its producer
+        initargs (tuple): arguments of initializer
+    """
+    pending = [r for r in ranges if not checkpoint.is_done(r)]
+    logger.info(f"{len(pending)} of {len(ranges)} ranges to process with {workers} workers")
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        futures = {pool.submit(work, r): r for r in pending}
+        for future in as_completed(futures):
+            byte_range = futures[future]
+            try:
+                counters = future.result()
+            except Exception as e:
+                logger.error(f"range {byte_range.id} failed: {e}")
+                continue
+            checkpoint.mark(byte_range, **counters)
+            for name, value in counters.items():
+                totals[name] = totals.get(name, 0) + value
+    return totals
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Replay pacing
+
+Paces a replay of recorded events: unthrottled bulk load, time-faithful
+replay following each record's last_updated, or replay N times faster.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BULK = 'bulk'
+REALTIME = 'realtime'
+SPEEDUP = 'speedup'
+MODES = (BULK, REALTIME, SPEEDUP)
+
+
+class ReplayPacer(object):
+    """
+    Decides when a recorded event is due
+    Args:
+        mode (str): one of bulk, realtime and speedup
+        speedup (float): replay speed factor in speedup mode
+    """
+
+    def __init__(self, mode=BULK, speedup=1.0):
+        if mode not in MODES:
+            raise ValueError(f"unknown replay mode {mode}")
+        if mode == SPEEDUP and speedup <= 0:
+            raise ValueError("speedup must be positive")
+        self.mode = mode
+        self.speedup = speedup if mode == SPEEDUP else 1.0
+        self.first_event = None
+        self.first_wall = None
+
+    def delay(self, last_updated):
+        """
+        Returns the seconds to wait before an event recorded at last_updated is due
+        Args:
+            last_updated (int): epoch time of the event
+        """
+        if self.mode == BULK:
+            return 0.0
+        if self.first_event is None:
+            self.first_event = last_updated
+            self.first_wall = time.monotonic()
+            return 0.0
+        due = self.first_wall + (last_updated - self.first_event) / self.speedup
+        return due - time.monotonic()
+
+    def wait(self, last_updated, sleep=time.sleep):
+        """
+        Blocks until an event is due
+        Args:
+            last_updated (int): epoch time of the event
+            sleep (callable): waits for a number of seconds, e.g. Producer.poll to keep
+                serving delivery callbacks while waiting
+        """
+        delay = self.delay(last_updated)
+        while delay > 0:
+            sleep(delay)
+            delay = self.delay(last_updated)
+
+
+class ThroughputMeter(object):
+    """
+    Counts records and logs the achieved records/sec
+    Args:
+        name (str): label of the log lines
+        report_interval (float): seconds between two progress lines
+    """
+
+    def __init__(self, name, report_interval=10.0):
+        self.name = name
+        self.report_interval = report_interval
+        self.count = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.last_count = 0
+
+    def tick(self, n=1):
+        """
+        Counts n records and logs progress when the report interval expires
+        """
+        self.count += n
+        now = time.monotonic()
+        if now - self.last_report >= self.report_interval:
+            rate = (self.count - self.last_count) / (now - self.last_report)
+            logger.info(f"{self.name}: {self.count} records, {rate:,.0f} records/s")
+            self.last_report = now
+            self.last_count = self.count
+
+    def summary(self):
+        """
+        Logs and returns the average records/sec since the start
+        """
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        rate = self.count / elapsed
+        logger.info(f"{self.name}: {self.count} records in {elapsed:.1f} s, {rate:,.0f} records/s")
+        return rate
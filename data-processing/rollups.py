@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Windowed KPI rollups
+
+Incremental tumbling-window aggregates of location events keyed by operator,
+vehicle type, geohash level/cell, is_disabled, is_reserved and window.
+Distinct vehicles are HyperLogLog sketches kept at the finest level only;
+coarser levels are merged from them by geohash prefix when a window closes.
+Closed windows are emitted as small rollup records carrying their sketch,
+so rollups of any window or level combination merge without raw events.
+Several workers must not aggregate the same key: events are routed to the
+rollups by their cell at the coarsest level (route), so one worker owns a
+cell and every finer cell inside it.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import datetime
+from hyperloglog import DEFAULT_PRECISION, HyperLogLog
+
+ROLLUP_LEVELS = (6, 7, 8)
+
+
+class TumblingRollup(object):
+    """
+    Tumbling-window event and distinct vehicle counts
+    Args:
+        window (int): window length in seconds
+        levels (tuple): geohash levels aggregated
+        lateness (int): seconds of event time a window stays open after its end
+        precision (int): precision of the distinct vehicle sketches
+    """
+
+    def __init__(self, window=3600, levels=ROLLUP_LEVELS, lateness=300, precision=DEFAULT_PRECISION):
+        self.window = window
+        self.levels = levels
+        self.finest = max(levels)
+        self.coarsest = min(levels)
+        self.lateness = lateness
+        self.precision = precision
+        self.aggregates = {}
+        self.watermark = 0
+        self.closed_before = 0
+        self.late = 0
+
+    def route(self, cell):
+        """
+        Returns the cell events are routed by, the coarsest level cell containing a finest level cell
+        Args:
+            cell (str): geohash cell of the finest rollup level
+        """
+        return cell[:self.coarsest]
+
+    def add(self, operator, v_type, cell, is_disabled, is_reserved, vehicle_id, ts):
+        """
+        Adds an event to the aggregates of its window
+        Args:
+            operator (str): the operator name
+            v_type (str): the vehicle type
+            cell (str): geohash cell of the finest rollup level
+            is_disabled (int): the event is_disabled flag
+            is_reserved (int): the event is_reserved flag
+            vehicle_id (str): the vehicle id
+            ts (int): event time (last_updated)
+        """
+        if ts > self.watermark:
+            self.watermark = ts
+        start = ts - ts % self.window
+        if start < self.closed_before:
+            self.late += 1
+            return
+        key = (start, operator, v_type, cell, is_disabled, is_reserved)
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+            aggregate = self.aggregates[key] = [0, HyperLogLog(self.precision)]
+        aggregate[0] += 1
+        aggregate[1].add(vehicle_id)
+
+    def flush(self):
+        """
+        Removes and returns the rollup records of every window closed by the watermark
+        """
+        # a window [start, start + window) closes once the watermark passes its end plus the lateness
+        closed_before = self.watermark - self.lateness
+        closed_before -= closed_before % self.window
+        if closed_before <= self.closed_before:
+            return []
+        self.closed_before = closed_before
+        closed = [(k, self.aggregates.pop(k)) for k in [k for k in self.aggregates if k[0] < closed_before]]
+        records = []
+        for level in self.levels:
+            merged = {}
+            for (start, operator, v_type, cell, is_disabled, is_reserved), (events, sketch) in closed:
+                key = (start, operator, v_type, cell[:level], is_disabled, is_reserved)
+                if key in merged:
+                    merged[key][0] += events
+                    merged[key][1].update(sketch)
+                else:
+                    merged[key] = [events, sketch.copy()]
+            for (start, operator, v_type, cell, is_disabled, is_reserved), (events, sketch) in merged.items():
+                records.append({
+                    "window_start": start,
+                    "window_end": start + self.window,
+                    "timestamp": datetime.datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S'),
+                    "operator": operator,
+                    "type": v_type,
+                    "level": level,
+                    "geo": cell,
+                    "is_disabled": is_disabled,
+                    "is_reserved": is_reserved,
+                    "events": events,
+                    "vehicles": round(sketch.count()),
+                    "sketch": sketch.to_text(),
+                })
+        return records
+
+
+def combine(records, level, fields=("operator",)):
+    """
+    Merges persisted rollup records of any windows into distinct vehicle counts per coarser cell
+    Args:
+        records (iterable): rollup records with a sketch, of level `level` or finer
+        level (int): geohash level of the result cells
+        fields (tuple): other record fields the result is grouped by
+    """
+    merged = {}
+    for record in records:
+        if record["level"] < level or not record.get("sketch"):
+            continue
+        key = (record["geo"][:level],) + tuple(record[f] for f in fields)
+        sketch = HyperLogLog.from_text(record["sketch"])
+        if key in merged:
+            merged[key].update(sketch)
+        else:
+            merged[key] = sketch
+    return {key: round(sketch.count()) for key, sketch in merged.items()}
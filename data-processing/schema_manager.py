@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Schema manager
+
+Resolves Avro schema ids through the schema registry once and keeps the
+subject/id/schema mapping in a local cache file, so workers start and encode
+with no registry reachable and the registry stays out of the hot path.
+Messages use the Confluent wire format (magic byte, 4-byte schema id,
+schemaless Avro body), readable by AvroProducer/AvroConsumer, Kafka Connect
+and the registry tooling. The cache records the registry it was filled
+from; a cache of another registry is ignored, since ids are only unique
+within one registry. Writers merge the file under a lock, so stages and
+backfill workers that register different subjects at once keep each other's
+entries.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import fcntl
+import io
+import json
+import logging
+import os
+import struct
+import time
+from pathlib import Path
+import fastavro
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = f"{Path(__file__).parents[0]}/schemas"
+DEFAULT_CACHE = f"{SCHEMA_DIR}/registry_cache.json"
+MAGIC_BYTE = 0
+HEADER = struct.Struct(">bI")
+# seconds before the registry is asked again for an id it failed to resolve
+RETRY_INTERVAL = 30.0
+
+
+def canonical(schema):
+    """
+    Returns the canonical text of a schema used to compare it with the cache
+    Args:
+        schema (dict): the parsed schema JSON
+    """
+    return json.dumps(schema, sort_keys=True, separators=(',', ':'))
+
+
+class SchemaUnavailable(KeyError):
+    """
+    Raised for a schema id that neither the cache nor the registry can resolve; a KeyError so the stages
+    drop the message as unreadable instead of stopping
+    """
+
+
+class SchemaManager(object):
+    """
+    Registry client with a persistent subject and id cache
+    Args:
+        registry_url (str): Schema Registry (http(s)://host[:port]), None to work from the cache only
+        cache_path (str): the cache file, shared by every stage on a host
+    """
+
+    def __init__(self, registry_url=None, cache_path=DEFAULT_CACHE):
+        self.registry_url = registry_url
+        self.cache_path = cache_path
+        self._client = None
+        self.subjects = {}
+        self.schemas = {}
+        self.parsed = {}
+        self.topics = {}
+        self.failed = {}
+        self.stats = {"hits": 0, "misses": 0, "errors": 0}
+        cache = self._read()
+        if cache is not None:
+            self.subjects, self.schemas = cache
+
+    @property
+    def client(self):
+        # the registry is only contacted on a cache miss
+        if self._client is None:
+            from confluent_kafka.avro import CachedSchemaRegistryClient
+            self._client = CachedSchemaRegistryClient({"url": self.registry_url})
+        return self._client
+
+    def _read(self):
+        # the subjects and schemas of the cache file, None if there is none or it belongs to another registry
+        if not os.path.exists(self.cache_path):
+            return None
+        with open(self.cache_path) as file:
+            cache = json.load(file)
+        cached_url = cache.get("registry_url")
+        if self.registry_url is not None and cached_url != self.registry_url:
+            logger.warning(f"ignoring the schema cache {self.cache_path} of registry {cached_url}")
+            return None
+        return cache.get("subjects", {}), {int(i): s for i, s in cache.get("schemas", {}).items()}
+
+    def _save(self):
+        with open(f"{self.cache_path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another process may have saved since this one loaded the file, keep its entries
+            cache = self._read()
+            if cache is not None:
+                subjects, schemas = cache
+                for subject, entry in subjects.items():
+                    self.subjects.setdefault(subject, entry)
+                for schema_id, text in schemas.items():
+                    self.schemas.setdefault(schema_id, text)
+            tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as file:
+                json.dump({"registry_url": self.registry_url, "subjects": self.subjects,
+                           "schemas": {str(i): s for i, s in self.schemas.items()}}, file, indent=2)
+            os.replace(tmp, self.cache_path)
+
+    def register(self, subject, schema_file):
+        """
+        Returns the schema id of a subject, from the cache or by registering the schema
+        Args:
+            subject (str): the registry subject, e.g. {topic}-value
+            schema_file (str): file name of the schema in the schemas directory
+        """
+        with open(f"{SCHEMA_DIR}/{schema_file}") as file:
+            text = canonical(json.load(file))
+        cached = self.subjects.get(subject)
+        if cached is not None and cached["schema"] == text:
+            self.stats["hits"] += 1
+            schema_id = cached["id"]
+        else:
+            self.stats["misses"] += 1
+            if self.registry_url is None:
+                raise KeyError(f"schema of {subject} is not cached and no registry is configured")
+            from confluent_kafka import avro
+            try:
+                schema_id = self.client.register(subject, avro.loads(text))
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            logger.info(f"schema of {subject} registered as {schema_id}")
+            self.subjects[subject] = {"id": schema_id, "schema": text}
+            self.schemas[schema_id] = text
+            self._save()
+        self._parse(schema_id)
+        return schema_id
+
+    def topic_ids(self, topic, key_schema="key_schema.json", value_schema="value_schema.json"):
+        """
+        Returns the key and value schema ids of a topic (subjects {topic}-key and {topic}-value)
+        Args:
+            topic (str): the topic name
+            key_schema (str): file name of the key schema
+            value_schema (str): file name of the value schema
+        """
+        ids = self.topics.get(topic)
+        if ids is None:
+            ids = self.topics[topic] = (self.register(f"{topic}-key", key_schema),
+                                        self.register(f"{topic}-value", value_schema))
+        return ids
+
+    def schema(self, schema_id):
+        """
+        Returns the parsed schema of an id, from the cache or the registry; raises SchemaUnavailable when
+        neither has it, and does not ask the registry again for that id for RETRY_INTERVAL seconds
+        Args:
+            schema_id (int): the registry schema id
+        """
+        parsed = self.parsed.get(schema_id)
+        if parsed is not None:
+            return parsed
+        if schema_id in self.schemas:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            if self.registry_url is None:
+                raise SchemaUnavailable(f"schema {schema_id} is not cached and no registry is configured")
+            if time.monotonic() < self.failed.get(schema_id, 0.0):
+                raise SchemaUnavailable(f"schema {schema_id} is not cached and the registry failed to return it")
+            try:
+                schema = self.client.get_by_id(schema_id)
+                if schema is None:
+                    raise KeyError("unknown schema id")
+                self.schemas[schema_id] = canonical(json.loads(str(schema)))
+            except Exception as e:
+                # registry outages (ClientError, requests errors) must not stop the stage
+                self.stats["errors"] += 1
+                self.failed[schema_id] = time.monotonic() + RETRY_INTERVAL
+                logger.error(f"schema {schema_id} could not be fetched from the registry: {e}")
+                raise SchemaUnavailable(f"schema {schema_id} is not cached and the registry failed to return it")
+            self.failed.pop(schema_id, None)
+            self._save()
+        return self._parse(schema_id)
+
+    def _parse(self, schema_id):
+        if schema_id not in self.parsed:
+            self.parsed[schema_id] = fastavro.parse_schema(json.loads(self.schemas[schema_id]))
+        return self.parsed[schema_id]
+
+    def encode(self, schema_id, record):
+        """
+        Encodes a record in the Confluent wire format
+        Args:
+            schema_id (int): an id returned by register
+            record (dict): the record
+        """
+        buffer = io.BytesIO()
+        buffer.write(HEADER.pack(MAGIC_BYTE, schema_id))
+        fastavro.schemaless_writer(buffer, self.parsed[schema_id], record)
+        return buffer.getvalue()
+
+    def decode(self, data):
+        """
+        Decodes a message in the Confluent wire format
+        Args:
+            data (bytes): the message key or value
+        """
+        if data is None or len(data) <= HEADER.size:
+            raise ValueError("message is too short for the wire format")
+        magic, schema_id = HEADER.unpack_from(data)
+        if magic != MAGIC_BYTE:
+            raise ValueError(f"message does not start with the magic byte: {magic}")
+        return fastavro.schemaless_reader(io.BytesIO(data[HEADER.size:]), self.schema(schema_id))
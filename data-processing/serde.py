@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Message codecs
+
+Interchangeable encoders of the JSON-side topics (.converter, .streaming):
+JSON text, schemaless binary Avro against schemas/value_schema.json and
+MessagePack. Every stage selects one by name (--codec); producers and
+consumers of a topic have to agree on it. fastavro and msgpack are imported
+only when their codec is selected.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import io
+import json
+from pathlib import Path
+
+JSON = "json"
+AVRO = "avro"
+MSGPACK = "msgpack"
+CODECS = (JSON, AVRO, MSGPACK)
+DEFAULT_CODEC = JSON
+DEFAULT_SCHEMA = f"{Path(__file__).parents[0]}/schemas/value_schema.json"
+
+
+class JsonCodec(object):
+    """
+    Compact JSON text
+    """
+    name = JSON
+
+    def encode(self, value):
+        return json.dumps(value, separators=(',', ':')).encode()
+
+    def decode(self, data, record_type=None):
+        value = json.loads(data)
+        return value if record_type is None else record_type(**value)
+
+
+class AvroCodec(object):
+    """
+    Schemaless binary Avro, fields are written in schema order without names
+    Args:
+        schema_path (str): the Avro schema of the values
+    """
+    name = AVRO
+
+    def __init__(self, schema_path=DEFAULT_SCHEMA):
+        import fastavro
+        with open(schema_path) as file:
+            self.schema = fastavro.parse_schema(json.load(file))
+        self.field_names = [f['name'] for f in self.schema['fields']]
+        self._write = fastavro.schemaless_writer
+        self._read = fastavro.schemaless_reader
+
+    def encode(self, value):
+        buffer = io.BytesIO()
+        self._write(buffer, self.schema, value)
+        return buffer.getvalue()
+
+    def decode(self, data, record_type=None):
+        value = self._read(io.BytesIO(data), self.schema)
+        return value if record_type is None else record_type(**value)
+
+
+class MsgpackCodec(object):
+    """
+    MessagePack, schemaless and self-describing like JSON but binary
+    """
+    name = MSGPACK
+
+    def __init__(self):
+        import msgpack
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def encode(self, value):
+        return self._packb(value, use_bin_type=True)
+
+    def decode(self, data, record_type=None):
+        value = self._unpackb(data, raw=False)
+        return value if record_type is None else record_type(**value)
+
+
+def get_codec(name=DEFAULT_CODEC, schema_path=DEFAULT_SCHEMA):
+    """
+    Returns the codec of a name
+    Args:
+        name (str): json, avro or msgpack
+        schema_path (str): the Avro schema of the values, used by the avro codec only
+    """
+    if name == JSON:
+        return JsonCodec()
+    if name == AVRO:
+        return AvroCodec(schema_path)
+    if name == MSGPACK:
+        return MsgpackCodec()
+    raise ValueError(f"unknown codec {name}, expected one of {', '.join(CODECS)}")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Faust Streamer
- it streams every single event and add/change some attributes
+ it streams events in micro-batches and add/change some attributes
+ one app serves every operator; more worker processes share the partitions
 """
 __author__ = 'Ali Rahim-Taleqani'
 __copyright__ = 'Copyright 2020, The Insight Data Engineering'
@@ -11,20 +12,35 @@ __email__ = 'ali.rahim.taleani@gmail.com'
 __status__ = 'Development'
 
 import argparse
+import asyncio
 from dataclasses import dataclass
 import faust
-import geohash
-import datetime
 import logging.config
+from typing import List
+from dedup import StationaryFilter
+from enrichment import GEOHASH_LEVELS, event_error, event_timestamp, geohashes_batch, timestamps_batch
 from faust import Worker
+from faust.serializers.codecs import Codec, register
+from idle_time import IDLE_BUCKETS_MIN, IdleTracker
+from partitioning import vehicle_key
+from rollups import ROLLUP_LEVELS, TumblingRollup
+from serde import CODECS, DEFAULT_CODEC, get_codec
+from zone_index import ZoneIndex
 
 
 logging.config.fileConfig('logging.ini', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+INCOMING_PATTERN = r"^com\.insight\.project\.[^.]+\.converter$"
+ROLLUP_TOPIC = "com.insight.project.rollups.streaming"
+ROLLUP_INPUT_TOPIC = "com.insight.project.rollup_input.streaming"
+IDLE_HISTOGRAM_TOPIC = "com.insight.project.idle.streaming"
+IDLE_TOP_TOPIC = "com.insight.project.idle_top.streaming"
 
+
+# no serializer of its own: Faust prefers a model's serializer to the topic's, and the topics carry the --codec one
 @dataclass
-class LocationEvent(faust.Record, serializer="json"):
+class LocationEvent(faust.Record, include_metadata=False):
     id: str
     is_disabled: int
     is_reserved: int
@@ -37,40 +53,220 @@ class LocationEvent(faust.Record, serializer="json"):
     geo8: str
     geo9: str
     timestamp: str
+    geo6: str = None
+    zone: str = None
+
+
+# rollups and idle statistics stay JSON whatever --codec says, converter_out -r reads them as JSON
+@dataclass
+class RollupInput(faust.Record, serializer="json"):
+    operator: str
+    type: str
+    cell: str
+    is_disabled: int
+    is_reserved: int
+    id: str
+    last_updated: int
+
+
+@dataclass
+class RollupEvent(faust.Record, serializer="json"):
+    window_start: int
+    window_end: int
+    timestamp: str
+    operator: str
+    type: str
+    level: int
+    geo: str
+    is_disabled: int
+    is_reserved: int
+    events: int
+    vehicles: int
+    sketch: str = None
+
+
+@dataclass
+class IdleHistogram(faust.Record, serializer="json"):
+    timestamp: str
+    operator: str
+    level: int
+    geo: str
+    bounds_min: List[int]
+    counts: List[int]
 
 
-def attribute_convertor(e):
+@dataclass
+class IdleVehicle(faust.Record, serializer="json"):
+    timestamp: str
+    rank: int
+    operator: str
+    id: str
+    geo: str
+    idle_seconds: int
+
+
+def valid_events(batch):
+    """
+    Returns the events of a batch that can be enriched and logs the others, so that one malformed
+    event does not fail the vectorized pass and the whole micro-batch with it
+    Args:
+        batch (list): Faust stream events
+    """
+    valid = []
+    for e in batch:
+        error = event_error(e.asdict())
+        if error is None:
+            valid.append(e)
+        else:
+            logger.error(f"Dropping event of {e.operator}:{e.id}: {error}")
+    return valid
+
+
+def batch_attribute_convertor(batch, zones=None):
+    """
+    Extracts and add geohash and timestamp to a batch of events with one vectorized geohash pass
+    Args:
+        batch (list): Faust stream events
+        zones (ZoneIndex): if given, the zone of every event is added as well
+    """
+    levels = geohashes_batch([float(e.lat) for e in batch], [float(e.lon) for e in batch])
+    timestamps = timestamps_batch([int(e.last_updated) for e in batch])
+    for i, e in enumerate(batch):
+        for level, codes in levels.items():
+            setattr(e, level, codes[i])
+        e.timestamp = timestamps[i]
+        if zones is not None:
+            e.zone = zones.lookup(e.geo9, e.lat, e.lon)
+    return batch
+
+
+def faust_codec(name):
     """
-    Extracts and add geohash and timestamp to an event
+    Registers a serde codec with Faust and returns the name topics refer to it by
     Args:
-        e (Fasut event): a Faust stream event
+        name (str): json, avro or msgpack
     """
-    e.geo7 = geohash.encode(float(e.lat), float(e.lon), 7)
-    e.geo8 = geohash.encode(float(e.lat), float(e.lon), 8)
-    e.geo9 = geohash.encode(float(e.lat), float(e.lon), 9)
-    e.timestamp = datetime.datetime.fromtimestamp(int(e.last_updated)).strftime('%Y-%m-%d %H:%M:%S')
-    return e
+    codec = get_codec(name)
+
+    class SerdeCodec(Codec):
+        def _dumps(self, obj):
+            return codec.encode(obj)
+
+        def _loads(self, s):
+            return codec.decode(s)
+
+    register(f"serde-{name}", SerdeCodec())
+    return f"serde-{name}"
+
+
+def outgoing_topic_name(operator):
+    """
+    Returns the streaming topic of an operator
+    Args:
+        operator (str): the operator name of an event
+    """
+    return f"com.insight.project.{(operator or 'unknown').lower()}.streaming"
 
 
 def main(args):
     STREAMER_NAME = "main.streamer"
     # BROKER_URL = "kafka://localhost:9092"
-    BROKER_URL = args.bootstrap_seervers
-    # OPERATOR = "lyft"
-    OPERATOR = args.operator
+    BROKER_URL = args.bootstrap_servers
+    # OPERATORS = ["lyft", "bird"], every operator's converter topic if empty
+    OPERATORS = args.operators
+
+    # every worker process started with the same STREAMER_NAME joins one consumer group
+    app = faust.App(STREAMER_NAME, broker=BROKER_URL, web_port=args.web_port)
+    # events are decoded by the selected codec straight into LocationEvent records
+    serializer = faust_codec(args.codec)
+
+    if OPERATORS:
+        incoming_topic = app.topic(*(f"com.insight.project.{OPERATOR}.converter" for OPERATOR in OPERATORS),
+                                   value_type=LocationEvent, value_serializer=serializer)
+    else:
+        incoming_topic = app.topic(pattern=INCOMING_PATTERN, value_type=LocationEvent, value_serializer=serializer)
+    outgoing_topics = {}
 
-    INCOMING_TOPIC = f"com.insight.project.{OPERATOR}.converter"
-    OUTGOING_TOPIC = f"com.insight.project.{OPERATOR}.streaming"
-    app = faust.App(STREAMER_NAME, broker=BROKER_URL)
+    def outgoing_topic(operator):
+        name = outgoing_topic_name(operator)
+        if name not in outgoing_topics:
+            outgoing_topics[name] = app.topic(name, value_type=LocationEvent, value_serializer=serializer)
+        return outgoing_topics[name]
 
-    incoming_topic = app.topic(INCOMING_TOPIC, value_type=LocationEvent)
-    outgoing_topic = app.topic(OUTGOING_TOPIC, value_type=LocationEvent)
+    zones = ZoneIndex.load(args.zones) if args.zones else None
+    stationary = StationaryFilter(args.dedup_max, args.dedup_ttl, args.dedup_heartbeat) if args.dedup else None
+    dedup_level = f"geo{args.dedup_level}"
 
-    @app.agent(incoming_topic)
+    rollup = TumblingRollup(args.rollup_window, tuple(args.rollup_levels), args.rollup_lateness) \
+        if args.rollup_window else None
+    rollup_topic = app.topic(ROLLUP_TOPIC, value_type=RollupEvent)
+    # events reach the rollups keyed by their coarsest rollup cell, so a single worker emits each rollup record
+    rollup_input_topic = app.topic(ROLLUP_INPUT_TOPIC, value_type=RollupInput, internal=True)
+
+    async def emit_rollups():
+        records = rollup.flush()
+        await asyncio.gather(*(rollup_topic.send(key=vehicle_key(r['operator'], r['geo']), value=RollupEvent(**r))
+                               for r in records))
+
+    idle = IdleTracker(args.idle_max, args.idle_ttl) if args.idle else None
+    idle_level = f"geo{args.idle_level}"
+    idle_histogram_topic = app.topic(IDLE_HISTOGRAM_TOPIC, value_type=IdleHistogram)
+    idle_top_topic = app.topic(IDLE_TOP_TOPIC, value_type=IdleVehicle)
+
+    @app.agent(incoming_topic, concurrency=args.concurrency)
     async def event(events):
-        events.add_processor(attribute_convertor)
-        async for le in events:
-            await outgoing_topic.send(value=le)
+        async for batch in events.take(args.batch_size, within=args.batch_within / 1000.0):
+            batch = batch_attribute_convertor(valid_events(batch), zones)
+            if rollup is not None:
+                # rollups count every event, before the stationary filter drops any
+                cells = [getattr(le, f"geo{rollup.finest}") for le in batch]
+                await asyncio.gather(*(rollup_input_topic.send(
+                    key=vehicle_key(le.operator, rollup.route(cell)),
+                    value=RollupInput(le.operator, le.type, cell, le.is_disabled, le.is_reserved, le.id,
+                                      le.last_updated))
+                    for le, cell in zip(batch, cells)))
+            if idle is not None:
+                for le in batch:
+                    idle.update(le.operator, le.id, getattr(le, idle_level), le.last_updated)
+            if stationary is not None:
+                batch = [le for le in batch
+                         if stationary.should_forward((le.operator, le.id), getattr(le, dedup_level),
+                                                      le.is_disabled, le.is_reserved, le.last_updated)]
+            # keyed by vehicle, aiokafka's murmur2 partitioner matches partitioning.py
+            await asyncio.gather(*(outgoing_topic(le.operator).send(key=vehicle_key(le.operator, le.id), value=le)
+                                   for le in batch))
+
+    if rollup is not None:
+        @app.agent(rollup_input_topic)
+        async def rollup_events(inputs):
+            async for batch in inputs.take(args.batch_size, within=args.batch_within / 1000.0):
+                for r in batch:
+                    rollup.add(r.operator, r.type, r.cell, r.is_disabled, r.is_reserved, r.id, r.last_updated)
+                await emit_rollups()
+
+    @app.timer(interval=args.idle_interval)
+    async def emit_idle():
+        if idle is None or not idle.watermark:
+            return
+        timestamp = event_timestamp(idle.watermark)
+        histograms = [IdleHistogram(timestamp, operator, args.idle_level, cell, list(IDLE_BUCKETS_MIN), counts)
+                      for (operator, cell), counts in idle.drain_histograms().items()]
+        top = [IdleVehicle(timestamp, rank, operator, vehicle_id, cell, seconds)
+               for rank, (seconds, operator, vehicle_id, cell) in enumerate(idle.longest_idle(args.idle_top), 1)]
+        await asyncio.gather(*(idle_histogram_topic.send(key=vehicle_key(h.operator, h.geo), value=h)
+                               for h in histograms),
+                             *(idle_top_topic.send(key=vehicle_key(v.operator, v.id), value=v) for v in top))
+
+    @app.timer(interval=60.0)
+    async def report():
+        if stationary is not None:
+            logger.info(f"stationary filter: {stationary.summary()}")
+        if rollup is not None:
+            logger.info(f"rollups: {len(rollup.aggregates)} open aggregates, {rollup.late} late events dropped")
+        if zones is not None:
+            logger.info(f"zone lookups: {zones.stats}")
+        if idle is not None:
+            logger.info(f"idle tracker: {len(idle.state)} vehicles, {idle.evicted} evicted")
 
     worker = Worker(app)
     worker.execute_from_commandline()
@@ -80,7 +276,47 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fasut Streamer")
     parser.add_argument('-b', dest="bootstrap_servers", required=True,
                         help="Bootstrap broker(s) (host[:port])")
-    parser.add_argument('-o', dest="operator", required=True,
-                        help="Operator name")
+    parser.add_argument('-o', dest="operators", nargs='*', default=[],
+                        help="Operator name(s), every operator's converter topic if omitted")
+    parser.add_argument('-n', dest="batch_size", type=int, default=1000,
+                        help="Maximum number of events enriched and sent at once")
+    parser.add_argument('-t', dest="batch_within", type=float, default=100.0,
+                        help="Milliseconds to wait for a batch to fill up")
+    parser.add_argument('-c', dest="concurrency", type=int, default=1,
+                        help="Number of agent instances consuming the topics")
+    parser.add_argument('--codec', dest="codec", choices=CODECS, default=DEFAULT_CODEC,
+                        help="Codec of the converter and streaming topic values, shared with the converters")
+    parser.add_argument('-z', dest="zones",
+                        help="Compiled zone index (zone_index.py) used to add a zone to every event")
+    parser.add_argument('--dedup', dest="dedup", action='store_true',
+                        help="Forward an event only if the vehicle changed cell or status, or its heartbeat expired")
+    parser.add_argument('--dedup-level', dest="dedup_level", type=int, choices=GEOHASH_LEVELS, default=9,
+                        help="Geohash level of the cell compared by the stationary filter")
+    parser.add_argument('--dedup-heartbeat', dest="dedup_heartbeat", type=float, default=300,
+                        help="Seconds after which an unchanged vehicle is forwarded again")
+    parser.add_argument('--dedup-ttl', dest="dedup_ttl", type=float, default=3600,
+                        help="Seconds after which an unseen vehicle is forgotten")
+    parser.add_argument('--dedup-max', dest="dedup_max", type=int, default=1000000,
+                        help="Maximum number of vehicles kept by the stationary filter")
+    parser.add_argument('--rollup-window', dest="rollup_window", type=int, default=0,
+                        help="Seconds of the tumbling rollup windows, no rollups if 0")
+    parser.add_argument('--rollup-levels', dest="rollup_levels", type=int, nargs='+', choices=GEOHASH_LEVELS,
+                        default=list(ROLLUP_LEVELS), help="Geohash levels aggregated by the rollups")
+    parser.add_argument('--rollup-lateness', dest="rollup_lateness", type=int, default=300,
+                        help="Seconds of event time a rollup window waits for late events")
+    parser.add_argument('--idle', dest="idle", action='store_true',
+                        help="Track the idle time of every vehicle and emit idle histograms and the longest idle")
+    parser.add_argument('--idle-level', dest="idle_level", type=int, choices=GEOHASH_LEVELS, default=8,
+                        help="Geohash level of the cell a vehicle has to leave to count as moved")
+    parser.add_argument('--idle-ttl', dest="idle_ttl", type=float, default=86400,
+                        help="Seconds after which an unseen vehicle is forgotten and its idle spell closed")
+    parser.add_argument('--idle-max', dest="idle_max", type=int, default=1000000,
+                        help="Maximum number of vehicles kept by the idle tracker")
+    parser.add_argument('--idle-top', dest="idle_top", type=int, default=20,
+                        help="Number of longest idle vehicles emitted")
+    parser.add_argument('--idle-interval', dest="idle_interval", type=float, default=60.0,
+                        help="Seconds between two idle emissions")
+    parser.add_argument('-w', dest="web_port", type=int, default=6066,
+                        help="Web port of the worker, unique per worker process on a host")
 
     main(parser.parse_args())
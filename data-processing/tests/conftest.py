@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""Test configuration
+
+The stage modules import their siblings by name and read logging.ini from
+the working directory, so the tests run from the data-processing directory.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import os
+import sys
+
+DATA_PROCESSING = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DATA_PROCESSING)
+os.chdir(DATA_PROCESSING)
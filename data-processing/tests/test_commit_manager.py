@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Contiguous-prefix offset commits of the commit manager"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from confluent_kafka import TopicPartition
+from commit_manager import CommitManager, DeliveryFailed
+
+
+class FakeMessage(object):
+
+    def __init__(self, partition, offset, topic="t"):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+class FakeConsumer(object):
+
+    def __init__(self):
+        self.commits = []
+
+    def commit(self, offsets, asynchronous=True):
+        self.commits.append({(tp.topic, tp.partition): tp.offset for tp in offsets})
+
+
+class FakeProducer(object):
+
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self, timeout=None):
+        self.flushes += 1
+        return 0
+
+
+def consume(commits, partition, offsets):
+    messages = [FakeMessage(partition, o) for o in offsets]
+    callbacks = []
+    for message in messages:
+        commits.track(message)
+        callbacks.append(commits.on_delivery(message))
+    return messages, callbacks
+
+
+def test_commits_the_contiguous_prefix():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, FakeProducer(), batch_size=3)
+    _, callbacks = consume(commits, 0, range(10, 15))
+    for ack in callbacks[:3]:
+        ack(None, None)
+    commits.maybe_commit()
+    # the committed offset is the next one to consume
+    assert consumer.commits == [{("t", 0): 13}]
+
+
+def test_out_of_order_acks_wait_for_the_head():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, FakeProducer())
+    _, callbacks = consume(commits, 0, range(5))
+    for i in (4, 2, 1):
+        callbacks[i](None, None)
+    commits.commit()
+    assert consumer.commits == []
+    callbacks[0](None, None)
+    commits.commit()
+    assert consumer.commits == [{("t", 0): 3}]
+    callbacks[3](None, None)
+    commits.commit()
+    assert consumer.commits[-1] == {("t", 0): 5}
+    assert not commits.partitions[("t", 0)].pending
+
+
+def test_dropped_messages_finish_their_offset():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, FakeProducer())
+    messages, callbacks = consume(commits, 0, range(3))
+    commits.done(messages[0])
+    callbacks[1](None, None)
+    commits.commit()
+    assert consumer.commits == [{("t", 0): 2}]
+    assert commits.stats["dropped"] == 1
+
+
+def test_revocation_flushes_and_commits_only_revoked_partitions():
+    consumer = FakeConsumer()
+    producer = FakeProducer()
+    commits = CommitManager(consumer, producer)
+    _, acks0 = consume(commits, 0, range(2))
+    _, acks1 = consume(commits, 1, range(2))
+    for ack in acks0 + acks1:
+        ack(None, None)
+    commits.revoked(consumer, [TopicPartition("t", 0)])
+    assert producer.flushes == 1
+    assert consumer.commits == [{("t", 0): 2}]
+    assert ("t", 0) not in commits.partitions
+    assert ("t", 1) in commits.partitions
+
+
+def test_failed_delivery_blocks_the_partition_and_stops_the_stage():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, FakeProducer())
+    _, callbacks = consume(commits, 0, range(4))
+    _, others = consume(commits, 1, range(2))
+    callbacks[0](None, None)
+    callbacks[1]("timed out", None)
+    callbacks[2](None, None)
+    for ack in others:
+        ack(None, None)
+    # later messages of the blocked partition are neither kept nor committed
+    consume(commits, 0, range(4, 1000))
+    assert not commits.partitions[("t", 0)].pending
+    with pytest.raises(DeliveryFailed):
+        commits.maybe_commit()
+    commits.close()
+    assert consumer.commits == [{("t", 0): 1, ("t", 1): 2}]
+    assert commits.stats["failed"] == 1
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Stationary filter: forwarding rules, LRU and TTL eviction"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+from dedup import StationaryFilter
+
+KEY = ("bird", "1")
+
+
+def test_only_changes_and_heartbeats_are_forwarded():
+    f = StationaryFilter(heartbeat=300)
+    assert f.should_forward(KEY, "a", 0, 0, 0)
+    assert not f.should_forward(KEY, "a", 0, 0, 60)
+    assert f.should_forward(KEY, "b", 0, 0, 120)
+    assert f.should_forward(KEY, "b", 1, 0, 180)
+    assert f.should_forward(KEY, "b", 1, 1, 240)
+    assert not f.should_forward(KEY, "b", 1, 1, 539)
+    assert f.should_forward(KEY, "b", 1, 1, 540)
+    assert f.stats["forwarded"] == 5
+    assert f.stats["suppressed"] == 2
+
+
+def test_least_recently_seen_vehicle_is_evicted_first():
+    f = StationaryFilter(max_entries=2)
+    f.should_forward(("bird", "1"), "a", 0, 0, 0)
+    f.should_forward(("bird", "2"), "a", 0, 0, 1)
+    # a suppressed event refreshes the vehicle as well
+    f.should_forward(("bird", "1"), "a", 0, 0, 2)
+    f.should_forward(("bird", "3"), "a", 0, 0, 3)
+    assert list(f.state) == [("bird", "1"), ("bird", "3")]
+    assert f.stats["evicted"] == 1
+    # an evicted vehicle is forwarded again
+    assert f.should_forward(("bird", "2"), "a", 0, 0, 4)
+
+
+def test_vehicles_unseen_for_the_ttl_are_forgotten():
+    f = StationaryFilter(ttl=100, heartbeat=1000)
+    f.should_forward(("bird", "1"), "a", 0, 0, 0)
+    f.should_forward(("bird", "2"), "a", 0, 0, 50)
+    f.should_forward(("bird", "2"), "a", 0, 0, 90)
+    f.should_forward(("bird", "3"), "a", 0, 0, 160)
+    assert list(f.state) == [("bird", "2"), ("bird", "3")]
+    assert f.should_forward(("bird", "1"), "a", 0, 0, 170)
+    assert f.summary()["entries"] == 3
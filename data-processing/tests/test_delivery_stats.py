@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Delivery report counters and the ack latency histogram"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+from delivery_stats import DeliveryStats
+
+
+class FakeMessage(object):
+
+    def __init__(self, partition, latency, topic="t"):
+        self._topic = topic
+        self._partition = partition
+        self._latency = latency
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def latency(self):
+        return self._latency
+
+
+def test_counts_deliveries_per_partition_and_errors():
+    stats = DeliveryStats("test", report_interval=0)
+    for i in range(10):
+        stats.acked(None, FakeMessage(i % 3, 0.002))
+    stats.acked("Broker: Message timed out", FakeMessage(0, None))
+    stats.acked("Broker: Message timed out", FakeMessage(1, None))
+    stats.acked("Local: Queue full", FakeMessage(1, None))
+    summary = stats.summary()
+    assert (summary["delivered"], summary["failed"]) == (10, 3)
+    assert summary["partitions"] == {"t[0]": 4, "t[1]": 3, "t[2]": 3}
+    assert summary["errors"] == {"Broker: Message timed out": 2, "Local: Queue full": 1}
+
+
+def test_percentiles_are_bucket_upper_bounds():
+    stats = DeliveryStats("test", report_interval=0)
+    for _ in range(98):
+        stats.acked(None, FakeMessage(0, 0.003))
+    for _ in range(2):
+        stats.acked(None, FakeMessage(0, 0.7))
+    assert stats.percentile(50) == 5
+    assert stats.percentile(98) == 5
+    assert stats.percentile(99) == 1000
+
+
+def test_latencies_past_the_last_bucket_are_unbounded():
+    stats = DeliveryStats("test", report_interval=0)
+    stats.acked(None, FakeMessage(0, 12.0))
+    assert stats.percentile(99) == float('inf')
+
+
+def test_no_latency_no_percentile():
+    stats = DeliveryStats("test", report_interval=0)
+    assert stats.summary()["p50_ms"] is None
+    # messages without a latency are counted but left out of the histogram
+    stats.acked(None, FakeMessage(0, None))
+    assert stats.delivered == 1
+    assert stats.percentile(50) is None
+
+
+def test_close_logs_the_final_summary(caplog):
+    stats = DeliveryStats("producer", report_interval=30.0)
+    stats.acked(None, FakeMessage(0, 0.001))
+    stats.acked("Broker: Message timed out", FakeMessage(0, None))
+    with caplog.at_level("INFO", logger="delivery_stats"):
+        stats.close()
+    assert "producer: delivered 1, failed 1, ack latency p50 <= 1 ms" in caplog.text
+    assert "delivery errors" in caplog.text
+    assert stats.next_report is None
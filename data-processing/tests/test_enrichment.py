@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Per-event validation ahead of the vectorized enrichment"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from enrichment import event_error, geohashes
+from fused_pipeline import enrich_messages
+
+GOOD = {"id": "bird-1", "operator": "bird", "last_updated": 1600000000, "lat": 38.9, "lon": -77.03}
+
+
+@pytest.mark.parametrize("bad", [
+    {k: v for k, v in GOOD.items() if k != "id"},
+    dict(GOOD, lat="38.9"),
+    dict(GOOD, lat=float("nan")),
+    dict(GOOD, lon=-200.0),
+    dict(GOOD, last_updated=None),
+])
+def test_event_error_flags_malformed_events(bad):
+    assert event_error(bad) is not None
+
+
+class FakeMessage(object):
+
+    def __init__(self, offset, value):
+        self._offset = offset
+        self._value = value
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return "t"
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+
+class FakeSchemas(object):
+
+    def decode(self, data):
+        if data is None:
+            raise ValueError("message is too short for the wire format")
+        return dict(data)
+
+
+class FakeCommits(object):
+
+    def __init__(self):
+        self.tracked = []
+        self.dropped = []
+
+    def track(self, message):
+        self.tracked.append(message.offset())
+
+    def done(self, message):
+        self.dropped.append(message.offset())
+
+
+def test_one_malformed_event_does_not_drop_its_batch():
+    values = [dict(GOOD, id=f"bird-{i}") for i in range(5)]
+    values[2]['lat'] = None
+    values[3] = None
+    commits = FakeCommits()
+    records = enrich_messages([FakeMessage(i, v) for i, v in enumerate(values)], FakeSchemas(), None, commits)
+    assert [value['id'] for _, value in records] == ["bird-0", "bird-1", "bird-4"]
+    assert all(value['geo9'] == geohashes(GOOD['lat'], GOOD['lon'])['geo9'] for _, value in records)
+    # the dropped events are finished so their offsets do not hold the commits back
+    assert commits.tracked == [0, 1, 2, 3, 4]
+    assert commits.dropped == [2, 3]
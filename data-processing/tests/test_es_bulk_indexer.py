@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Adaptive request size, item retries and offset commits of the Elasticsearch bulk indexer"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import asyncio
+import json
+import aiohttp
+import pytest
+from commit_manager import CommitManager
+from es_bulk_indexer import BatchSizer, BulkIndexer, index_messages
+
+
+def test_sizer_grows_by_step_up_to_the_maximum():
+    sizer = BatchSizer(size=500, max_size=800, target_latency=1.0, step=100)
+    for expected in (600, 700, 800, 800):
+        sizer.succeeded(0.2)
+        assert sizer.size == expected
+
+
+def test_sizer_cuts_slow_requests_by_a_quarter():
+    sizer = BatchSizer(size=1000, min_size=600, target_latency=1.0)
+    sizer.succeeded(1.5)
+    assert sizer.size == 750
+    sizer.succeeded(1.5)
+    assert sizer.size == 600
+
+
+def test_sizer_halves_on_rejection_down_to_the_minimum():
+    sizer = BatchSizer(size=1000, min_size=300)
+    sizer.rejected()
+    assert sizer.size == 500
+    sizer.rejected()
+    assert sizer.size == 300
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, body=None):
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status)
+
+    async def json(self):
+        return self.body
+
+
+class FakeSession(object):
+    """
+    Answers each bulk request with respond(ids), ids being the document ids of the request
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+
+    def post(self, url, data, headers):
+        lines = data.decode().splitlines()
+        ids = [json.loads(line)["index"]["_id"] for line in lines[::2]]
+        self.requests.append(ids)
+        return self.respond(ids)
+
+
+def items(statuses):
+    return FakeResponse(200, {"errors": any(s >= 300 for s in statuses),
+                              "items": [{"index": {"status": s}} for s in statuses]})
+
+
+def event(i):
+    return {"operator": "bird", "id": str(i), "last_updated": 1600000000}
+
+
+def test_partial_item_failures_are_retried():
+    rejected_once = set()
+
+    def respond(ids):
+        statuses = []
+        for doc in ids:
+            # every third document is rejected by a full write queue on its first attempt
+            if int(doc.split("-")[1]) % 3 == 0 and doc not in rejected_once:
+                rejected_once.add(doc)
+                statuses.append(429)
+            else:
+                statuses.append(201)
+        return items(statuses)
+
+    session = FakeSession(respond)
+    bulk = BulkIndexer(session, "http://es:9200", "idx", concurrency=2, sizer=BatchSizer(size=10, min_size=1),
+                       backoff=0)
+    indexed, failed = asyncio.run(bulk.index([(i, event(i)) for i in range(30)]))
+    assert sorted(indexed) == list(range(30))
+    assert failed == []
+    assert bulk.stats["retried"] == 10
+    # the retried documents, and only they, were sent twice
+    sent = [doc for ids in session.requests for doc in ids]
+    assert len(sent) == 40
+    assert bulk.stats["rejected"] > 0
+
+
+def test_mapping_errors_fail_without_retry():
+    session = FakeSession(lambda ids: items([400 if doc.endswith("-1-1600000000") else 201 for doc in ids]))
+    bulk = BulkIndexer(session, "http://es:9200", "idx", concurrency=1, backoff=0)
+    indexed, failed = asyncio.run(bulk.index([(i, event(i)) for i in range(3)]))
+    assert sorted(indexed) == [0, 2]
+    assert failed == [1]
+    assert len(session.requests) == 1
+
+
+def test_rejected_request_is_resent_whole():
+    responses = iter([FakeResponse(429), items([201, 201])])
+    session = FakeSession(lambda ids: next(responses))
+    bulk = BulkIndexer(session, "http://es:9200", "idx", concurrency=1, sizer=BatchSizer(size=100, min_size=10),
+                       backoff=0)
+    indexed, _ = asyncio.run(bulk.index([(i, event(i)) for i in range(2)]))
+    assert sorted(indexed) == [0, 1]
+    assert bulk.sizer.size == 50 + bulk.sizer.step
+    assert bulk.stats["rejected"] == 1
+
+
+class FakeMessage(object):
+
+    def __init__(self, offset, value):
+        self._offset = offset
+        self._value = value
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return "t"
+
+    def partition(self):
+        return 0
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+
+class FakeSchemas(object):
+
+    def decode(self, data):
+        if data is None:
+            raise ValueError("message is too short for the wire format")
+        return dict(data)
+
+
+class FakeConsumer(object):
+
+    def __init__(self):
+        self.commits = []
+
+    def commit(self, offsets, asynchronous=True):
+        self.commits.append({(tp.topic, tp.partition): tp.offset for tp in offsets})
+
+
+def test_offsets_are_committed_once_the_batch_is_indexed():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, None)
+    attempts = []
+
+    def respond(ids):
+        # a commit issued while the batch is in flight must not include any of its offsets
+        commits.commit()
+        attempts.append(ids)
+        return FakeResponse(429) if len(attempts) == 1 else items([201] * len(ids))
+
+    bulk = BulkIndexer(FakeSession(respond), "http://es:9200", "idx", concurrency=1, backoff=0)
+    messages = [FakeMessage(o, event(o)) for o in range(5)] + [FakeMessage(5, None)]
+    assert asyncio.run(index_messages(messages, FakeSchemas(), bulk, commits)) == 5
+    assert consumer.commits == []
+    commits.commit()
+    assert consumer.commits == [{("t", 0): 6}]
+
+
+def test_nothing_is_committed_when_indexing_fails():
+    consumer = FakeConsumer()
+    commits = CommitManager(consumer, None)
+    bulk = BulkIndexer(FakeSession(lambda ids: FakeResponse(401)), "http://es:9200", "idx", backoff=0)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(index_messages([FakeMessage(o, event(o)) for o in range(3)], FakeSchemas(), bulk, commits))
+    commits.commit()
+    assert consumer.commits == []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""HyperLogLog sketches: error bounds, sparse and dense merges, serialization"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from hyperloglog import HyperLogLog, merge, merge_by_prefix
+
+
+def sketch(values, p=12):
+    hll = HyperLogLog(p)
+    for value in values:
+        hll.add(value)
+    return hll
+
+
+def test_small_sketches_are_sparse_and_exact():
+    hll = sketch(f"bird-{i % 20}" for i in range(100))
+    assert hll.sparse
+    assert hll.count() == 20
+
+
+def test_sketch_turns_dense_past_the_sparse_limit():
+    hll = sketch(f"bird-{i}" for i in range(HyperLogLog().sparse_max + 1))
+    assert not hll.sparse
+    assert hll.count() == pytest.approx(hll.sparse_max + 1, rel=0.05)
+
+
+@pytest.mark.parametrize("n", [100, 1000, 10000, 100000])
+def test_estimate_stays_within_the_error_bound(n):
+    # standard error is 1.04 / sqrt(4096), about 1.6 %; 4 % is 2.5 standard errors
+    assert sketch(f"bird-{i}" for i in range(n)).count() == pytest.approx(n, rel=0.04)
+
+
+@pytest.mark.parametrize("left, right", [(10, 20), (10, 5000), (5000, 10), (5000, 8000)])
+def test_merge_counts_the_union(left, right):
+    a = sketch(f"bird-{i}" for i in range(left))
+    b = sketch(f"bird-{i}" for i in range(left // 2, left // 2 + right))
+    union = max(left, left // 2 + right)
+    before = (a.to_bytes(), b.to_bytes())
+    merged = merge([a, b])
+    assert merged.count() == pytest.approx(union, rel=0.04)
+    # the inputs are left untouched
+    assert (a.to_bytes(), b.to_bytes()) == before
+    # merging a sketch into itself changes nothing
+    assert merge([merged, merged]).count() == merged.count()
+
+
+def test_sparse_into_dense_matches_adding_the_values():
+    dense = sketch(f"bird-{i}" for i in range(5000))
+    sparse = sketch(f"lime-{i}" for i in range(10))
+    direct = sketch([f"bird-{i}" for i in range(5000)] + [f"lime-{i}" for i in range(10)])
+    assert dense.copy().update(sparse).to_bytes() == direct.to_bytes()
+    assert sparse.copy().update(dense).to_bytes() == direct.to_bytes()
+
+
+def test_merge_by_prefix_merges_child_cells():
+    cells = {"dqcjq": sketch(["1", "2"]), "dqcjr": sketch(["2", "3"]), "dqcm0": sketch(["4"])}
+    parents = merge_by_prefix(cells, 4)
+    assert {cell: hll.count() for cell, hll in parents.items()} == {"dqcj": 3, "dqcm": 1}
+    assert cells["dqcjq"].count() == 2
+
+
+@pytest.mark.parametrize("n", [0, 10, 5000])
+def test_serialization_round_trips(n):
+    hll = sketch(f"bird-{i}" for i in range(n))
+    copy = HyperLogLog.from_text(hll.to_text())
+    assert copy.sparse == hll.sparse
+    assert copy.count() == hll.count()
+
+
+def test_precisions_do_not_merge():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).update(HyperLogLog(14))
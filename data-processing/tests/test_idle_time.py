@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Idle tracker: spells, LRU and TTL eviction and the longest idle ranking"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import heapq
+import random
+from idle_time import IdleTracker
+
+
+def test_a_move_closes_the_spell_in_its_bucket():
+    idle = IdleTracker(buckets=(5, 15))
+    idle.update("bird", "1", "cell-a", 0)
+    idle.update("bird", "1", "cell-a", 600)
+    idle.update("bird", "1", "cell-b", 660)
+    assert idle.drain_histograms() == {("bird", "cell-a"): [0, 1, 0]}
+    assert idle.drain_histograms() == {}
+
+
+def test_least_recently_seen_vehicle_is_evicted_first():
+    idle = IdleTracker(max_entries=2)
+    idle.update("bird", "1", "a", 0)
+    idle.update("bird", "2", "a", 1)
+    idle.update("bird", "1", "a", 2)
+    idle.update("bird", "3", "a", 3)
+    assert list(idle.state) == [("bird", "1"), ("bird", "3")]
+    assert idle.evicted == 1
+    assert ("bird", "a") in idle.histograms
+
+
+def test_vehicles_unseen_for_the_ttl_are_forgotten():
+    idle = IdleTracker(ttl=100)
+    idle.update("bird", "1", "a", 0)
+    idle.update("bird", "2", "a", 50)
+    idle.update("bird", "3", "a", 120)
+    assert list(idle.state) == [("bird", "2"), ("bird", "3")]
+    assert idle.evicted == 1
+
+
+def test_longest_idle_matches_a_full_scan():
+    rng = random.Random(7)
+    idle = IdleTracker(max_entries=300, ttl=5000)
+    for ts in range(20000):
+        idle.update("bird", str(rng.randrange(500)), f"cell-{rng.randrange(3)}", ts)
+        if ts % 1000 == 0:
+            now = idle.watermark
+            expected = heapq.nlargest(10, ((now - since, operator, vehicle_id, cell)
+                                           for (operator, vehicle_id), (cell, since, _) in idle.state.items()))
+            assert [s[0] for s in idle.longest_idle(10)] == [s[0] for s in expected]
+    # closed spells do not pile up in the heap
+    assert len(idle.spells) <= 2 * len(idle.state) + 1024
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Collector line parsing, including delta-mode rows"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import io
+from line_parser import LineParser
+
+ROW = {"bike_id": "bird-1", "is_disabled": "False", "is_reserved": "False", "last_updated": "1600000000",
+       "lat": "38.9", "lon": "-77.03", "operator": "bird", "vehicle_type": "scooter"}
+
+
+def line(**fields):
+    return ", ".join(f"{k}:{v}" for k, v in sorted(dict(ROW, **fields).items())) + "\n"
+
+
+def test_disappeared_rows_are_not_positions():
+    block = (line(bike_id="bird-1", event="keyframe") + line(bike_id="bird-2", event="disappeared")
+             + line(bike_id="bird-3", event="moved") + line(bike_id="bird-4")).encode()
+    parser = LineParser()
+    records = parser.parse_block(block)
+    assert [r["id"] for r in records] == ["bird-1", "bird-3", "bird-4"]
+    assert parser.departed == 1
+    assert parser.malformed == 0
+
+
+def test_split_chunks_parse_like_one_block():
+    data = (line(bike_id="bird-1") + line(bike_id="bird-2", event="disappeared") + line(bike_id="bird-3")).encode()
+    parser = LineParser()
+    records = parser.feed(data[:50]) + parser.feed(data[50:-1]) + parser.finish()
+    assert [r["id"] for r in records] == ["bird-1", "bird-3"]
+    assert parser.departed == 1
+
+
+def test_malformed_lines_are_counted_and_quarantined():
+    quarantine = io.BytesIO()
+    bad = [
+        "garbage without separators",
+        line(lat="north").rstrip("\n"),
+        line(is_disabled="maybe").rstrip("\n"),
+        ", ".join(f"{k}:{v}" for k, v in sorted(ROW.items()) if k != "operator"),
+    ]
+    block = (line(bike_id="bird-1") + "\n".join(bad) + "\n  \n" + line(bike_id="bird-2")).encode()
+    parser = LineParser(quarantine)
+    records = parser.parse_block(block)
+    assert [r["id"] for r in records] == ["bird-1", "bird-2"]
+    assert (parser.parsed, parser.malformed) == (2, 4)
+    assert quarantine.getvalue().decode().splitlines() == bad
+
+
+def test_without_quarantine_file_malformed_lines_are_only_counted():
+    parser = LineParser()
+    assert parser.parse_block(line(last_updated="yesterday").encode()) == []
+    assert parser.malformed == 1
+
+
+def test_crlf_lines_and_booleans_parse():
+    block = (line(bike_id="bird-1", is_disabled="true", is_reserved="1").replace("\n", "\r\n")
+             + line(bike_id="bird-2", is_disabled="FALSE", is_reserved="0")).encode()
+    records = LineParser().parse_block(block)
+    assert [(r["id"], r["is_disabled"], r["is_reserved"]) for r in records] == [("bird-1", 1, 1), ("bird-2", 0, 0)]
+    assert records[0]["last_updated"] == 1600000000 and records[0]["lon"] == -77.03
+
+
+def test_invalid_utf8_does_not_stop_the_stream():
+    quarantine = io.BytesIO()
+    parser = LineParser(quarantine)
+    records = parser.feed(b"\xff\xfe broken\n" + line(bike_id="bird-1").encode()) + parser.finish()
+    assert [r["id"] for r in records] == ["bird-1"]
+    assert parser.malformed == 1
+    assert quarantine.getvalue() == "�� broken\n".encode()
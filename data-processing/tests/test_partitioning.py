@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Vehicle partitioning: murmur2 vectors and topics missing from the metadata"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from partitioning import UNASSIGNED, Partitioner, murmur2, partition_for
+
+
+# signed values of the Java client's UtilsTest and vectors of aiokafka's murmur2
+@pytest.mark.parametrize("data, expected", [
+    (b"21", -973932308),
+    (b"foobar", -790332482),
+    (b"", 275646681),
+    (b"a", 2731586172),
+    (b"ab", 316155434),
+    (b"abc", 479470107),
+    (b"abcd", 2971317748),
+    (b"bird:1", 1449072983),
+])
+def test_murmur2_matches_the_java_client(data, expected):
+    assert murmur2(data) == expected & 0xFFFFFFFF
+
+
+def test_partition_is_positive_modulo():
+    assert partition_for("bird:1", 5) == (1449072983 & 0x7FFFFFFF) % 5
+
+
+class FakeTopic(object):
+
+    def __init__(self, partitions, error=None):
+        self.partitions = dict.fromkeys(range(partitions))
+        self.error = error
+
+
+class FakeMetadata(object):
+
+    def __init__(self, topics):
+        self.topics = topics
+
+
+class FakeClient(object):
+
+    def __init__(self, topics):
+        self.topics = topics
+        self.requests = 0
+
+    def list_topics(self, topic, timeout=None):
+        self.requests += 1
+        return FakeMetadata({t: FakeTopic(n) for t, n in self.topics.items() if t == topic})
+
+
+def test_known_topic_is_read_once():
+    client = FakeClient({"t": 5})
+    partitioner = Partitioner(client)
+    assert partitioner.partition("t", "Bird", "1") == partition_for("bird:1", 5)
+    assert partitioner.partition("t", "bird", "2") == partition_for("bird:2", 5)
+    assert client.requests == 1
+
+
+def test_missing_topic_falls_back_until_it_exists():
+    client = FakeClient({})
+    partitioner = Partitioner(client, retry_interval=0.0)
+    assert partitioner.partition("t", "bird", "1") == UNASSIGNED
+    client.topics["t"] = 5
+    assert partitioner.partition("t", "bird", "1") == partition_for("bird:1", 5)
+
+
+def test_missing_topic_is_not_requested_on_every_event():
+    client = FakeClient({})
+    partitioner = Partitioner(client, retry_interval=60.0)
+    for i in range(100):
+        assert partitioner.partition("t", "bird", str(i)) == UNASSIGNED
+    assert client.requests == 1
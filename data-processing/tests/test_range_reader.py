@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Line-aligned byte ranges of local objects and checkpointed resume"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import random
+from functools import partial
+import pytest
+from range_reader import Checkpoint, LocalSource, open_source, read_range, run_parallel, split_ranges
+
+
+def collector_file(path, lines, trailing_newline=True):
+    rng = random.Random(lines)
+    # short lines, long lines and empty lines, some longer than the ranges and the overhang
+    data = "\n".join(f"bike_id:{i}, pad:{'x' * rng.choice((0, 3, 40, 300))}" if i % 17 else ""
+                     for i in range(lines))
+    path.write_bytes((data + ("\n" if trailing_newline else "")).encode())
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+@pytest.mark.parametrize("range_size", [1, 7, 64, 100, 333, 4096, 1 << 20])
+def test_ranges_cover_every_line_once(tmp_path, range_size, trailing_newline):
+    data = collector_file(tmp_path / "bird.txt", 200, trailing_newline)
+    source = LocalSource(tmp_path)
+    parts = [read_range(source, r, overhang=50) for r in split_ranges(source.list(), range_size)]
+    # every part is whole lines, and together they are the file, nothing lost or repeated
+    parts = [part for part in parts if part]
+    assert all(part.endswith(b"\n") for part in parts[:-1])
+    assert b"".join(parts) == data
+
+
+def test_single_file_source(tmp_path):
+    data = collector_file(tmp_path / "bird.txt", 50)
+    source = open_source(str(tmp_path / "bird.txt"))
+    assert source.list() == [("bird.txt", len(data))]
+    assert b"".join(read_range(source, r) for r in split_ranges(source.list(), 100)) == data
+
+
+def count_lines(root, byte_range):
+    return {"lines": read_range(LocalSource(root), byte_range).count(b"\n")}
+
+
+def test_checkpoint_resume_skips_finished_ranges(tmp_path):
+    root = tmp_path / "objects"
+    root.mkdir()
+    collector_file(root / "bird.txt", 300)
+    collector_file(root / "lime.txt", 100)
+    ranges = split_ranges(LocalSource(root).list(), 2000)
+    path = str(tmp_path / "checkpoint.jsonl")
+    first = Checkpoint(path)
+    for byte_range in ranges[:3]:
+        first.mark(byte_range, lines=0)
+
+    resumed = Checkpoint(path)
+    assert resumed.done == {r.id for r in ranges[:3]}
+    work = partial(count_lines, str(root))
+    totals = run_parallel(ranges, work, 2, resumed)
+    assert totals == {"lines": sum(work(r)["lines"] for r in ranges[3:])}
+    assert Checkpoint(path).done == {r.id for r in ranges}
+    # a finished backfill has nothing left to do
+    assert run_parallel(ranges, work, 2, Checkpoint(path)) == {}
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Replay pacing in bulk, realtime and speedup modes"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+import replay
+from replay import BULK, REALTIME, SPEEDUP, ReplayPacer, ThroughputMeter
+
+
+class FakeClock(object):
+    """
+    Monotonic time that only moves when slept on
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(replay.time, "monotonic", fake.monotonic)
+    return fake
+
+
+def replay_times(pacer, clock, stamps):
+    # wall clock offset at which each event is released
+    start = clock.now
+    released = []
+    for stamp in stamps:
+        pacer.wait(stamp, clock.sleep)
+        released.append(clock.now - start)
+    return released
+
+
+def test_bulk_never_waits(clock):
+    pacer = ReplayPacer(BULK)
+    assert replay_times(pacer, clock, [100, 160, 3700]) == [0, 0, 0]
+    assert clock.sleeps == []
+
+
+def test_realtime_follows_last_updated(clock):
+    pacer = ReplayPacer(REALTIME)
+    assert replay_times(pacer, clock, [100, 100, 130, 190]) == [0, 0, 30, 90]
+
+
+def test_speedup_divides_the_gaps(clock):
+    pacer = ReplayPacer(SPEEDUP, 10.0)
+    assert replay_times(pacer, clock, [100, 150, 400]) == pytest.approx([0, 5, 30])
+
+
+def test_events_already_due_are_not_delayed(clock):
+    pacer = ReplayPacer(REALTIME)
+    pacer.wait(100, clock.sleep)
+    # producing took longer than the recorded gap
+    clock.now += 50
+    pacer.wait(120, clock.sleep)
+    pacer.wait(90, clock.sleep)
+    assert clock.sleeps == []
+
+
+def test_wait_resumes_after_a_short_sleep(clock):
+    # Producer.poll may return before its timeout once a delivery callback ran
+    pacer = ReplayPacer(REALTIME)
+    pacer.wait(0, clock.sleep)
+    pacer.wait(10, lambda seconds: clock.sleep(min(seconds, 3)))
+    assert clock.sleeps == [3, 3, 3, 1]
+
+
+def test_speed_factor_only_applies_to_speedup():
+    assert ReplayPacer(REALTIME, 10.0).speedup == 1.0
+    with pytest.raises(ValueError):
+        ReplayPacer(SPEEDUP, 0)
+    with pytest.raises(ValueError):
+        ReplayPacer("fast")
+
+
+def test_meter_averages_over_the_elapsed_time(clock):
+    meter = ThroughputMeter("test", report_interval=10.0)
+    for _ in range(4):
+        meter.tick(250)
+        clock.sleep(1.0)
+    assert meter.count == 1000
+    assert meter.summary() == pytest.approx(250.0)
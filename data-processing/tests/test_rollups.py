@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tumbling rollups: windowing, flush, late events, combine and worker routing"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import random
+from partitioning import partition_for, vehicle_key
+from rollups import TumblingRollup, combine
+
+T0 = 1600000000 - 1600000000 % 300
+
+
+def by_key(records):
+    return {(r["window_start"], r["operator"], r["type"], r["level"], r["geo"], r["is_disabled"], r["is_reserved"]):
+            r for r in records}
+
+
+def test_window_closes_after_its_lateness():
+    rollup = TumblingRollup(window=300, levels=(6, 7), lateness=60)
+    rollup.add("bird", "scooter", "dqcjqcp", 0, 0, "1", T0 + 10)
+    rollup.add("bird", "scooter", "dqcjqcq", 0, 0, "2", T0 + 20)
+    rollup.add("bird", "scooter", "dqcjqcq", 0, 0, "2", T0 + 30)
+    rollup.add("bird", "scooter", "dqcjqcp", 0, 0, "3", T0 + 359)
+    assert rollup.flush() == []
+    rollup.add("bird", "scooter", "dqcjqcp", 0, 0, "3", T0 + 360)
+    records = by_key(rollup.flush())
+    assert {k[3:5]: (r["events"], r["vehicles"]) for k, r in records.items()} == {
+        (6, "dqcjqc"): (3, 2), (7, "dqcjqcp"): (1, 1), (7, "dqcjqcq"): (2, 1)}
+    assert all(r["window_end"] == T0 + 300 for r in records.values())
+    # the next window stays open
+    assert len(rollup.aggregates) == 1
+
+
+def test_events_of_closed_windows_are_dropped_as_late():
+    rollup = TumblingRollup(window=300, levels=(6,), lateness=0)
+    rollup.add("bird", "scooter", "dqcjqc", 0, 0, "1", T0 + 10)
+    rollup.add("bird", "scooter", "dqcjqc", 0, 0, "1", T0 + 300)
+    assert len(rollup.flush()) == 1
+    rollup.add("bird", "scooter", "dqcjqc", 0, 0, "2", T0 + 299)
+    assert rollup.late == 1
+    assert rollup.flush() == []
+
+
+def test_combine_merges_windows_without_double_counting():
+    rollup = TumblingRollup(window=300, levels=(6, 7), lateness=0)
+    for window in range(3):
+        for vehicle in range(10):
+            rollup.add("bird", "scooter", f"dqcjqc{vehicle % 2}", 0, 0, str(vehicle), T0 + window * 300)
+    rollup.add("bird", "scooter", "dqcjqc0", 0, 0, "x", T0 + 900)
+    records = rollup.flush()
+    assert combine(records, 6) == {("dqcjqc", "bird"): 10}
+    assert combine(records, 7) == {("dqcjqc0", "bird"): 5, ("dqcjqc1", "bird"): 5}
+
+
+def test_routing_by_coarsest_cell_gives_each_record_one_worker():
+    rng = random.Random(5)
+    events = [("bird", "scooter", "dqcj" + "".join(rng.choice("0123") for _ in range(3)), 0, 0, str(rng.randrange(300)),
+               T0 + rng.randrange(600)) for _ in range(5000)]
+    single = TumblingRollup(window=300, levels=(5, 6, 7), lateness=0)
+    workers = [TumblingRollup(window=300, levels=(5, 6, 7), lateness=0) for _ in range(3)]
+    for event in events:
+        single.add(*event)
+        owner = workers[partition_for(vehicle_key(event[0], single.route(event[2])), len(workers))]
+        owner.add(*event)
+    for rollup in [single] + workers:
+        rollup.add("bird", "scooter", "dqcj000", 0, 0, "x", T0 + 600)
+    expected = by_key(single.flush())
+    emitted = [by_key(w.flush()) for w in workers]
+    keys = [k for records in emitted for k in records]
+    # no two workers emit a record of the same cell and window, and together they emit every record
+    assert len(keys) == len(set(keys)) == len(expected)
+    merged = {k: r for records in emitted for k, r in records.items()}
+    assert {k: (r["events"], r["vehicles"]) for k, r in merged.items()} == \
+        {k: (r["events"], r["vehicles"]) for k, r in expected.items()}
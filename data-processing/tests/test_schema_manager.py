@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Schema cache: registry scoping and registry failures"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import json
+import pytest
+from schema_manager import SchemaManager, SchemaUnavailable
+
+SCHEMA = {"type": "record", "name": "Key", "fields": [{"name": "id", "type": "string"}]}
+
+
+class FailingRegistry(object):
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_by_id(self, schema_id):
+        self.requests += 1
+        raise ConnectionError("registry is down")
+
+
+def write_cache(path, registry_url):
+    path.write_text(json.dumps({"registry_url": registry_url, "subjects": {},
+                                "schemas": {"7": json.dumps(SCHEMA)}}))
+
+
+def test_cache_of_the_same_registry_is_used(tmp_path):
+    cache = tmp_path / "cache.json"
+    write_cache(cache, "http://a:8081")
+    schemas = SchemaManager("http://a:8081", str(cache))
+    schemas._client = FailingRegistry()
+    schemas.schema(7)
+    assert schemas.stats["hits"] == 1
+
+
+def test_cache_of_another_registry_is_ignored(tmp_path):
+    cache = tmp_path / "cache.json"
+    write_cache(cache, "http://a:8081")
+    schemas = SchemaManager("http://b:8081", str(cache))
+    assert schemas.schemas == {}
+
+
+def test_registry_outage_makes_the_message_unreadable(tmp_path):
+    schemas = SchemaManager("http://a:8081", str(tmp_path / "cache.json"))
+    registry = schemas._client = FailingRegistry()
+    for _ in range(3):
+        # the converters drop KeyErrors as unreadable messages
+        with pytest.raises(KeyError):
+            schemas.schema(7)
+    with pytest.raises(SchemaUnavailable):
+        schemas.schema(7)
+    assert registry.requests == 1
+    assert schemas.stats["errors"] == 1
+
+
+class CountingRegistry(object):
+
+    def __init__(self, first_id):
+        self.next_id = first_id
+
+    def register(self, subject, schema):
+        self.next_id += 1
+        return self.next_id
+
+
+def test_concurrent_savers_keep_each_others_subjects(tmp_path):
+    cache = str(tmp_path / "cache.json")
+    # both managers load the (missing) cache before either saves, like two workers started together
+    first = SchemaManager("http://a:8081", cache)
+    second = SchemaManager("http://a:8081", cache)
+    first._client = CountingRegistry(100)
+    second._client = CountingRegistry(200)
+    first.register("bird-key", "key_schema.json")
+    second.register("lime-key", "key_schema.json")
+    reloaded = SchemaManager("http://a:8081", cache)
+    assert {s: e["id"] for s, e in reloaded.subjects.items()} == {"bird-key": 101, "lime-key": 201}
+    assert set(reloaded.schemas) == {101, 201}
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Codec round trips, on their own and through the streamer's Faust records"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from faust.serializers.registry import Registry
+from serde import CODECS, get_codec
+from streamer import LocationEvent, faust_codec
+
+EVENT = {"id": "bird-1", "is_disabled": 0, "is_reserved": 1, "last_updated": 1600000000,
+         "lat": 38.900001525878906, "lon": -77.02999877929688, "operator": "bird", "type": "scooter",
+         "geo7": "dqcjqcp", "geo8": "dqcjqcpe", "geo9": "dqcjqcpe5", "timestamp": "2020-09-13 12:26:40",
+         "geo6": "dqcjqc", "zone": None}
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_codec_round_trip(name):
+    codec = get_codec(name)
+    assert codec.decode(codec.encode(EVENT)) == EVENT
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_streamer_sends_with_the_topic_codec(name):
+    # what the streamer sends to a .streaming topic has to be readable by converter_out's codec
+    payload = Registry().dumps_value(LocationEvent, LocationEvent(**EVENT), serializer=faust_codec(name))
+    assert get_codec(name).decode(payload) == EVENT
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_streamer_reads_the_topic_codec(name):
+    event = Registry().loads_value(LocationEvent, get_codec(name).encode(EVENT), serializer=faust_codec(name))
+    assert isinstance(event, LocationEvent)
+    assert event.asdict() == EVENT
+
+
+def test_avro_codec_rejects_json():
+    with pytest.raises((ValueError, EOFError)):
+        get_codec("avro").decode(get_codec("json").encode(EVENT)[:8])
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Streamer batch enrichment"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+from enrichment import geohashes
+from streamer import LocationEvent, batch_attribute_convertor, valid_events
+
+
+def event(vehicle_id, lat=38.9, lon=-77.03):
+    return LocationEvent(id=vehicle_id, is_disabled=0, is_reserved=0, last_updated=1600000000, lat=lat, lon=lon,
+                         operator="bird", type="scooter", geo7=None, geo8=None, geo9=None, timestamp=None)
+
+
+def test_one_malformed_event_does_not_drop_its_batch():
+    batch = [event("1"), event("2", lat=None), event("3", lon="x"), event("4")]
+    enriched = batch_attribute_convertor(valid_events(batch))
+    assert [e.id for e in enriched] == ["1", "4"]
+    assert all(e.geo9 == geohashes(38.9, -77.03)["geo9"] and e.timestamp for e in enriched)
+
+
+def test_a_batch_of_malformed_events_enriches_nothing():
+    assert batch_attribute_convertor(valid_events([event("1", lat=None)])) == []
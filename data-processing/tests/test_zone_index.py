@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Compiled zone index against exact point-in-polygon tests"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import random
+import geohash
+from zone_index import Zone, ZoneIndex
+
+LAT, LON = 38.89, -77.03
+
+
+def square(name, lon, lat, size, hole=None):
+    rings = [[(lon, lat), (lon + size, lat), (lon + size, lat + size), (lon, lat + size)]]
+    if hole is not None:
+        hx, hy, hs = hole
+        rings.append([(hx, hy), (hx + hs, hy), (hx + hs, hy + hs), (hx, hy + hs)])
+    return Zone(name, [rings])
+
+
+def first_match(zones, lat, lon):
+    return next((zone.name for zone in zones if zone.contains(lat, lon)), None)
+
+
+def check(zones, index, points):
+    for lat, lon in points:
+        assert index.lookup(geohash.encode(lat, lon, 9), lat, lon) == first_match(zones, lat, lon), (lat, lon)
+
+
+def boundary_points(index, per_cell=3, seed=1):
+    # locations inside the cells that fall back to the exact test
+    rnd = random.Random(seed)
+    points = []
+    for cell, entry in index.cells.items():
+        if isinstance(entry, str):
+            continue
+        b = geohash.bbox(cell)
+        points.extend((rnd.uniform(b['s'], b['n']), rnd.uniform(b['w'], b['e'])) for _ in range(per_cell))
+    return points
+
+
+def random_points(n=3000, seed=2):
+    rnd = random.Random(seed)
+    return [(LAT + rnd.uniform(-0.01, 0.08), LON + rnd.uniform(-0.01, 0.08)) for _ in range(n)]
+
+
+def adjacent_zones():
+    # two neighbours sharing an edge, the first with a hole, and a triangle
+    triangle = Zone("c", [[[(LON, LAT + 0.04), (LON + 0.06, LAT + 0.04), (LON + 0.03, LAT + 0.07)]]])
+    return [square("a", LON, LAT, 0.03, hole=(LON + 0.01, LAT + 0.01, 0.01)), square("b", LON + 0.03, LAT, 0.03),
+            triangle]
+
+
+def test_lookup_agrees_with_point_in_polygon():
+    zones = adjacent_zones()
+    index = ZoneIndex.compile(zones, min_level=5, max_level=7)
+    assert any(not isinstance(entry, str) for entry in index.cells.values())
+    assert any(isinstance(entry, str) for entry in index.cells.values())
+    check(zones, index, random_points())
+    check(zones, index, boundary_points(index))
+    assert index.stats["exact"] > 0 and index.stats["indexed"] > 0
+
+
+def test_cells_inside_a_zone_are_stored_whole():
+    zones = [square("big", LON, LAT, 0.2)]
+    index = ZoneIndex.compile(zones, min_level=5, max_level=7)
+    lat, lon = LAT + 0.1, LON + 0.1
+    code = geohash.encode(lat, lon, 9)
+    assert index.cells.get(code[:5]) == "big"
+    assert index.lookup(code, lat, lon) == "big"
+    assert index.stats == {"indexed": 1, "exact": 0, "missed": 0}
+
+
+def test_overlapping_zones_resolve_to_the_first_feature():
+    outer = square("outer", LON, LAT, 0.06)
+    inner = square("inner", LON + 0.02, LAT + 0.02, 0.02)
+    for zones in ([inner, outer], [outer, inner]):
+        index = ZoneIndex.compile(zones, min_level=5, max_level=7)
+        check(zones, index, random_points())
+        check(zones, index, boundary_points(index))
+    # listed second, the inner zone is shadowed everywhere
+    index = ZoneIndex.compile([outer, inner], min_level=5, max_level=7)
+    assert "inner" not in {name for entry in index.cells.values()
+                           for name in ([entry] if isinstance(entry, str) else entry)}
+
+
+def test_saved_index_looks_up_the_same(tmp_path):
+    zones = adjacent_zones()
+    index = ZoneIndex.compile(zones, min_level=5, max_level=7)
+    index.save(str(tmp_path / "zones.json"))
+    loaded = ZoneIndex.load(str(tmp_path / "zones.json"))
+    assert loaded.cells == index.cells
+    check(zones, loaded, random_points(500) + boundary_points(index, 1))
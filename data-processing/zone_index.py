@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Zone index
+
+Compiles zone polygons (GeoJSON) into a geohash prefix table. Cells fully
+inside one zone are stored at the coarsest level that fits; only cells on a
+zone boundary at the finest level keep their candidate zones and fall back
+to an exact point-in-polygon test. A lookup walks the prefixes of the event
+geohash, so tagging an event costs at most `max_level` dictionary lookups.
+Zones may overlap: a location inside several zones gets the first of them in
+the order of the GeoJSON features, as with testing the zones one by one.
+
+    python zone_index.py wards.geojson -n NAME -o wards.zones.json
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import json
+import time
+import geohash
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+INSIDE, OUTSIDE, BOUNDARY = 0, 1, 2
+
+
+def point_in_rings(lon, lat, rings):
+    """
+    Ray casting test of a point against a polygon, the first ring is the shell and the others holes
+    Args:
+        lon (float): longitude
+        lat (float): latitude
+        rings (list): rings of [lon, lat] vertices
+    """
+    inside = False
+    for ring in rings:
+        j = len(ring) - 1
+        for i in range(len(ring)):
+            xi, yi = ring[i]
+            xj, yj = ring[j]
+            if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+    return inside
+
+
+def _segment_hits_box(x1, y1, x2, y2, w, s, e, n):
+    # Liang-Barsky clipping of the segment against the box
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - w), (dx, e - x1), (-dy, y1 - s), (dy, n - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+class Zone(object):
+    """
+    A named (multi)polygon
+    Args:
+        name (str): the zone name
+        polygons (list): polygons, each a list of rings of [lon, lat] vertices
+    """
+
+    def __init__(self, name, polygons):
+        self.name = name
+        self.polygons = polygons
+        xs = [x for polygon in polygons for ring in polygon for x, _ in ring]
+        ys = [y for polygon in polygons for ring in polygon for _, y in ring]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, lat, lon):
+        """
+        Exact point-in-polygon test
+        """
+        w, s, e, n = self.bbox
+        if not (w <= lon <= e and s <= lat <= n):
+            return False
+        return any(point_in_rings(lon, lat, polygon) for polygon in self.polygons)
+
+    def classify(self, w, s, e, n):
+        """
+        Returns INSIDE, OUTSIDE or BOUNDARY for a lon/lat box
+        """
+        zw, zs, ze, zn = self.bbox
+        if e < zw or w > ze or n < zs or s > zn:
+            return OUTSIDE
+        for polygon in self.polygons:
+            for ring in polygon:
+                for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                    if _segment_hits_box(x1, y1, x2, y2, w, s, e, n):
+                        return BOUNDARY
+        # no edge crosses the box, so it lies entirely on one side
+        return INSIDE if self.contains((s + n) / 2, (w + e) / 2) else OUTSIDE
+
+
+def load_zones(path, name_field):
+    """
+    Reads the zones of a GeoJSON FeatureCollection of Polygons and MultiPolygons
+    Args:
+        path (str): the GeoJSON file
+        name_field (str): the feature property holding the zone name
+    """
+    with open(path) as file:
+        collection = json.load(file)
+    zones = []
+    for feature in collection['features']:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        # GeoJSON repeats the first vertex at the end of a ring
+        polygons = [[[tuple(v[:2]) for v in ring[:-1]] for ring in polygon] for polygon in polygons]
+        zones.append(Zone(str(feature['properties'][name_field]), polygons))
+    return zones
+
+
+def _box(cell):
+    b = geohash.bbox(cell)
+    return b['w'], b['s'], b['e'], b['n']
+
+
+def _cover(bbox, level):
+    # cells of a level covering a lon/lat box
+    w, s, e, n = bbox
+    cells = set()
+    lat_step, lon_step = (2 * err for err in geohash.decode_exactly(geohash.encode(s, w, level))[2:])
+    lat = s
+    while lat <= n + lat_step:
+        lon = w
+        while lon <= e + lon_step:
+            cells.add(geohash.encode(min(lat, 90.0), min(lon, 180.0), level))
+            lon += lon_step
+        lat += lat_step
+    return cells
+
+
+class ZoneIndex(object):
+    """
+    Geohash prefix table of zones
+    Args:
+        zones (list): Zone objects
+        cells (dict): zone name of every fully covered prefix, or the candidate zone names of a boundary cell
+        min_level (int): the coarsest prefix stored
+        max_level (int): the finest prefix stored
+    """
+
+    def __init__(self, zones, cells, min_level, max_level):
+        self.zones = {zone.name: zone for zone in zones}
+        self.cells = cells
+        self.min_level = min_level
+        self.max_level = max_level
+        self.stats = {"indexed": 0, "exact": 0, "missed": 0}
+
+    @classmethod
+    def compile(cls, zones, min_level=5, max_level=8):
+        """
+        Subdivides the cells of the zones' bounding boxes until each is inside one zone or max_level is reached
+        Args:
+            zones (list): Zone objects, a location in overlapping zones belongs to the first of them
+            min_level (int): level of the initial cover
+            max_level (int): level below which boundary cells are not subdivided
+        """
+        cells = {}
+        w = min(z.bbox[0] for z in zones)
+        s = min(z.bbox[1] for z in zones)
+        e = max(z.bbox[2] for z in zones)
+        n = max(z.bbox[3] for z in zones)
+        pending = [(cell, zones) for cell in _cover((w, s, e, n), min_level)]
+        while pending:
+            cell, candidates = pending.pop()
+            box = _box(cell)
+            boundary = []
+            owner = None
+            for zone in candidates:
+                kind = zone.classify(*box)
+                if kind == INSIDE:
+                    owner = zone
+                    break
+                if kind == BOUNDARY:
+                    boundary.append(zone)
+            if owner is not None and not boundary:
+                cells[cell] = owner.name
+                continue
+            if owner is not None:
+                # an earlier zone overlaps the owner within the cell and wins wherever it contains the location
+                boundary.append(owner)
+            if boundary and len(cell) < max_level:
+                pending.extend((cell + c, boundary) for c in BASE32)
+            elif boundary:
+                cells[cell] = [zone.name for zone in boundary]
+        return cls(zones, cells, min_level, max_level)
+
+    def lookup(self, code, lat, lon):
+        """
+        Returns the zone name of a location or None
+        Args:
+            code (str): a geohash of the location of at least max_level characters
+            lat (float): latitude, used on boundary cells only
+            lon (float): longitude, used on boundary cells only
+        """
+        cells = self.cells
+        for level in range(self.min_level, self.max_level + 1):
+            entry = cells.get(code[:level])
+            if entry is None:
+                continue
+            if isinstance(entry, str):
+                self.stats["indexed"] += 1
+                return entry
+            self.stats["exact"] += 1
+            for name in entry:
+                if self.zones[name].contains(float(lat), float(lon)):
+                    return name
+            return None
+        self.stats["missed"] += 1
+        return None
+
+    def save(self, path):
+        """
+        Writes the compiled index and the polygons of its zones
+        Args:
+            path (str): the output JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump({"min_level": self.min_level, "max_level": self.max_level,
+                       "zones": {name: zone.polygons for name, zone in self.zones.items()},
+                       "cells": self.cells}, file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index written by save
+        Args:
+            path (str): the compiled JSON file
+        """
+        with open(path) as file:
+            data = json.load(file)
+        zones = [Zone(name, [[[tuple(v) for v in ring] for ring in polygon] for polygon in polygons])
+                 for name, polygons in data['zones'].items()]
+        return cls(zones, data['cells'], data['min_level'], data['max_level'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zone index compiler")
+    parser.add_argument('geojson', help="GeoJSON FeatureCollection of the zone polygons")
+    parser.add_argument('-n', dest="name_field", default="NAME",
+                        help="Feature property holding the zone name")
+    parser.add_argument('-o', dest="output", required=True,
+                        help="Compiled index (JSON)")
+    parser.add_argument('--min-level', dest="min_level", type=int, default=5,
+                        help="Coarsest geohash level of the index")
+    parser.add_argument('--max-level', dest="max_level", type=int, default=8,
+                        help="Finest geohash level, boundary cells of this level are checked exactly")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    index = ZoneIndex.compile(load_zones(args.geojson, args.name_field), args.min_level, args.max_level)
+    index.save(args.output)
+    boundary = sum(1 for entry in index.cells.values() if not isinstance(entry, str))
+    print(f"{len(index.zones)} zones, {len(index.cells):,} cells ({boundary:,} boundary) "
+          f"compiled in {time.perf_counter() - t0:.1f} s")
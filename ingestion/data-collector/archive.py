@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""Collector archive
+
+Time-partitioned, compressed, columnar archive of collector records.
+layout: {root}/{operator}/{YYYY-MM-DD}/{HH}/part-{first_last_updated}-{seq}.tla
+file: MAGIC, header frame (schema), block frames (zlib compressed columns),
+      footer frame (row count and block index), footer offset, MAGIC
+Every frame is `type (1 byte) | length (uint32) | body`, so a file left open
+by a crash can still be read block by block up to its last complete frame.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import json
+import os
+import struct
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+MAGIC = b"TLA1"
+HEADER, BLOCK, FOOTER = b"H", b"B", b"F"
+FRAME = struct.Struct("<cI")
+BLOCK_INFO = struct.Struct("<Iqq")
+TRAILER = struct.Struct("<Q4s")
+TIME_COLUMN = "last_updated"
+
+SCHEMA = [
+    ("bike_id", "str"),
+    ("event", "str"),
+    ("is_disabled", "bool"),
+    ("is_reserved", "bool"),
+    ("last_updated", "int"),
+    ("lat", "float"),
+    ("lon", "float"),
+    ("operator", "str"),
+    ("vehicle_type", "str"),
+]
+
+
+def to_bool(val):
+    """
+    Converts feed booleans (True, 'true', 1, '1', ...) to 0/1
+    """
+    if isinstance(val, str):
+        return 1 if val.lower() in ("true", "1", "yes") else 0
+    return 1 if val else 0
+
+
+def encode_column(kind, values):
+    """
+    Encodes a column of values as bytes
+    Args:
+        kind (str): column type, one of int, float, bool and str
+        values (list): the column values
+    """
+    if kind == "int":
+        return array("q", (int(v or 0) for v in values)).tobytes()
+    if kind == "float":
+        return array("d", (float(v or 0.0) for v in values)).tobytes()
+    if kind == "bool":
+        return bytes(to_bool(v) for v in values)
+    encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+    return array("I", (len(v) for v in encoded)).tobytes() + b"".join(encoded)
+
+
+def decode_column(kind, data, offset, rows):
+    """
+    Decodes a column, returns the values and the offset of the next column
+    Args:
+        kind (str): column type, one of int, float, bool and str
+        data (bytes): the uncompressed block
+        offset (int): where the column starts in data
+        rows (int): number of rows of the block
+    """
+    if kind in ("int", "float"):
+        values = array("q" if kind == "int" else "d")
+        end = offset + rows * values.itemsize
+        values.frombytes(data[offset:end])
+        return values.tolist(), end
+    if kind == "bool":
+        end = offset + rows
+        return list(data[offset:end]), end
+    lengths = array("I")
+    end = offset + rows * lengths.itemsize
+    lengths.frombytes(data[offset:end])
+    values = []
+    for length in lengths:
+        values.append(data[end:end + length].decode("utf-8"))
+        end += length
+    return values, end
+
+
+def partition_dir(root, operator, epoch):
+    """
+    Returns the {root}/{operator}/{date}/{hour} directory of an epoch time
+    """
+    t = datetime.fromtimestamp(epoch, tz=timezone.utc)
+    return Path(root) / operator / t.strftime("%Y-%m-%d") / t.strftime("%H")
+
+
+class ArchiveWriter(object):
+    """
+    Appends records of one operator to rotating archive files
+    Args:
+        root (str): root directory of the archive
+        operator (str): the operator name
+        schema (list): (column, type) pairs
+        block_rows (int): rows buffered before a block is compressed and written
+        block_seconds (float): seconds after which a block is written whatever its number of rows
+        max_bytes (int): rotate the file once it grows past this size
+        max_age (float): rotate the file once it has been open this long (seconds)
+        level (int): zlib compression level
+    """
+
+    def __init__(self, root, operator, schema=SCHEMA, block_rows=50000, block_seconds=60.0,
+                 max_bytes=256 * 2 ** 20, max_age=3600, level=6):
+        self.root = root
+        self.operator = operator
+        self.schema = schema
+        self.block_rows = block_rows
+        self.block_seconds = block_seconds
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.level = level
+        self.file = None
+        self.path = None
+        self.partition = None
+        self.opened = 0
+        self.seq = 0
+        self.rows = 0
+        self.blocks = []
+        self.columns = {name: [] for name, _ in schema}
+        self.buffered = 0
+        self.block_started = 0.0
+
+    def _write_frame(self, kind, body):
+        self.file.write(FRAME.pack(kind, len(body)))
+        self.file.write(body)
+
+    def _open(self, epoch):
+        directory = partition_dir(self.root, self.operator, epoch)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.seq += 1
+        self.path = directory / f"part-{int(epoch)}-{self.seq:04d}.tla"
+        self.file = open(self.path, "wb")
+        self.partition = directory
+        self.opened = time.time()
+        self.rows = 0
+        self.blocks = []
+        self.file.write(MAGIC)
+        header = {"version": 1, "operator": self.operator, "schema": self.schema,
+                  "compression": "zlib", "created": int(self.opened)}
+        self._write_frame(HEADER, json.dumps(header).encode("utf-8"))
+
+    def _flush_block(self):
+        if not self.buffered:
+            return
+        times = self.columns[TIME_COLUMN] if TIME_COLUMN in self.columns else [0]
+        min_ts, max_ts = int(min(times)), int(max(times))
+        payload = b"".join(encode_column(kind, self.columns[name]) for name, kind in self.schema)
+        body = BLOCK_INFO.pack(self.buffered, min_ts, max_ts) + zlib.compress(payload, self.level)
+        offset = self.file.tell()
+        self._write_frame(BLOCK, body)
+        self.blocks.append({"offset": offset, "length": FRAME.size + len(body), "rows": self.buffered,
+                            "min_ts": min_ts, "max_ts": max_ts})
+        self.rows += self.buffered
+        self.columns = {name: [] for name, _ in self.schema}
+        self.buffered = 0
+
+    def _rotate_due(self, epoch):
+        return (self.file.tell() >= self.max_bytes
+                or time.time() - self.opened >= self.max_age
+                or partition_dir(self.root, self.operator, epoch) != self.partition)
+
+    def write(self, records, epoch=None):
+        """
+        Appends records, rotating the file on size, age or a new hour partition
+        Args:
+            records (list): dicts holding (a superset of) the schema columns
+            epoch (int): time used for partitioning, now if None
+        """
+        now = time.time()
+        epoch = int(now) if epoch is None else epoch
+        if self.file is not None and self._rotate_due(epoch):
+            self.close()
+        if self.file is None:
+            self._open(epoch)
+        for d in records:
+            if not self.buffered:
+                self.block_started = now
+            for name, _ in self.schema:
+                self.columns[name].append(d.get(name))
+            self.buffered += 1
+            if self.buffered >= self.block_rows:
+                self._flush_block()
+                # the size only grows by whole blocks, so it is checked as soon as one is written
+                if self.file.tell() >= self.max_bytes:
+                    self.close()
+                    self._open(epoch)
+        # a slow feed still reaches the disk, and the size rotation, within block_seconds
+        if self.buffered and now - self.block_started >= self.block_seconds:
+            self._flush_block()
+
+    def close(self):
+        """
+        Writes the pending block and the footer, then closes the file
+        """
+        if self.file is None:
+            return
+        self._flush_block()
+        footer_offset = self.file.tell()
+        footer = {"rows": self.rows, "blocks": self.blocks}
+        self._write_frame(FOOTER, json.dumps(footer).encode("utf-8"))
+        self.file.write(TRAILER.pack(footer_offset, MAGIC))
+        self.file.close()
+        self.file = None
+
+
+class ArchiveReader(object):
+    """
+    Reads an archive file block by block
+    Args:
+        path (str): the archive file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an archive file")
+        kind, length = FRAME.unpack(self.file.read(FRAME.size))
+        if kind != HEADER:
+            raise ValueError(f"{path} has no header")
+        self.header = json.loads(self.file.read(length))
+        self.schema = [tuple(c) for c in self.header["schema"]]
+        self.footer = self._read_footer()
+
+    def _read_footer(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size < TRAILER.size:
+            return None
+        self.file.seek(size - TRAILER.size)
+        footer_offset, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != MAGIC:
+            return None
+        self.file.seek(footer_offset)
+        kind, length = FRAME.unpack(self.file.read(FRAME.size))
+        return json.loads(self.file.read(length)) if kind == FOOTER else None
+
+    @property
+    def rows(self):
+        """
+        Number of rows of a closed file, None for a file that was not closed
+        """
+        return self.footer["rows"] if self.footer else None
+
+    def _scan_blocks(self):
+        # recovery path for files without footer
+        self.file.seek(len(MAGIC))
+        while True:
+            offset = self.file.tell()
+            frame = self.file.read(FRAME.size)
+            if len(frame) < FRAME.size:
+                return
+            kind, length = FRAME.unpack(frame)
+            if kind == BLOCK:
+                info = self.file.read(BLOCK_INFO.size)
+                if len(info) < BLOCK_INFO.size:
+                    return
+                rows, min_ts, max_ts = BLOCK_INFO.unpack(info)
+                yield {"offset": offset, "length": FRAME.size + length, "rows": rows,
+                       "min_ts": min_ts, "max_ts": max_ts}
+                self.file.seek(offset + FRAME.size + length)
+            elif kind == HEADER:
+                self.file.seek(length, os.SEEK_CUR)
+            else:
+                return
+
+    def _read_block(self, block):
+        self.file.seek(block["offset"])
+        body = self.file.read(block["length"])[FRAME.size:]
+        rows = block["rows"]
+        try:
+            data = zlib.decompress(body[BLOCK_INFO.size:])
+        except zlib.error:
+            return None
+        columns, offset = {}, 0
+        for name, kind in self.schema:
+            columns[name], offset = decode_column(kind, data, offset, rows)
+        return columns
+
+    def iter_batches(self, start=None, end=None):
+        """
+        Yields blocks as dicts of columns, skipping blocks outside [start, end)
+        Args:
+            start (int): first epoch time to return, None for no lower bound
+            end (int): epoch time to stop at, None for no upper bound
+        """
+        blocks = self.footer["blocks"] if self.footer else list(self._scan_blocks())
+        for block in blocks:
+            if (start is not None and block["max_ts"] < start) or (end is not None and block["min_ts"] >= end):
+                continue
+            columns = self._read_block(block)
+            if columns is None:
+                return
+            if (start is not None and block["min_ts"] < start) or (end is not None and block["max_ts"] >= end):
+                keep = [i for i, t in enumerate(columns[TIME_COLUMN])
+                        if (start is None or t >= start) and (end is None or t < end)]
+                columns = {name: [values[i] for i in keep] for name, values in columns.items()}
+            yield columns
+
+    def iter_records(self, start=None, end=None):
+        """
+        Yields records as dicts
+        """
+        for columns in self.iter_batches(start, end):
+            names = list(columns)
+            for row in zip(*(columns[name] for name in names)):
+                yield dict(zip(names, row))
+
+    def close(self):
+        self.file.close()
+
+
+def find_files(root, operator, start=None, end=None):
+    """
+    Lists the archive files of an operator whose hour partition overlaps [start, end)
+    Args:
+        root (str): root directory of the archive
+        operator (str): the operator name
+        start (int): first epoch time, None for no lower bound
+        end (int): last epoch time (excluded), None for no upper bound
+    """
+    first = partition_dir(root, operator, start) if start is not None else None
+    last = partition_dir(root, operator, end - 1) if end is not None else None
+    files = []
+    for path in sorted((Path(root) / operator).glob("*/*/part-*.tla")):
+        directory = path.parent
+        if first is not None and (directory.parent.name, directory.name) < (first.parent.name, first.name):
+            continue
+        if last is not None and (directory.parent.name, directory.name) > (last.parent.name, last.name):
+            continue
+        files.append(path)
+    return files
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""GBFS data collector
+
+Polls the free_bike_status feed of every operator listed in operators.json
+concurrently from a single event loop, sharing one keep-alive connection pool.
+Each feed is polled when its GBFS ttl expires and unchanged payloads are skipped.
+data columns: bike_id, is_disabled, is_reserved, last_updated, lat, lon, operator, (vehicle_type, ...)
+and, in delta mode, event: keyframe, appeared, disappeared, moved or status
+Trips and relocations can be inferred from consecutive snapshots (trip_inference.py).
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.2'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+import aiohttp
+from poll_scheduler import FeedSchedule
+from snapshot_delta import SnapshotDelta
+from archive import ArchiveWriter
+from trip_inference import KafkaTripSink, TextTripSink, TripInference
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = f"{Path(__file__).parents[0]}/operators.json"
+# log the polling statistics of a feed every STATS_EVERY polls
+STATS_EVERY = 600
+
+
+def load_operators(config_path, operators=None):
+    """
+    Loads the operator feed table
+    Args:
+        config_path (str): path to the JSON feed table
+        operators (list): optional operator names to keep, all operators if None
+    """
+    with open(config_path) as f:
+        feeds = json.load(f)
+    if operators:
+        feeds = [feed for feed in feeds if feed['operator'] in operators]
+    return feeds
+
+
+def extract_bikes(payload, bikes_path):
+    """
+    Returns the list of vehicles from a decoded feed
+    Args:
+        payload (dict): the decoded JSON feed
+        bikes_path (list): keys leading to the vehicle list, e.g. ["data", "bikes"]
+    """
+    for key in bikes_path:
+        payload = payload[key]
+    return payload
+
+
+def format_record(d):
+    """
+    Formats a vehicle as a `key:val, key:val` line
+    Args:
+        d (dict): the vehicle attributes
+    """
+    return ', '.join("{}:{}".format(key, val) for (key, val) in sorted(d.items())) + '\n'
+
+
+def write_snapshot(operator, bikes, output_dir, delta=None, archive=None, trips=None):
+    """
+    Appends one snapshot of an operator's fleet to {operator}.txt or to the archive
+    Args:
+        operator (str): the operator name
+        bikes (list): vehicles of the snapshot
+        output_dir (str): directory of the output files
+        delta (SnapshotDelta): if given, only the change events of the snapshot are written
+        archive (ArchiveWriter): if given, records are written to the archive instead of text
+        trips (TripInference): if given, trips and relocations are inferred from the snapshot
+    """
+    last_updated = int(datetime.utcnow().timestamp())
+    for d in bikes:
+        d.update({"last_updated": last_updated, "operator": operator})
+    if delta is not None:
+        # the trip inference reuses the changes of this diff instead of diffing the snapshot again
+        previous = delta.previous
+        bikes = delta.diff(bikes, last_updated)
+        if trips is not None:
+            trips.infer(delta.changes, previous, last_updated)
+    elif trips is not None:
+        trips.update(bikes, last_updated)
+    if archive is not None:
+        archive.write(bikes, last_updated)
+        return
+    with open(f"{output_dir}/{operator}.txt", 'a') as file:
+        for d in bikes:
+            file.write(format_record(d))
+
+
+async def fetch_feed(session, feed, schedule):
+    """
+    Downloads and decodes an operator feed, returns None on failure or when
+    the feed did not change since the previous poll
+    Args:
+        session (aiohttp.ClientSession): the shared HTTP session
+        feed (dict): an entry of the feed table
+        schedule (FeedSchedule): the polling state of the feed
+    """
+    try:
+        async with session.get(feed['url'], headers=schedule.request_headers()) as response:
+            if response.status == 304:
+                schedule.on_not_modified()
+                return None
+            if response.status != 200:
+                logger.error(f"{feed['operator']}: unexpected status {response.status}")
+                schedule.on_error()
+                return None
+            body = await response.read()
+            if not schedule.on_response(body, response.headers):
+                return None
+        payload = json.loads(body)
+    except asyncio.TimeoutError:
+        logger.error(f"{feed['operator']}: timeout error")
+        schedule.on_error()
+        return None
+    except aiohttp.ClientError as e:
+        logger.error(f"{feed['operator']}: connection error {e}")
+        schedule.on_error()
+        return None
+    except ValueError as e:
+        logger.error(f"{feed['operator']}: invalid JSON {e}")
+        # on_response counted the poll already
+        schedule.on_error(counted=True)
+        return None
+    if not schedule.on_payload(payload):
+        return None
+    return payload
+
+
+async def poll_feed(session, feed, schedule, output_dir, delta=None, archive=None, trips=None):
+    """
+    Polls a single feed forever, as often as its schedule allows
+    Args:
+        session (aiohttp.ClientSession): the shared HTTP session
+        feed (dict): an entry of the feed table
+        schedule (FeedSchedule): the polling state of the feed
+        output_dir (str): directory of the output files
+        delta (SnapshotDelta): the previous snapshot of the feed in delta mode, None otherwise
+        archive (ArchiveWriter): the archive of the feed, None to write text files
+        trips (TripInference): the trip inference of the feed, None to infer no trips
+    """
+    while True:
+        payload = await fetch_feed(session, feed, schedule)
+        if payload is not None:
+            try:
+                bikes = extract_bikes(payload, feed['bikes_path'])
+                write_snapshot(feed['operator'], bikes, output_dir, delta, archive, trips)
+            except (KeyError, TypeError) as e:
+                logger.error(f"{feed['operator']}: unexpected feed layout {e}")
+                schedule.on_error(counted=True)
+        if schedule.stats["polls"] % STATS_EVERY == 0:
+            logger.info(f"{feed['operator']}: {schedule.stats}")
+            if trips is not None:
+                logger.info(f"{feed['operator']}: trips {trips.stats}")
+        await asyncio.sleep(schedule.delay())
+
+
+async def collect(feeds, intervals, output_dir, pool_size, timeout, keyframe_interval=None, archive_options=None,
+                  trip_sink=None):
+    """
+    Polls every feed concurrently over one connection pool
+    Args:
+        feeds (list): the feed table
+        intervals (dict): FeedSchedule interval settings shared by all feeds
+        output_dir (str): directory of the output files
+        pool_size (int): maximum number of pooled connections
+        timeout (float): total timeout of a request in seconds
+        keyframe_interval (float): seconds between two full snapshots in delta mode,
+            None to write every snapshot in full
+        archive_options (dict): ArchiveWriter settings to write archives, None to write text files
+        trip_sink (callable): receives the trip events inferred from every feed, None to infer no trips
+    """
+    archives = {feed['operator']: ArchiveWriter(output_dir, feed['operator'], **archive_options)
+                for feed in feeds} if archive_options is not None else {}
+    connector = aiohttp.TCPConnector(limit=pool_size, ttl_dns_cache=300, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        try:
+            await asyncio.gather(*(poll_feed(session, feed, FeedSchedule(**intervals), output_dir,
+                                             None if keyframe_interval is None else SnapshotDelta(keyframe_interval),
+                                             archives.get(feed['operator']),
+                                             None if trip_sink is None else TripInference(feed['operator'], trip_sink))
+                                   for feed in feeds))
+        finally:
+            for archive in archives.values():
+                archive.close()
+            if trip_sink is not None:
+                trip_sink.close()
+
+
+def main(args):
+    feeds = load_operators(args.config, args.operators)
+    logger.info(f"collecting {', '.join(feed['operator'] for feed in feeds)}")
+    intervals = {"min_interval": args.min_interval, "default_interval": args.interval,
+                 "max_interval": args.max_interval}
+    archive_options = {"max_bytes": args.rotate_mb * 2 ** 20, "max_age": args.rotate_seconds,
+                       "block_seconds": args.block_seconds} if args.format == 'archive' else None
+    trip_sink = None
+    if args.trips == 'file':
+        trip_sink = TextTripSink(args.output_dir)
+    elif args.trips:
+        trip_sink = KafkaTripSink(args.trips)
+    try:
+        asyncio.run(collect(feeds, intervals, args.output_dir, args.pool_size, args.timeout,
+                            args.keyframe_interval if args.delta else None, archive_options, trip_sink))
+    except KeyboardInterrupt:
+        logger.info("shutting down")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="GBFS data collector")
+    parser.add_argument('-c', dest="config", default=DEFAULT_CONFIG,
+                        help="Operator feed table (JSON)")
+    parser.add_argument('-o', dest="operators", nargs='*',
+                        help="Operator name(s), all operators of the table if omitted")
+    parser.add_argument('-d', dest="output_dir", default='.',
+                        help="Output directory")
+    parser.add_argument('-i', dest="interval", type=float, default=1.0,
+                        help="Seconds between two polls of a feed that publishes no ttl")
+    parser.add_argument('--min-interval', dest="min_interval", type=float, default=1.0,
+                        help="Minimum seconds between two polls of a feed")
+    parser.add_argument('--max-interval', dest="max_interval", type=float, default=300.0,
+                        help="Maximum seconds between two polls of a feed, including error back-off")
+    parser.add_argument('--delta', dest="delta", action='store_true',
+                        help="Write only vehicles that appeared, disappeared, moved or changed status")
+    parser.add_argument('--keyframe-interval', dest="keyframe_interval", type=float, default=300.0,
+                        help="Seconds between two full snapshots in delta mode")
+    parser.add_argument('-f', dest="format", choices=['text', 'archive'], default='text',
+                        help="Output format: {operator}.txt lines or compressed archive partitions")
+    parser.add_argument('--rotate-mb', dest="rotate_mb", type=int, default=256,
+                        help="Rotate archive files past this size (MB)")
+    parser.add_argument('--rotate-seconds', dest="rotate_seconds", type=float, default=3600,
+                        help="Rotate archive files open for this long (seconds)")
+    parser.add_argument('--block-seconds', dest="block_seconds", type=float, default=60.0,
+                        help="Write the buffered archive block at least this often (seconds)")
+    parser.add_argument('--trips', dest="trips",
+                        help="Infer trips and relocations and produce them to this Kafka broker, "
+                             "or append them to {operator}.trips.txt with 'file'")
+    parser.add_argument('--pool-size', dest="pool_size", type=int, default=20,
+                        help="Maximum number of pooled HTTP connections")
+    parser.add_argument('--timeout', dest="timeout", type=float, default=10.0,
+                        help="Request timeout in seconds")
+
+    main(parser.parse_args())
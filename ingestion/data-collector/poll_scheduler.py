@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Adaptive GBFS poll scheduler
+
+Decides when each feed is polled next from the GBFS `ttl` and `last_updated`
+fields, detects unchanged payloads (conditional requests and a body hash)
+and backs off per feed on errors.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import hashlib
+import random
+import time
+
+
+class FeedSchedule(object):
+    """
+    Polling state of a single feed
+    Args:
+        min_interval (float): never poll a feed more often than this (seconds)
+        default_interval (float): interval used when the feed publishes no usable ttl
+        max_interval (float): upper bound of any interval, including error back-off
+        backoff_base (float): first back-off delay after an error (seconds)
+    """
+
+    def __init__(self, min_interval=1.0, default_interval=1.0, max_interval=300.0, backoff_base=2.0):
+        self.min_interval = min_interval
+        self.default_interval = default_interval
+        self.max_interval = max_interval
+        self.backoff_base = backoff_base
+        self.etag = None
+        self.last_modified = None
+        self.body_hash = None
+        self.last_updated = None
+        self.ttl = None
+        self.failures = 0
+        self.next_poll = 0.0
+        self.stats = {"polls": 0, "changed": 0, "not_modified": 0, "unchanged": 0, "errors": 0}
+
+    def request_headers(self):
+        """
+        Returns the conditional request headers for the next poll
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def delay(self, now=None):
+        """
+        Returns the number of seconds until the next poll is due
+        """
+        now = time.time() if now is None else now
+        return max(0.0, self.next_poll - now)
+
+    def _interval(self):
+        if self.ttl:
+            return min(max(self.ttl, self.min_interval), self.max_interval)
+        return max(self.default_interval, self.min_interval)
+
+    def on_not_modified(self, now=None):
+        """
+        Records a 304 response
+        """
+        now = time.time() if now is None else now
+        self.stats["polls"] += 1
+        self.stats["not_modified"] += 1
+        self.failures = 0
+        self.next_poll = now + self._interval()
+
+    def on_response(self, body, headers, now=None):
+        """
+        Records a 200 response, returns False if the body is a repeat of the previous one
+        Args:
+            body (bytes): the raw response body
+            headers (Mapping): the response headers
+            now (float): current epoch time
+        """
+        now = time.time() if now is None else now
+        self.stats["polls"] += 1
+        self.failures = 0
+        self.etag = headers.get("ETag", self.etag)
+        self.last_modified = headers.get("Last-Modified", self.last_modified)
+        body_hash = hashlib.blake2b(body, digest_size=16).digest()
+        if body_hash == self.body_hash:
+            self.stats["unchanged"] += 1
+            self.next_poll = now + self._interval()
+            return False
+        self.body_hash = body_hash
+        return True
+
+    def on_payload(self, payload, now=None):
+        """
+        Schedules the next poll from the feed metadata, returns False if the feed
+        `last_updated` did not move since the previous payload
+        Args:
+            payload (dict): the decoded feed
+            now (float): current epoch time
+        """
+        now = time.time() if now is None else now
+        ttl = payload.get("ttl") if isinstance(payload, dict) else None
+        last_updated = payload.get("last_updated") if isinstance(payload, dict) else None
+        self.ttl = ttl if isinstance(ttl, (int, float)) and ttl > 0 else None
+
+        if isinstance(last_updated, (int, float)) and last_updated == self.last_updated:
+            self.stats["unchanged"] += 1
+            self.next_poll = now + self._interval()
+            return False
+
+        self.stats["changed"] += 1
+        interval = self._interval()
+        if isinstance(last_updated, (int, float)) and self.ttl:
+            # the feed will not refresh before last_updated + ttl
+            self.next_poll = min(max(last_updated + self.ttl, now + self.min_interval), now + self.max_interval)
+        else:
+            self.next_poll = now + interval
+        self.last_updated = last_updated
+        return True
+
+    def on_error(self, now=None, counted=False):
+        """
+        Records a failed poll and backs off exponentially with jitter
+        Args:
+            now (float): current epoch time
+            counted (bool): True when on_response already counted the poll, e.g. a payload of unexpected layout
+        """
+        now = time.time() if now is None else now
+        if not counted:
+            self.stats["polls"] += 1
+        self.stats["errors"] += 1
+        self.failures += 1
+        # the exponent is capped so a feed that stays down does not overflow the float
+        backoff = min(self.backoff_base * 2 ** min(self.failures - 1, 16), self.max_interval)
+        self.next_poll = now + backoff * random.uniform(0.5, 1.0)
+        return backoff
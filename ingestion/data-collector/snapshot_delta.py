@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Snapshot delta
+
+Keeps the previous snapshot of a fleet keyed by bike_id and turns every new
+snapshot into change events, with a periodic full keyframe.
+event types: keyframe, appeared, disappeared, moved, status
+A disappeared row repeats the vehicle's last known attributes stamped with
+the snapshot time; main_producer's line parser skips it instead of producing
+it as a position.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+KEYFRAME = "keyframe"
+APPEARED = "appeared"
+DISAPPEARED = "disappeared"
+MOVED = "moved"
+STATUS = "status"
+
+
+def vehicle_state(d):
+    """
+    Returns the attributes whose change is worth an event
+    Args:
+        d (dict): the vehicle attributes
+    """
+    return d.get('lat'), d.get('lon'), d.get('is_disabled'), d.get('is_reserved')
+
+
+class SnapshotDelta(object):
+    """
+    Diffs consecutive snapshots of one operator's fleet
+    Args:
+        keyframe_interval (float): seconds between two full snapshots, 0 for keyframes only
+    """
+
+    def __init__(self, keyframe_interval=300):
+        self.keyframe_interval = keyframe_interval
+        self.previous = {}
+        self.changes = []
+        self.next_keyframe = None
+
+    def diff(self, bikes, now):
+        """
+        Returns the change events between the previous snapshot and this one,
+        every vehicle is returned on a keyframe. The change events are also kept
+        in .changes, keyframe or not, for consumers such as the trip inference
+        Args:
+            bikes (list): vehicles of the new snapshot, each with a bike_id
+            now (int): epoch time of the snapshot
+        """
+        current = {}
+        keyframes = []
+        changes = []
+        initial = self.next_keyframe is None
+        keyframe = initial or now >= self.next_keyframe
+        for d in bikes:
+            bike_id = d.get('bike_id')
+            state = vehicle_state(d)
+            current[bike_id] = (state, d)
+            if keyframe:
+                keyframes.append(dict(d, event=KEYFRAME))
+            previous = self.previous.get(bike_id)
+            if previous is None:
+                # the first snapshot has nothing to compare with
+                if not initial:
+                    changes.append(dict(d, event=APPEARED))
+            elif previous[0] != state:
+                moved = previous[0][:2] != state[:2]
+                changes.append(dict(d, event=MOVED if moved else STATUS))
+
+        disappeared = [dict(d, event=DISAPPEARED, last_updated=now)
+                       for bike_id, (_, d) in self.previous.items() if bike_id not in current]
+        changes += disappeared
+
+        if keyframe:
+            self.next_keyframe = now + self.keyframe_interval
+        self.previous = current
+        self.changes = changes
+        return keyframes + disappeared if keyframe else changes
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Synthetic GBFS feed
+
+Serves a free_bike_status feed of a simulated fleet around DC for local
+tests of the collector and of trip inference. Every tick some parked vehicles
+start a trip (leave the feed), riding vehicles end their trip nearby and a few
+vehicles are relocated far away by the operator. The simulated counts are
+logged so they can be compared with the inferred events.
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CENTER = (38.897841, -77.036594)
+
+
+class SyntheticFleet(object):
+    """
+    A fleet whose vehicles ride, park and get relocated
+    Args:
+        size (int): number of vehicles
+        trip_rate (float): probability per tick that a parked vehicle starts a trip
+        relocation_rate (float): probability per tick that a parked vehicle is relocated
+        seed (int): random seed
+    """
+
+    def __init__(self, size=1000, trip_rate=0.01, relocation_rate=0.001, seed=7):
+        self.rnd = random.Random(seed)
+        self.trip_rate = trip_rate
+        self.relocation_rate = relocation_rate
+        self.parked = {f"synthetic-{i}": self._spot(CENTER, 0.05) for i in range(size)}
+        self.riding = {}
+        self.counts = {"trip_start": 0, "trip_end": 0, "relocation": 0}
+
+    def _spot(self, around, spread):
+        return around[0] + self.rnd.uniform(-spread, spread), around[1] + self.rnd.uniform(-spread, spread)
+
+    def tick(self, now):
+        """
+        Advances the fleet by one tick
+        Args:
+            now (float): epoch time of the tick
+        """
+        for bike_id, (location, end) in list(self.riding.items()):
+            if now >= end:
+                del self.riding[bike_id]
+                self.parked[bike_id] = location
+                self.counts["trip_end"] += 1
+        for bike_id, location in list(self.parked.items()):
+            draw = self.rnd.random()
+            if draw < self.trip_rate:
+                # a ride of 400 m to 3 km at 3 to 7 m/s
+                destination = self._spot(location, 0.02)
+                while abs(destination[0] - location[0]) + abs(destination[1] - location[1]) < 0.004:
+                    destination = self._spot(location, 0.02)
+                meters = 111000 * (abs(destination[0] - location[0]) + abs(destination[1] - location[1]))
+                del self.parked[bike_id]
+                self.riding[bike_id] = (destination, now + meters / self.rnd.uniform(3, 7))
+                self.counts["trip_start"] += 1
+            elif draw < self.trip_rate + self.relocation_rate:
+                self.parked[bike_id] = self._spot(CENTER, 0.05)
+                self.counts["relocation"] += 1
+
+    def payload(self, now, ttl):
+        """
+        Returns the free_bike_status payload of the parked vehicles
+        Args:
+            now (float): epoch time of the payload
+            ttl (int): GBFS ttl of the payload
+        """
+        bikes = [{"bike_id": bike_id, "lat": round(lat, 6), "lon": round(lon, 6),
+                  "is_reserved": 0, "is_disabled": 0, "vehicle_type": "scooter"}
+                 for bike_id, (lat, lon) in self.parked.items()]
+        return {"last_updated": int(now), "ttl": ttl, "data": {"bikes": bikes}}
+
+
+async def run(fleet, port, tick):
+    async def free_bike_status(request):
+        return web.json_response(fleet.payload(time.time(), int(tick)))
+
+    app = web.Application()
+    app.router.add_get('/free_bike_status.json', free_bike_status)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, 'localhost', port).start()
+    logger.info(f"serving http://localhost:{port}/free_bike_status.json")
+    ticks = 0
+    while True:
+        await asyncio.sleep(tick)
+        fleet.tick(time.time())
+        ticks += 1
+        if ticks % 60 == 0:
+            logger.info(f"simulated {fleet.counts}, {len(fleet.riding)} riding")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Synthetic GBFS feed")
+    parser.add_argument('-p', dest="port", type=int, default=8900,
+                        help="Port of the feed")
+    parser.add_argument('-n', dest="size", type=int, default=1000,
+                        help="Number of vehicles")
+    parser.add_argument('-t', dest="tick", type=float, default=1.0,
+                        help="Seconds between two fleet updates")
+    parser.add_argument('--trip-rate', dest="trip_rate", type=float, default=0.01,
+                        help="Probability per tick that a parked vehicle starts a trip")
+    parser.add_argument('--relocation-rate', dest="relocation_rate", type=float, default=0.001,
+                        help="Probability per tick that a parked vehicle is relocated")
+    parser.add_argument('-w', dest="write_config",
+                        help="Write a collector feed table for this feed to the given path and continue")
+    args = parser.parse_args()
+
+    if args.write_config:
+        with open(args.write_config, 'w') as file:
+            json.dump([{"operator": "synthetic", "url": f"http://localhost:{args.port}/free_bike_status.json",
+                        "bikes_path": ["data", "bikes"]}], file, indent=2)
+    try:
+        asyncio.run(run(SyntheticFleet(args.size, args.trip_rate, args.relocation_rate), args.port, args.tick))
+    except KeyboardInterrupt:
+        logger.info("shutting down")
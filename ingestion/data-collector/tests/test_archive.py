@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Archive files: round trip, rotation, block timer, crash recovery and time ranges"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import archive
+import pytest
+from archive import ArchiveReader, ArchiveWriter, find_files
+
+HOUR = 1600002000 - 1600002000 % 3600
+
+
+def records(first, n, ts):
+    return [{"bike_id": f"bird-{i}", "event": "moved", "is_disabled": "false", "is_reserved": True,
+             "last_updated": ts, "lat": 38.9 + i * 1e-6, "lon": -77.03, "operator": "bird",
+             "vehicle_type": "scooter", "ignored": "x"} for i in range(first, first + n)]
+
+
+def read_all(root, start=None, end=None):
+    rows = []
+    for path in find_files(root, "bird", start, end):
+        reader = ArchiveReader(path)
+        rows.extend(reader.iter_records(start, end))
+        reader.close()
+    return rows
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [float(HOUR)]
+    monkeypatch.setattr(archive.time, "time", lambda: now[0])
+    return now
+
+
+def test_round_trip(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", block_rows=40)
+    writer.write(records(0, 100, HOUR), HOUR)
+    writer.close()
+    [path] = find_files(tmp_path, "bird")
+    reader = ArchiveReader(path)
+    assert reader.rows == 100
+    assert [b["rows"] for b in reader.footer["blocks"]] == [40, 40, 20]
+    rows = list(reader.iter_records())
+    assert rows[7] == {"bike_id": "bird-7", "event": "moved", "is_disabled": 0, "is_reserved": 1,
+                       "last_updated": HOUR, "lat": 38.9 + 7e-6, "lon": -77.03, "operator": "bird",
+                       "vehicle_type": "scooter"}
+    assert [r["bike_id"] for r in rows] == [f"bird-{i}" for i in range(100)]
+
+
+def test_a_new_hour_opens_a_new_partition(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird")
+    writer.write(records(0, 10, HOUR), HOUR)
+    writer.write(records(10, 10, HOUR + 3600), HOUR + 3600)
+    writer.close()
+    files = find_files(tmp_path, "bird")
+    assert [p.parent.name for p in files] == [f"{(HOUR // 3600) % 24:02d}", f"{(HOUR // 3600 + 1) % 24:02d}"]
+    assert len(read_all(tmp_path)) == 20
+    assert len(find_files(tmp_path, "bird", HOUR + 3600, HOUR + 7200)) == 1
+
+
+def test_size_rotation_follows_written_blocks(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", block_rows=50, max_bytes=1)
+    writer.write(records(0, 120, HOUR), HOUR)
+    writer.close()
+    # every written block fills a file past max_bytes and the next rows go to a new one
+    files = find_files(tmp_path, "bird")
+    assert [ArchiveReader(p).rows for p in files] == [50, 50, 20]
+    assert len(read_all(tmp_path)) == 120
+
+
+def test_age_rotation(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", max_age=600)
+    writer.write(records(0, 10, HOUR), HOUR)
+    clock[0] += 599
+    writer.write(records(10, 10, HOUR), HOUR)
+    clock[0] += 1
+    writer.write(records(20, 10, HOUR), HOUR)
+    writer.close()
+    assert [ArchiveReader(p).rows for p in find_files(tmp_path, "bird")] == [20, 10]
+
+
+def test_block_timer_writes_small_feeds(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", block_rows=50000, block_seconds=60)
+    writer.write(records(0, 10, HOUR), HOUR)
+    assert writer.buffered == 10
+    clock[0] += 30
+    writer.write(records(10, 10, HOUR), HOUR)
+    assert writer.buffered == 20
+    clock[0] += 30
+    writer.write(records(20, 10, HOUR), HOUR)
+    # the block opened 60 seconds ago is on disk without waiting for 50000 rows
+    assert writer.buffered == 0
+    assert [b["rows"] for b in writer.blocks] == [30]
+    writer.close()
+
+
+def test_file_of_a_crashed_writer_is_read_up_to_its_last_block(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", block_rows=10)
+    writer.write(records(0, 25, HOUR), HOUR)
+    # the process dies: no footer, and half of a block frame on disk
+    writer.file.write(archive.FRAME.pack(archive.BLOCK, 1000) + b"\x00" * 10)
+    writer.file.close()
+    [path] = find_files(tmp_path, "bird")
+    reader = ArchiveReader(path)
+    assert reader.footer is None and reader.rows is None
+    assert [r["bike_id"] for r in reader.iter_records()] == [f"bird-{i}" for i in range(20)]
+
+
+def test_time_range_skips_and_trims_blocks(tmp_path, clock):
+    writer = ArchiveWriter(tmp_path, "bird", block_rows=10)
+    for minute in range(6):
+        writer.write(records(minute * 10, 5, HOUR + minute * 60) + records(minute * 10 + 5, 5, HOUR + minute * 60 + 30),
+                     HOUR)
+    writer.close()
+    [path] = find_files(tmp_path, "bird")
+    reader = ArchiveReader(path)
+    assert [(b["min_ts"], b["max_ts"]) for b in reader.footer["blocks"]][:2] == [
+        (HOUR, HOUR + 30), (HOUR + 60, HOUR + 90)]
+    start, end = HOUR + 90, HOUR + 240
+    batches = list(reader.iter_batches(start, end))
+    # the blocks of minutes 0 and 4 to 5 are not read, minute 1 is trimmed to its last 5 rows
+    assert [len(b["bike_id"]) for b in batches] == [5, 10, 10]
+    assert all(start <= t < end for b in batches for t in b["last_updated"])
+    assert len(read_all(tmp_path, start, end)) == 25
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Collector against a local stub GBFS server"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import asyncio
+import json
+import aiohttp
+from aiohttp import web
+from gbfs_collector import fetch_feed, poll_feed, write_snapshot
+from poll_scheduler import FeedSchedule
+
+BIKES = [{"bike_id": "b1", "lat": 38.9, "lon": -77.03, "is_reserved": 0, "is_disabled": 0},
+         {"bike_id": "b2", "lat": 38.91, "lon": -77.04, "is_reserved": 0, "is_disabled": 1}]
+FEED = json.dumps({"last_updated": 1600000000, "ttl": 10, "data": {"bikes": BIKES}})
+
+
+async def free_bike_status(request):
+    if request.headers.get("If-None-Match") == '"v1"':
+        return web.Response(status=304)
+    return web.Response(text=FEED, content_type="application/json", headers={"ETag": '"v1"'})
+
+
+async def unavailable(request):
+    return web.Response(status=503)
+
+
+async def slow(request):
+    await asyncio.sleep(1)
+    return web.Response(text=FEED)
+
+
+async def invalid(request):
+    return web.Response(text="{not json", content_type="application/json")
+
+
+async def other_layout(request):
+    return web.Response(text=json.dumps({"last_updated": 1600000000, "ttl": 10, "vehicles": BIKES}),
+                        content_type="application/json")
+
+
+def with_stub(test):
+    """
+    Runs test(session, base_url) against the stub server
+    """
+    async def run():
+        app = web.Application()
+        for path, handler in (("/ok", free_bike_status), ("/unavailable", unavailable), ("/slow", slow),
+                              ("/invalid", invalid), ("/layout", other_layout)):
+            app.router.add_get(path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "localhost", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.2)) as session:
+                return await test(session, f"http://localhost:{port}")
+        finally:
+            await runner.cleanup()
+    return asyncio.run(run())
+
+
+def feed(base, path):
+    return {"operator": "stub", "url": f"{base}{path}", "bikes_path": ["data", "bikes"]}
+
+
+def test_changed_feed_is_returned_and_304_is_skipped(tmp_path):
+    schedule = FeedSchedule()
+
+    async def test(session, base):
+        first = await fetch_feed(session, feed(base, "/ok"), schedule)
+        second = await fetch_feed(session, feed(base, "/ok"), schedule)
+        return first, second
+
+    first, second = with_stub(test)
+    assert first["data"]["bikes"] == BIKES and second is None
+    assert schedule.stats["polls"] == 2 and schedule.stats["not_modified"] == 1
+    write_snapshot("stub", first["data"]["bikes"], tmp_path)
+    lines = (tmp_path / "stub.txt").read_text().splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith("bike_id:b1, is_disabled:0, is_reserved:0, last_updated:")
+    assert lines[0].endswith(", lat:38.9, lon:-77.03, operator:stub")
+
+
+def failed_poll(path):
+    schedule = FeedSchedule()
+
+    async def test(session, base):
+        return await fetch_feed(session, feed(base, path), schedule)
+
+    assert with_stub(test) is None
+    return schedule
+
+
+def test_unexpected_status_backs_off():
+    schedule = failed_poll("/unavailable")
+    assert schedule.stats["errors"] == 1 and schedule.stats["polls"] == 1 and schedule.failures == 1
+
+
+def test_timeout_backs_off():
+    schedule = failed_poll("/slow")
+    assert schedule.stats["errors"] == 1 and schedule.stats["polls"] == 1
+
+
+def test_invalid_json_is_one_failed_poll():
+    schedule = failed_poll("/invalid")
+    assert schedule.stats["errors"] == 1 and schedule.stats["polls"] == 1
+
+
+async def poll_until(session, feed_entry, schedule, output_dir, done):
+    task = asyncio.ensure_future(poll_feed(session, feed_entry, schedule, output_dir))
+    for _ in range(100):
+        if done():
+            break
+        await asyncio.sleep(0.02)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_poll_feed_writes_every_vehicle(tmp_path):
+    schedule = FeedSchedule()
+    output = tmp_path / "stub.txt"
+
+    async def test(session, base):
+        await poll_until(session, feed(base, "/ok"), schedule, tmp_path, output.exists)
+
+    with_stub(test)
+    lines = output.read_text().splitlines()
+    assert [line.split(", ")[0] for line in lines] == ["bike_id:b1", "bike_id:b2"]
+    assert schedule.stats["changed"] == 1
+
+
+def test_unexpected_layout_writes_nothing(tmp_path):
+    schedule = FeedSchedule()
+
+    async def test(session, base):
+        await poll_until(session, feed(base, "/layout"), schedule, tmp_path, lambda: schedule.stats["errors"])
+
+    with_stub(test)
+    assert not (tmp_path / "stub.txt").exists()
+    assert schedule.stats["errors"] == 1 and schedule.stats["polls"] == 1
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Feed schedules: ttl and last_updated timing, skips and back-off"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import pytest
+from poll_scheduler import FeedSchedule
+
+
+def test_conditional_headers_follow_the_last_response():
+    schedule = FeedSchedule()
+    assert schedule.request_headers() == {}
+    schedule.on_response(b"{}", {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, now=0)
+    assert schedule.request_headers() == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    # a response without validators keeps the previous ones
+    schedule.on_response(b"[]", {}, now=1)
+    assert schedule.request_headers()["If-None-Match"] == '"v1"'
+
+
+def test_repeated_body_is_skipped():
+    schedule = FeedSchedule(default_interval=5)
+    assert schedule.on_response(b"body", {}, now=100)
+    assert not schedule.on_response(b"body", {}, now=110)
+    assert schedule.next_poll == 115
+    assert schedule.stats["unchanged"] == 1 and schedule.stats["polls"] == 2
+
+
+def test_next_poll_waits_for_last_updated_plus_ttl():
+    schedule = FeedSchedule(min_interval=1, max_interval=300)
+    assert schedule.on_payload({"last_updated": 1000, "ttl": 30}, now=1010)
+    assert schedule.next_poll == 1030
+    assert schedule.delay(now=1020) == 10
+    # a stale last_updated is polled again after min_interval, a far one is capped at max_interval
+    schedule.on_payload({"last_updated": 900, "ttl": 30}, now=1040)
+    assert schedule.next_poll == 1041
+    schedule.on_payload({"last_updated": 5000, "ttl": 30}, now=1050)
+    assert schedule.next_poll == 1350
+
+
+def test_unchanged_last_updated_is_skipped():
+    schedule = FeedSchedule()
+    assert schedule.on_payload({"last_updated": 1000, "ttl": 10}, now=1000)
+    assert not schedule.on_payload({"last_updated": 1000, "ttl": 10}, now=1010)
+    assert schedule.next_poll == 1020
+    assert schedule.stats["changed"] == 1 and schedule.stats["unchanged"] == 1
+
+
+@pytest.mark.parametrize("payload, interval", [
+    ({"last_updated": 1000}, 7),
+    ({"last_updated": 1000, "ttl": 0}, 7),
+    ({"last_updated": 1000, "ttl": "60"}, 7),
+    ([], 7),
+])
+def test_feeds_without_a_usable_ttl_use_the_default_interval(payload, interval):
+    schedule = FeedSchedule(default_interval=interval)
+    schedule.on_payload(payload, now=1000)
+    assert schedule.next_poll == 1000 + interval
+
+
+def test_not_modified_resets_the_back_off():
+    schedule = FeedSchedule(default_interval=5)
+    schedule.on_error(now=0)
+    schedule.on_not_modified(now=10)
+    assert schedule.failures == 0 and schedule.next_poll == 15
+    assert schedule.stats["not_modified"] == 1
+
+
+def test_back_off_doubles_with_jitter_and_is_capped():
+    schedule = FeedSchedule(backoff_base=2, max_interval=300)
+    assert [schedule.on_error(now=0) for _ in range(9)] == [2, 4, 8, 16, 32, 64, 128, 256, 300]
+    assert 150 <= schedule.next_poll <= 300
+    # a feed down for good never overflows the exponent
+    schedule.failures = 100000
+    assert schedule.on_error(now=0) == 300
+
+
+def test_errors_after_a_counted_response_are_one_poll():
+    schedule = FeedSchedule()
+    schedule.on_response(b"not json", {}, now=0)
+    schedule.on_error(now=0, counted=True)
+    schedule.on_error(now=1)
+    assert schedule.stats["polls"] == 2 and schedule.stats["errors"] == 2
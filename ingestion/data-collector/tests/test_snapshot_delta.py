@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Snapshot diffs of delta mode"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+from gbfs_collector import format_record
+from snapshot_delta import APPEARED, DISAPPEARED, KEYFRAME, MOVED, STATUS, SnapshotDelta
+
+
+def bike(bike_id, lat=38.9, disabled=0, reserved=0, now=0):
+    return {"bike_id": bike_id, "lat": lat, "lon": -77.03, "is_disabled": disabled, "is_reserved": reserved,
+            "last_updated": now, "operator": "bird"}
+
+
+def kinds(events):
+    return [(e["bike_id"], e["event"]) for e in events]
+
+
+def test_first_snapshot_is_a_keyframe_without_changes():
+    delta = SnapshotDelta(keyframe_interval=300)
+    events = delta.diff([bike("a"), bike("b")], 0)
+    assert kinds(events) == [("a", KEYFRAME), ("b", KEYFRAME)]
+    assert delta.changes == []
+
+
+def test_changes_between_keyframes():
+    delta = SnapshotDelta(keyframe_interval=300)
+    delta.diff([bike("a"), bike("b"), bike("c"), bike("d")], 0)
+    events = delta.diff([bike("a", now=10), bike("b", lat=38.91, now=10), bike("c", reserved=1, now=10),
+                         bike("e", now=10)], 10)
+    assert kinds(events) == [("b", MOVED), ("c", STATUS), ("e", APPEARED), ("d", DISAPPEARED)]
+    assert delta.changes == events
+    # a vehicle that left repeats its last attributes, stamped with the snapshot time
+    assert events[-1] == dict(bike("d"), event=DISAPPEARED, last_updated=10)
+    # the inputs are not tagged in place
+    assert "event" not in delta.previous["a"][1]
+
+
+def test_keyframes_write_the_fleet_and_keep_the_changes():
+    delta = SnapshotDelta(keyframe_interval=300)
+    delta.diff([bike("a"), bike("b")], 0)
+    delta.diff([bike("a"), bike("b")], 100)
+    events = delta.diff([bike("a", lat=38.95), bike("c")], 300)
+    assert kinds(events) == [("a", KEYFRAME), ("c", KEYFRAME), ("b", DISAPPEARED)]
+    assert kinds(delta.changes) == [("a", MOVED), ("c", APPEARED), ("b", DISAPPEARED)]
+    assert kinds(delta.diff([bike("a", lat=38.95), bike("c")], 310)) == []
+
+
+def test_event_column_is_written_with_the_record():
+    delta = SnapshotDelta()
+    delta.diff([bike("a")], 0)
+    [line] = [format_record(d) for d in delta.diff([], 10)]
+    assert "event:disappeared" in line and "last_updated:10" in line
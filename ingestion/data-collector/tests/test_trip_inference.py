@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Trip inference against the synthetic fleet and hand-made snapshots"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import json
+import pytest
+from snapshot_delta import SnapshotDelta
+from synthetic_feed import SyntheticFleet
+from trip_inference import (RELOCATION, RETURNED, TRIP_END, TRIP_START, UNKNOWN_ORIGIN, KafkaTripSink,
+                            TripInference)
+
+TICK = 10
+
+
+def snapshot(payload):
+    return [dict(d, last_updated=payload["last_updated"], operator="synthetic") for d in payload["data"]["bikes"]]
+
+
+def run_fleet(delta_mode, ticks=360):
+    fleet = SyntheticFleet(size=500, trip_rate=0.01, relocation_rate=0.002, seed=3)
+    events = []
+    trips = TripInference("synthetic", events.extend)
+    delta = SnapshotDelta(keyframe_interval=300) if delta_mode else None
+    for i in range(ticks):
+        now = 1600000000 + i * TICK
+        if i:
+            fleet.tick(now)
+        bikes = snapshot(fleet.payload(now, TICK))
+        if delta is not None:
+            previous = delta.previous
+            delta.diff(bikes, now)
+            trips.infer(delta.changes, previous, now)
+        else:
+            trips.update(bikes, now)
+    return fleet, events, trips
+
+
+@pytest.mark.parametrize("delta_mode", [False, True])
+def test_synthetic_fleet_trips_are_inferred(delta_mode):
+    fleet, events, trips = run_fleet(delta_mode)
+    kinds = [e["event"] for e in events]
+    # a vehicle that ends a ride and starts the next in the same tick never shows up in between,
+    # its two rides are inferred as one
+    assert 0.97 * fleet.counts["trip_start"] <= kinds.count(TRIP_START) <= fleet.counts["trip_start"]
+    assert 0.97 * fleet.counts["trip_end"] <= kinds.count(TRIP_END) <= fleet.counts["trip_end"]
+    # a relocation that lands within min_distance of its spot goes unnoticed
+    assert 0.9 * fleet.counts["relocation"] <= kinds.count(RELOCATION) <= fleet.counts["relocation"]
+    assert kinds.count(UNKNOWN_ORIGIN) == 0
+    assert trips.stats[TRIP_START] == kinds.count(TRIP_START)
+    for e in events:
+        if e["event"] == TRIP_END:
+            assert 0 < e["duration"] <= 7200 and e["distance"] >= 100
+
+
+def test_delta_and_full_snapshots_infer_the_same_events():
+    assert run_fleet(False)[1] == run_fleet(True)[1]
+
+
+def bike(bike_id, lat, lon, now):
+    return {"bike_id": bike_id, "lat": lat, "lon": lon, "is_disabled": 0, "is_reserved": 0, "last_updated": now}
+
+
+def test_returned_and_unknown_origin():
+    events = []
+    trips = TripInference("bird", events.extend)
+    trips.update([bike("a", 38.9, -77.0, 0)], 0)
+    trips.update([], 60)
+    trips.update([bike("a", 38.9001, -77.0, 600), bike("new", 38.95, -77.1, 600)], 600)
+    assert [(e["event"], e["bike_id"]) for e in events] == [
+        (TRIP_START, "a"), (RETURNED, "a"), (UNKNOWN_ORIGIN, "new")]
+    unknown = events[-1]
+    assert unknown["origin_lat"] is None and unknown["destination_geo"] is not None
+    assert "duration" not in unknown
+
+
+def test_long_or_fast_gaps_are_relocations():
+    events = []
+    trips = TripInference("bird", events.extend)
+    trips.update([bike("slow", 38.9, -77.0, 0), bike("fast", 38.9, -77.0, 0)], 0)
+    trips.update([], 60)
+    # 1.1 km in 3 hours, then 11 km in 10 minutes
+    trips.update([bike("slow", 38.91, -77.0, 10860)], 10860)
+    trips.update([bike("slow", 38.91, -77.0, 10860), bike("fast", 39.0, -77.0, 600)], 10920)
+    assert [(e["event"], e["bike_id"]) for e in events] == [
+        (TRIP_START, "slow"), (TRIP_START, "fast"), (RELOCATION, "slow"), (RELOCATION, "fast")]
+
+
+class FullProducer(object):
+
+    def __init__(self, room):
+        self.room = room
+        self.produced = []
+        self.polls = 0
+
+    def produce(self, topic, key=None, value=None):
+        if len(self.produced) >= self.room:
+            raise BufferError("Local: Queue full")
+        self.produced.append((topic, key, json.loads(value)))
+
+    def poll(self, timeout=0):
+        self.polls += 1
+
+    def flush(self, timeout=None):
+        return 0
+
+
+def test_kafka_sink_drops_events_when_the_queue_stays_full():
+    sink = KafkaTripSink("localhost:1", max_wait=0.05)
+    sink.producer = FullProducer(room=2)
+    sink([{"event": TRIP_START, "operator": "bird", "bike_id": str(i)} for i in range(4)])
+    assert [key for _, key, _ in sink.producer.produced] == ["bird:0", "bird:1"]
+    assert sink.dropped == 2
+    # the full queue was polled for delivery reports while waiting
+    assert sink.producer.polls > 2
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Trip inference
+
+Turns the change events of consecutive snapshots (snapshot_delta.py) into
+trip and rebalancing events. A vehicle that leaves the feed starts a trip;
+when it comes back the gap is classified from its duration, distance and
+speed as the end of a trip, a relocation by the operator or a return to the
+same spot. A vehicle that appears without having left the feed before has
+no known origin and is reported as unknown_origin. Vehicles moved while
+listed are relocations as well.
+event types: trip_start, trip_end, relocation, returned, unknown_origin
+"""
+__author__ = 'Ali Rahim-Taleqani'
+__copyright__ = 'Copyright 2020, The Insight Data Engineering'
+__credits__ = [""]
+__version__ = '0.1'
+__maintainer__ = 'Ali Rahim-Taleqani'
+__email__ = 'ali.rahim.taleani@gmail.com'
+__status__ = 'Development'
+
+import json
+import logging
+import math
+import time
+import geohash
+from snapshot_delta import APPEARED, DISAPPEARED, MOVED, SnapshotDelta
+
+TRIP_START = "trip_start"
+TRIP_END = "trip_end"
+RELOCATION = "relocation"
+RETURNED = "returned"
+UNKNOWN_ORIGIN = "unknown_origin"
+
+logger = logging.getLogger(__name__)
+
+TRIPS_TOPIC = "com.insight.project.trips"
+EARTH_RADIUS_M = 6371000
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """
+    Returns the haversine distance between two locations in meters
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class TripInference(object):
+    """
+    Infers trips and relocations of one operator's fleet
+    Args:
+        operator (str): the operator name
+        sink (callable): called with the list of events inferred from each snapshot
+        precision (int): geohash precision of origins and destinations
+        min_distance (float): meters below which a vehicle is considered in the same spot
+        max_duration (float): seconds above which a gap is a relocation rather than a trip
+        max_speed (float): meters per second above which a gap is a relocation rather than a trip
+        pending_ttl (float): seconds after which a vehicle that never came back is forgotten
+    """
+
+    def __init__(self, operator, sink, precision=7, min_distance=100, max_duration=7200, max_speed=12,
+                 pending_ttl=86400):
+        self.operator = operator
+        self.sink = sink
+        self.precision = precision
+        self.min_distance = min_distance
+        self.max_duration = max_duration
+        self.max_speed = max_speed
+        self.pending_ttl = pending_ttl
+        # only created by update(), the delta-mode collector passes the changes of its own diff to infer()
+        self.delta = None
+        self.pending = {}
+        self.stats = {TRIP_START: 0, TRIP_END: 0, RELOCATION: 0, RETURNED: 0, UNKNOWN_ORIGIN: 0, "expired": 0}
+
+    def update(self, bikes, now):
+        """
+        Diffs a snapshot against the previous one and sends the inferred events to the sink
+        Args:
+            bikes (list): vehicles of the new snapshot, each with a bike_id, lat and lon
+            now (int): epoch time of the snapshot
+        """
+        if self.delta is None:
+            # keyframes only once, every later snapshot yields change events
+            self.delta = SnapshotDelta(keyframe_interval=float('inf'))
+        # diff() replaces the previous snapshot, keep it to look up where moved vehicles were
+        previous = self.delta.previous
+        self.delta.diff(bikes, now)
+        return self.infer(self.delta.changes, previous, now)
+
+    def infer(self, changes, previous, now):
+        """
+        Sends the events inferred from the change events of a snapshot to the sink
+        Args:
+            changes (list): SnapshotDelta.changes of the snapshot
+            previous (dict): SnapshotDelta.previous before the snapshot was diffed
+            now (int): epoch time of the snapshot
+        """
+        events = []
+        for change in changes:
+            kind = change['event']
+            if kind == DISAPPEARED:
+                self.pending[change['bike_id']] = change
+                events.append(self._event(TRIP_START, change, None, now))
+            elif kind == APPEARED:
+                origin = self.pending.pop(change['bike_id'], None)
+                events.append(self._event(self._classify(origin, change, now), origin, change, now))
+            elif kind == MOVED:
+                origin = previous[change['bike_id']][1]
+                if self._distance(origin, change) >= self.min_distance:
+                    events.append(self._event(RELOCATION, origin, change, now))
+        self._expire(now)
+        for event in events:
+            self.stats[event['event']] += 1
+        if events:
+            self.sink(events)
+        return events
+
+    def _classify(self, origin, destination, now):
+        if origin is None:
+            # never seen leaving: a deployment, or a vehicle whose departure predates a restart
+            return UNKNOWN_ORIGIN
+        distance = self._distance(origin, destination)
+        duration = now - origin['last_updated']
+        if distance < self.min_distance:
+            return RETURNED
+        if duration > self.max_duration or distance > self.max_speed * max(duration, 1):
+            return RELOCATION
+        return TRIP_END
+
+    @staticmethod
+    def _distance(origin, destination):
+        return distance_m(float(origin['lat']), float(origin['lon']),
+                          float(destination['lat']), float(destination['lon']))
+
+    def _location(self, prefix, d):
+        if d is None:
+            return {f"{prefix}_lat": None, f"{prefix}_lon": None, f"{prefix}_geo": None, f"{prefix}_time": None}
+        lat, lon = float(d['lat']), float(d['lon'])
+        return {f"{prefix}_lat": lat, f"{prefix}_lon": lon,
+                f"{prefix}_geo": geohash.encode(lat, lon, self.precision), f"{prefix}_time": d['last_updated']}
+
+    def _event(self, kind, origin, destination, now):
+        event = {"event": kind, "operator": self.operator,
+                 "bike_id": (origin or destination)['bike_id'], "timestamp": now}
+        event.update(self._location("origin", origin))
+        event.update(self._location("destination", destination))
+        if origin is not None and destination is not None:
+            event["duration"] = now - origin['last_updated']
+            event["distance"] = round(self._distance(origin, destination))
+        return event
+
+    def _expire(self, now):
+        # pending vehicles are inserted in disappearance order, the oldest come first
+        horizon = now - self.pending_ttl
+        while self.pending:
+            bike_id, d = next(iter(self.pending.items()))
+            if d['last_updated'] >= horizon:
+                break
+            del self.pending[bike_id]
+            self.stats["expired"] += 1
+
+
+class TextTripSink(object):
+    """
+    Appends trip events to {operator}.trips.txt, e.g. to test against a local feed
+    Args:
+        output_dir (str): directory of the output files
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def __call__(self, events):
+        with open(f"{self.output_dir}/{events[0]['operator']}.trips.txt", 'a') as file:
+            for event in events:
+                file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        pass
+
+
+class KafkaTripSink(object):
+    """
+    Produces trip events as JSON to the trips topic, keyed by operator and bike_id
+    Args:
+        bootstrap_servers (str): Kafka broker(s)
+        topic (str): the trips topic
+        max_wait (float): seconds to wait for room in a full producer queue before an event is dropped
+    """
+
+    def __init__(self, bootstrap_servers, topic=TRIPS_TOPIC, max_wait=1.0):
+        # the collector only needs Kafka when trips are produced
+        from confluent_kafka import Producer
+        self.topic = topic
+        self.max_wait = max_wait
+        self.dropped = 0
+        self.producer = Producer({"bootstrap.servers": bootstrap_servers, "client.id": "project.insight.trips",
+                                  "linger.ms": 100, "compression.type": "lz4"})
+
+    def __call__(self, events):
+        for event in events:
+            key, value = f"{event['operator']}:{event['bike_id']}", json.dumps(event)
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                try:
+                    self.producer.produce(self.topic, key=key, value=value)
+                    break
+                except BufferError:
+                    # the queue is full: serve delivery reports, but never stall the collector for long
+                    if time.monotonic() >= deadline:
+                        self.dropped += 1
+                        logger.error(f"producer queue full, dropped trip event of {key} ({self.dropped} so far)")
+                        break
+                    self.producer.poll(0.1)
+        self.producer.poll(0)
+
+    def close(self):
+        self.producer.flush()